@@ -0,0 +1,102 @@
+# benchmarks/bench_clean_contacts.py
+"""
+Compares the row-wise apply implementation of clean_contacts with the vectorized one.
+
+Usage:
+    python benchmarks/bench_clean_contacts.py [--sizes 10000 1000000 10000000] [--legacy-max-rows N]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import make_contacts  # noqa: E402
+from src.clean_data import clean_contacts  # noqa: E402
+
+
+def legacy_clean_contacts(df):
+    """
+    The original row-wise implementation of clean_contacts, kept as the benchmark baseline.
+    """
+    for col in ['ts_booking_at', 'ts_reply_at_first', 'ts_interaction_first', 'ts_accepted_at_first']:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+
+    df['booking_happened'] = df['ts_booking_at'].notna()
+
+    def compute_timedelta(row, later_col, earlier_col):
+        if pd.isna(row[later_col]) or pd.isna(row[earlier_col]):
+            return pd.NaT
+        else:
+            return row[later_col] - row[earlier_col]
+
+    df['response_time'] = df.apply(
+        lambda row: compute_timedelta(row, 'ts_reply_at_first', 'ts_interaction_first'), axis=1)
+    df['accept_time'] = df.apply(
+        lambda row: compute_timedelta(row, 'ts_accepted_at_first', 'ts_interaction_first'), axis=1)
+
+    def compute_hours(td):
+        return pd.NaT if pd.isna(td) else td.total_seconds() / 3600
+
+    df['response_time_hours'] = df['response_time'].apply(compute_hours)
+    df['accept_time_hours'] = df['accept_time'].apply(compute_hours)
+
+    def determine_stage(row):
+        if pd.notna(row['ts_booking_at']):
+            return 'booked'
+        elif pd.notna(row['ts_accepted_at_first']):
+            return 'accepted'
+        elif pd.notna(row['ts_reply_at_first']):
+            return 'replied'
+        else:
+            return 'no_reply'
+
+    df['funnel_stage'] = df.apply(determine_stage, axis=1)
+    return df
+
+
+def assert_same_output(legacy, vectorized):
+    """
+    Checks that both implementations agree. The legacy hours columns are object dtype holding
+    NaT for missing values, so they are compared as floats.
+    """
+    for col in ['booking_happened', 'funnel_stage']:
+        assert (legacy[col].astype(object) == vectorized[col].astype(object)).all(), col
+    for col in ['response_time', 'accept_time']:
+        pd.testing.assert_series_equal(pd.to_timedelta(legacy[col]), vectorized[col], check_names=False)
+    for col in ['response_time_hours', 'accept_time_hours']:
+        old = pd.to_numeric(legacy[col].where(legacy[col].notna(), np.nan)).to_numpy(dtype=float)
+        np.testing.assert_array_equal(old, vectorized[col].to_numpy(dtype=float))
+
+
+def time_call(func, df):
+    start = time.perf_counter()
+    result = func(df.copy())
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=None,
+                        help='Skip the legacy path above this many rows (it takes minutes at 10M).')
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>12} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>9}")
+    for n_rows in args.sizes:
+        df = make_contacts(n_rows)
+        new_time, new_result = time_call(clean_contacts, df)
+        if args.legacy_max_rows is not None and n_rows > args.legacy_max_rows:
+            print(f'{n_rows:>12,} {"skipped":>12} {new_time:>15.3f} {"-":>9}')
+            continue
+        old_time, old_result = time_call(legacy_clean_contacts, df)
+        assert_same_output(old_result, new_result)
+        print(f'{n_rows:>12,} {old_time:>12.3f} {new_time:>15.3f} {old_time / new_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_clean_memory.py
+"""
+Peak memory of clean_contacts per stage: the default mode, lean=True, and cleaning in place
+with copy=False.
+
+Stage peaks are tracemalloc's, measured from the start of the stage. tracemalloc only sees
+allocations made through Python's allocator, so it misses the Arrow buffers behind pandas'
+string columns; each run therefore also reports the deep memory of the input and of the
+cleaned frame, and how far an untraced run raises the peak RSS above the RSS holding the
+input. The peak is reset through /proc/self/clear_refs, so that column needs Linux.
+
+Usage:
+    python benchmarks/bench_clean_memory.py [--sizes 100000 1000000]
+"""
+import argparse
+import os
+import re
+import sys
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import make_contacts  # noqa: E402
+from src.clean_data import clean_contacts  # noqa: E402
+from src.profiling import tracing  # noqa: E402
+
+MODES = {
+    'default': {},
+    'lean': {'lean': True},
+    'in-place': {'copy': False},
+    'lean, in-place': {'lean': True, 'copy': False},
+}
+
+
+def _deep_mb(df):
+    return df.memory_usage(deep=True).sum() / (1 << 20)
+
+
+def stage_peaks(raw, **options):
+    """
+    Allocation peak of each clean_contacts stage, in MiB, and the cleaned frame's memory.
+    """
+    with tracing() as trace:
+        clean_contacts(raw, **options)
+    records = {record['stage']: record for record in trace.records}
+    peaks = {stage.split('.', 1)[-1]: record['alloc_peak_mb'] for stage, record in records.items()}
+    return peaks, records['clean_data.clean_contacts']['frame_mb']
+
+
+def _rss_mb(field):
+    """
+    VmRSS (current) or VmHWM (peak) of this process, in MiB, or None off Linux.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            match = re.search(rf'^{field}:\s+(\d+) kB', status.read(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) / 1024 if match else None
+
+
+def rss_growth(raw, **options):
+    """
+    Deep memory of the cleaned frame, in MiB, and how far cleaning raised the peak RSS above
+    the RSS before it (None where the peak cannot be reset).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return _deep_mb(clean_contacts(raw, **options)), None
+    before = _rss_mb('VmRSS')
+    cleaned = clean_contacts(raw, **options)
+    after = _rss_mb('VmHWM')
+    return _deep_mb(cleaned), None if before is None or after is None else after - before
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    stages = ['parse_dates', 'durations', 'funnel_stage', 'clean_contacts']
+    columns = ['input (MiB)', 'frame (MiB)', 'RSS +MiB']
+    print(f"{'rows':>10} {'mode':<14} " + ' '.join(f'{stage:>14}' for stage in stages)
+          + ''.join(f' {column:>12}' for column in columns))
+    # The first call pays one-off allocations (imports, caches) that would land on the first mode
+    clean_contacts(make_contacts(1_000))
+    for n_rows in args.sizes:
+        for mode, options in MODES.items():
+            raw = make_contacts(n_rows)
+            input_mb = _deep_mb(raw)
+            # copy=False cleans raw in place, so each measurement gets its own input
+            frame_mb, growth = rss_growth(raw.copy(), **options)
+            peaks, _ = stage_peaks(raw, **options)
+            del raw
+            growth = 'n/a' if growth is None else f'{growth:.1f}'
+            print(f'{n_rows:>10,} {mode:<14} ' + ' '.join(f'{peaks[stage]:>14.1f}' for stage in stages)
+                  + f' {input_mb:>12.1f} {frame_mb:>12.1f} {growth:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# benchmarks/bench_parallel.py
+"""
+Scaling benchmark of the process-pool pipeline: clean + aggregate on 1..N workers against the
+serial path.
+
+Usage:
+    python benchmarks/bench_parallel.py [--rows 5000000] [--max-workers N] [--partition-by listing]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import make_contacts  # noqa: E402
+from src.aggregates import ContactAggregates  # noqa: E402
+from src.clean_data import clean_contacts  # noqa: E402
+from src.parallel import parallel_contact_aggregates  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--partition-by', choices=['listing', 'month'], default='listing')
+    args = parser.parse_args(argv)
+
+    raw = make_contacts(args.rows)
+
+    start = time.perf_counter()
+    serial = ContactAggregates.from_frame(clean_contacts(raw.copy()))
+    serial_time = time.perf_counter() - start
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>9}")
+    print(f"{'serial':>8} {serial_time:>9.2f} {1:>8.1f}x")
+
+    workers = 1
+    while workers <= args.max_workers:
+        start = time.perf_counter()
+        result = parallel_contact_aggregates(raw, workers=workers, partition_by=args.partition_by)
+        elapsed = time.perf_counter() - start
+        assert result.totals['booked'] == serial.totals['booked']
+        assert result.tally('contact_channel_first').equals(serial.tally('contact_channel_first'))
+        print(f'{workers:>8} {elapsed:>9.2f} {serial_time / elapsed:>8.1f}x')
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_recommendations.py
+"""
+Times recommendations for every neighborhood: filtering the fact table and recomputing the
+metric and funnel inputs of generate_recommendations once per neighborhood, against one
+RecommendationEngine pass over all of them. Both produce the same recommendations.
+
+Usage:
+    python benchmarks/bench_recommendations.py [--sizes 100000 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import DATA_DIR, make_contacts  # noqa: E402
+from src.clean_data import clean_contacts, clean_listings  # noqa: E402
+from src.enrich import build_fact_table  # noqa: E402
+from src.funnel_analysis import funnel_by_room_type  # noqa: E402
+from src.load_data import load_listings  # noqa: E402
+from src.metrics import (  # noqa: E402
+    avg_response_time, booking_rate, conversion_by_contact_channel, conversion_by_user_stage,
+)
+from src.recommendations import RecommendationEngine, generate_recommendations  # noqa: E402
+
+SEGMENT = 'listing_neighborhood'
+
+
+def per_segment_loop(fact, min_inquiries):
+    recommendations = []
+    for segment, rows in fact.groupby(SEGMENT, observed=True):
+        if len(rows) < min_inquiries:
+            continue
+        summary = {'booking_rate': booking_rate(rows), 'avg_response_time': avg_response_time(rows)}
+        for item in generate_recommendations(summary, conversion_by_contact_channel(rows),
+                                             funnel_by_room_type(rows), conversion_by_user_stage(rows)):
+            recommendations.append((segment, item['insight']))
+    return recommendations
+
+
+def batched(fact, min_inquiries):
+    engine = RecommendationEngine(fact, segment_by=SEGMENT, min_inquiries=min_inquiries)
+    return [(item['segment'], item['insight']) for item in engine.recommend()]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--min-inquiries', type=int, default=50)
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    listings = clean_listings(load_listings(os.path.join(DATA_DIR, 'listings.csv')))
+    print(f"{'rows':>12} {'segments':>9} {'per segment (s)':>16} {'engine (s)':>11} {'speedup':>9}")
+    for n_rows in args.sizes:
+        contacts = clean_contacts(make_contacts(n_rows, listing_ids=listings['id_listing_anon']), copy=False)
+        fact = build_fact_table(contacts, listings)
+        expected, before = timed(per_segment_loop, fact, args.min_inquiries)
+        result, after = timed(batched, fact, args.min_inquiries)
+        assert sorted(result) == sorted(expected)
+        segments = (fact[SEGMENT].value_counts() >= args.min_inquiries).sum()
+        print(f'{n_rows:>12,} {segments:>9} {before:>16.3f} {after:>11.3f} {before / after:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_reports.py
+"""
+Times full report generation with per-call listings merges against a fact table built once.
+
+Usage:
+    python benchmarks/bench_reports.py [--sizes 100000 1000000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import make_contacts  # noqa: E402
+from src.clean_data import clean_contacts, clean_listings, clean_users  # noqa: E402
+from src.enrich import build_fact_table  # noqa: E402
+from src.funnel_analysis import funnel_by_neighborhood, funnel_by_room_type  # noqa: E402
+from src.load_data import load_listings, load_users  # noqa: E402
+from src.plots import plot_booking_rate_by_room_type  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def report_with_merges(contacts, listings, users):
+    funnel_by_room_type(contacts, listings)
+    funnel_by_neighborhood(contacts, listings)
+    plot_booking_rate_by_room_type(contacts, listings)
+    plt.close('all')
+
+
+def report_with_fact_table(contacts, listings, users):
+    fact = build_fact_table(contacts, listings, users)
+    funnel_by_room_type(fact)
+    funnel_by_neighborhood(fact)
+    plot_booking_rate_by_room_type(fact)
+    plt.close('all')
+
+
+def best_of(func, repeat, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    listings = clean_listings(load_listings(os.path.join(DATA_DIR, 'listings.csv')))
+    users = clean_users(load_users(os.path.join(DATA_DIR, 'users.csv')))
+
+    print(f"{'rows':>12} {'merges (s)':>12} {'fact table (s)':>15} {'speedup':>9}")
+    for n_rows in args.sizes:
+        contacts = clean_contacts(make_contacts(n_rows, listing_ids=listings['id_listing_anon'],
+                                                guest_ids=users['id_user_anon']))
+        before = best_of(report_with_merges, args.repeat, contacts, listings, users)
+        after = best_of(report_with_fact_table, args.repeat, contacts, listings, users)
+        print(f'{n_rows:>12,} {before:>12.3f} {after:>15.3f} {before / after:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_segmentation.py
+"""
+Times a segment report end to end on synthetic data: guest and listing features, mini-batch
+k-means fits and predictions, and conversion by guest and listing segment.
+
+Usage:
+    python benchmarks/bench_segmentation.py [--sizes 100000 1000000] [--segments 8]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import (  # noqa: E402
+    LISTINGS_PER_INQUIRY, USERS_PER_INQUIRY, make_contacts, make_listings, make_users,
+)
+from src.clean_data import clean_contacts, clean_listings, clean_users  # noqa: E402
+from src.funnel_analysis import funnel_by_segment  # noqa: E402
+from src.segmentation import Segmentation, assign_segments, guest_features, listing_features  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--segments', type=int, default=8)
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    steps = ['features', 'fit', 'predict', 'report']
+    print(f"{'rows':>12} {'guests':>10} {'listings':>10} " + ' '.join(f'{step + " (s)":>12}' for step in steps))
+    for n_rows in args.sizes:
+        n_listings = max(int(n_rows * LISTINGS_PER_INQUIRY), 1)
+        n_users = max(int(n_rows * USERS_PER_INQUIRY), 1)
+        contacts = clean_contacts(make_contacts(n_rows), copy=False)
+        listings = clean_listings(make_listings(n_listings), copy=False)
+        users = clean_users(make_users(n_users), copy=False)
+        timings = dict.fromkeys(steps, 0.0)
+
+        def timed(step, func, *call_args):
+            start = time.perf_counter()
+            result = func(*call_args)
+            timings[step] += time.perf_counter() - start
+            return result
+
+        guests = timed('features', guest_features, contacts, users)
+        places = timed('features', listing_features, contacts, listings)
+        guest_model = timed('fit', Segmentation(args.segments).fit, guests)
+        listing_model = timed('fit', Segmentation(args.segments).fit, places)
+        guest_segments = timed('predict', guest_model.predict, guests)
+        listing_segments = timed('predict', listing_model.predict, places)
+        segmented = timed('report', assign_segments, contacts, guest_segments, listing_segments)
+        timed('report', funnel_by_segment, segmented, 'guest_segment')
+        timed('report', funnel_by_segment, segmented, 'listing_segment')
+        print(f'{n_rows:>12,} {len(guests):>10,} {len(places):>10,} '
+              + ' '.join(f'{timings[step]:>12.2f}' for step in steps))
+
+
+if __name__ == '__main__':
+    main()
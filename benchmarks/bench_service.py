@@ -0,0 +1,129 @@
+# benchmarks/bench_service.py
+"""
+Load test of the query service (src/service.py): starts it on synthetic data in this process,
+then sends a dashboard-like mix of queries from concurrent keep-alive clients and reports
+throughput and p50/p99 latency with the result cache disabled, starting empty ('cold') and
+then full ('warm', the same mix sent again).
+
+The mix draws from every query crossed with channel, room type, neighborhood and quarter
+filters; a few popular combinations get most of the traffic (Zipf-distributed), as
+dashboards refreshing the same panels do.
+
+Usage:
+    python benchmarks/bench_service.py [--rows 200000] [--requests 2000] [--concurrency 8]
+"""
+import argparse
+import http.client
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from urllib.parse import urlencode
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import write_dataset  # noqa: E402
+from src.service import QUERIES, QueryService, ResultCache, make_server  # noqa: E402
+
+QUARTERS = [None, ('2016-01-01', '2016-04-01'), ('2016-04-01', '2016-07-01'),
+            ('2016-07-01', '2016-10-01'), ('2016-10-01', '2017-01-01')]
+
+
+def query_paths(service, n_paths, seed=0):
+    """
+    `n_paths` distinct request paths, in random order, over every query and filter combination.
+    """
+    fact = service.fact
+    channels = [None] + sorted(fact['contact_channel_first'].dropna().unique())
+    room_types = [None] + sorted(fact['room_type'].dropna().unique())
+    neighborhoods = [None] + list(fact['listing_neighborhood'].value_counts().index[:10])
+    paths = []
+    for name, channel, room_type, neighborhood, quarter in itertools.product(
+            QUERIES, channels, room_types, neighborhoods, QUARTERS):
+        params = {'channel': channel, 'room_type': room_type, 'neighborhood': neighborhood}
+        params = {key: value for key, value in params.items() if value is not None}
+        if quarter:
+            params['start'], params['end'] = quarter
+        paths.append(f'/{name}?{urlencode(params)}' if params else f'/{name}')
+    rng = np.random.default_rng(seed)
+    return [paths[i] for i in rng.permutation(len(paths))[:n_paths]]
+
+
+def load_test(port, paths, n_requests, concurrency, seed=0):
+    """
+    Sends `n_requests` requests drawn Zipf-like from `paths` over `concurrency` connections.
+
+    Returns:
+        tuple: (latencies in seconds, wall-clock seconds, number of non-200 responses).
+    """
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.2, n_requests), len(paths)) - 1
+    plan = [paths[i] for i in ranks]
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client(share):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        timings, failed = [], 0
+        for path in share:
+            start = time.perf_counter()
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            timings.append(time.perf_counter() - start)
+            failed += response.status != 200
+        connection.close()
+        with lock:
+            latencies.extend(timings)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(plan[i::concurrency],)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), time.perf_counter() - start, errors[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--requests', type=int, default=2_000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--paths', type=int, default=500, help='Distinct queries in the mix.')
+    parser.add_argument('--cache-size', type=int, default=1024)
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_dataset(data_dir, args.rows)
+        service = QueryService.from_files(data_dir)
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        paths = query_paths(service, args.paths)
+
+        print(f'{args.rows:,} inquiries, {len(paths)} distinct queries, '
+              f'{args.requests:,} requests over {args.concurrency} connections')
+        print(f"{'cache':>6} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9} {'hit rate':>9} {'errors':>7}")
+        cache = ResultCache(args.cache_size)
+        for phase, phase_cache in (('off', ResultCache(0)), ('cold', cache), ('warm', cache)):
+            service.cache = phase_cache
+            hits, misses = phase_cache.hits, phase_cache.misses
+            latencies, seconds, errors = load_test(port, paths, args.requests, args.concurrency)
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+            hit_rate = (phase_cache.hits - hits) / max(phase_cache.hits + phase_cache.misses - hits - misses, 1)
+            print(f'{phase:>6} {len(latencies) / seconds:>9.1f} {p50:>9.2f} {p99:>9.2f} '
+                  f'{latencies.max() * 1e3:>9.2f} {hit_rate:>9.1%} {errors:>7}')
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_significance.py
+"""
+Times bootstrap intervals of the booking rate of every neighborhood: resampling each
+neighborhood's rows, against significance.bootstrap_interval's binomial draws over the
+pre-aggregated counts, single-threaded and on the thread pool. Also reports how far the
+bootstrap bounds are from the Wilson bounds.
+
+Usage:
+    python benchmarks/bench_significance.py [--rows 1000000] [--resamples 1000 5000 20000]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import DATA_DIR, make_contacts  # noqa: E402
+from src.clean_data import clean_contacts, clean_listings  # noqa: E402
+from src.enrich import build_fact_table  # noqa: E402
+from src.funnel_analysis import conversion_intervals  # noqa: E402
+from src.load_data import load_listings  # noqa: E402
+from src.significance import bootstrap_interval  # noqa: E402
+
+SEGMENT = 'listing_neighborhood'
+
+# Resamples of the row-level reference, which is too slow to run at the full count
+ROW_RESAMPLES = 100
+
+
+def row_bootstrap(fact, resamples, confidence=0.95, seed=0):
+    """
+    Reference bootstrap: resamples the 0/1 booking outcomes of each neighborhood's rows.
+    """
+    rng = np.random.default_rng(seed)
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+    bounds = {}
+    for segment, booked in fact.groupby(SEGMENT, observed=True)['booking_happened']:
+        outcomes = booked.to_numpy(dtype=float)
+        rates = [rng.choice(outcomes, len(outcomes)).mean() for _ in range(resamples)]
+        bounds[segment] = np.quantile(rates, quantiles)
+    return bounds
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--resamples', type=int, nargs='+', default=[1_000, 5_000, 20_000])
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    listings = clean_listings(load_listings(os.path.join(DATA_DIR, 'listings.csv')))
+    contacts = clean_contacts(make_contacts(args.rows, listing_ids=listings['id_listing_anon']), copy=False)
+    fact = build_fact_table(contacts, listings)
+    counts = fact.groupby(SEGMENT, observed=True)['booking_happened'].agg(['sum', 'count'])
+    wilson = conversion_intervals(fact, SEGMENT).loc[counts.index]
+
+    _, row_seconds = timed(row_bootstrap, fact, ROW_RESAMPLES)
+    print(f'{args.rows:,} inquiries, {len(counts)} neighborhoods')
+    print(f'row resampling, {ROW_RESAMPLES} resamples: {row_seconds:.3f}s '
+          f'({row_seconds / ROW_RESAMPLES * 1e3:.2f} ms per resample)')
+    print(f"{'resamples':>10} {'1 thread (s)':>13} {'pool (s)':>9} {'vs rows':>9} {'max |boot - wilson|':>20}")
+    for resamples in args.resamples:
+        (low, high), single = timed(bootstrap_interval, counts['sum'], counts['count'], resamples=resamples, workers=1)
+        (pool_low, _), pooled = timed(bootstrap_interval, counts['sum'], counts['count'], resamples=resamples)
+        assert np.array_equal(low, pool_low, equal_nan=True)
+        gap = max(np.abs(low - wilson['low']).max(), np.abs(high - wilson['high']).max())
+        speedup = row_seconds / ROW_RESAMPLES * resamples / min(single, pooled)
+        print(f'{resamples:>10,} {single:>13.3f} {pooled:>9.3f} {speedup:>8.0f}x {gap:>20.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_validation.py
+"""
+Times ingestion (load_contacts + clean_contacts, then the listings) with and without a
+validation.Validator, whole-file and streamed in chunks, on synthetic exports. The checks
+reuse the columns the cleaners already hold, so the validated path should stay within a few
+percent of the unvalidated one.
+
+Usage:
+    python benchmarks/bench_validation.py [--rows 1000000] [--repeat 3] [--chunksize 250000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import write_dataset  # noqa: E402
+from src.clean_data import clean_contacts, clean_listings  # noqa: E402
+from src.load_data import iter_contacts, load_contacts, load_listings  # noqa: E402
+from src.validation import Validator  # noqa: E402
+
+
+def ingest(paths, validation=None):
+    contacts = clean_contacts(load_contacts(paths['contacts']), copy=False, validation=validation)
+    listings = clean_listings(load_listings(paths['listings']), copy=False, validation=validation)
+    return len(contacts) + len(listings)
+
+
+def ingest_streamed(paths, chunksize, validation=None):
+    rows = 0
+    for chunk in iter_contacts(paths['contacts'], chunksize=chunksize):
+        rows += len(clean_contacts(chunk, copy=False, lean=True, validation=validation))
+    return rows + len(clean_listings(load_listings(paths['listings']), copy=False, validation=validation))
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--chunksize', type=int, default=250_000)
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        paths = write_dataset(data_dir, args.rows)
+        print(f"{'path':<10} {'mode':<11} {'seconds':>8} {'rows/s':>12} {'overhead':>9}")
+        for name, func, extra in (('file', ingest, {}), ('streamed', ingest_streamed, {'chunksize': args.chunksize})):
+            # Alternated so machine load drifts over both sides alike
+            plain, checked = [], []
+            for _ in range(args.repeat):
+                plain.append(timed(func, paths, **extra))
+                checked.append(timed(func, paths, validation=Validator('report'), **extra))
+            for mode, seconds in (('none', min(plain)), ('report', min(checked))):
+                overhead = seconds / min(plain) - 1
+                print(f'{name:<10} {mode:<11} {seconds:>8.3f} {args.rows / seconds:>12,.0f} {overhead:>+9.1%}')
+
+
+if __name__ == '__main__':
+    main()
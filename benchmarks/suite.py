@@ -0,0 +1,212 @@
+# benchmarks/suite.py
+"""
+Regression benchmarks for every public function in load_data, clean_data, metrics,
+funnel_analysis and recommendations, run on synthetic data (see synthetic.py).
+
+Each case is timed asv-style: calls are repeated until a sample takes at least
+--min-sample seconds, with the garbage collector off as in timeit, and the median of
+--repeat samples is kept, so one lucky or unlucky sample moves neither the baseline nor the
+result. Results are compared with the baselines stored in baselines.json for the same number
+of rows, scaled by a fixed calibration workload (its median time, sampled between the cases)
+so a faster, slower or busier machine does not count as a change. A case slower than its
+baseline by more than --tolerance, and by at least --min-difference seconds per call, fails
+the run with exit status 1; the floor keeps sub-millisecond cases, whose relative jitter is
+largest, from failing on noise alone.
+
+Usage:
+    python benchmarks/suite.py [--rows 100000] [--filter metrics.] [--tolerance 0.5]
+    python benchmarks/suite.py --rows 100000 --save    # record new baselines
+    python benchmarks/suite.py --filter RecommendationEngine --save    # add or update cases
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.synthetic import write_dataset  # noqa: E402
+from src import clean_data, funnel_analysis, load_data, metrics, recommendations, segmentation  # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+
+def calibrate(repeat=10):
+    """
+    Times of a fixed NumPy/pandas workload, used to scale baselines across machines.
+    """
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'key': rng.integers(0, 1000, 1_000_000), 'value': rng.random(1_000_000)})
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        np.sort(frame['value'].to_numpy())
+        frame.groupby('key')['value'].mean()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def build_cases(paths):
+    """
+    Lists (name, setup, function) cases. `setup()` returns the call's arguments and runs
+    outside the timer, so functions that modify their input get a fresh copy each call.
+    """
+    raw_contacts = load_data.load_contacts(paths['contacts'])
+    raw_listings = load_data.load_listings(paths['listings'])
+    raw_users = load_data.load_users(paths['users'])
+    contacts = clean_data.clean_contacts(raw_contacts.copy())
+    listings = clean_data.clean_listings(raw_listings.copy())
+
+    def fixed(*args):
+        return lambda: args
+
+    summary = {'booking_rate': metrics.booking_rate(contacts), 'avg_response_time': metrics.avg_response_time(contacts)}
+    channel = metrics.conversion_by_contact_channel(contacts)
+    room_type = funnel_analysis.funnel_by_room_type(contacts, listings)
+    user_stage = metrics.conversion_by_user_stage(contacts)
+    # Fixed guest segments, so the case times funnel_by_segment and not a clustering fit
+    guests = contacts['id_guest_anon'].dropna().unique()
+    segmented = segmentation.assign_segments(contacts, pd.Series(np.arange(len(guests)) % 8, index=guests))
+
+    cases = [
+        ('load_data.load_contacts', fixed(paths['contacts']), load_data.load_contacts),
+        ('load_data.iter_contacts', fixed(paths['contacts']),
+         lambda path: sum(len(chunk) for chunk in load_data.iter_contacts(path, chunksize=50_000))),
+        ('load_data.load_listings', fixed(paths['listings']), load_data.load_listings),
+        ('load_data.load_users', fixed(paths['users']), load_data.load_users),
+        ('load_data.load_all_data', fixed(paths['contacts'], paths['listings'], paths['users']),
+         load_data.load_all_data),
+        ('load_data.memory_report', fixed(paths['listings'], load_data.load_listings), load_data.memory_report),
+        ('clean_data.clean_contacts', lambda: (raw_contacts.copy(),), clean_data.clean_contacts),
+        ('clean_data.clean_contacts(lean=True)', lambda: (raw_contacts.copy(),),
+         lambda df: clean_data.clean_contacts(df, lean=True)),
+        ('clean_data.durations', fixed(contacts), clean_data.durations),
+        ('clean_data.clean_listings', lambda: (raw_listings.copy(),), clean_data.clean_listings),
+        ('clean_data.clean_users', lambda: (raw_users.copy(),), clean_data.clean_users),
+    ]
+    for name in ('booking_rate', 'response_rate', 'acceptance_rate', 'avg_response_time', 'avg_accept_time',
+                 'conversion_by_contact_channel', 'conversion_by_user_stage'):
+        cases.append((f'metrics.{name}', fixed(contacts), getattr(metrics, name)))
+    for name in ('get_funnel_stage_distribution', 'funnel_by_contact_channel', 'funnel_by_guest_user_stage'):
+        cases.append((f'funnel_analysis.{name}', fixed(contacts), getattr(funnel_analysis, name)))
+    for name in ('funnel_by_room_type', 'funnel_by_neighborhood'):
+        cases.append((f'funnel_analysis.{name}', fixed(contacts, listings), getattr(funnel_analysis, name)))
+    cases.append(('funnel_analysis.funnel_by_segment', fixed(segmented), funnel_analysis.funnel_by_segment))
+    cases.append(('funnel_analysis.conversion_intervals', fixed(contacts, 'listing_neighborhood', listings),
+                  funnel_analysis.conversion_intervals))
+    cases.append(('funnel_analysis.conversion_intervals(bootstrap)', fixed(contacts, 'listing_neighborhood', listings),
+                  lambda *args: funnel_analysis.conversion_intervals(*args, method='bootstrap', resamples=1000)))
+    cases.append(('funnel_analysis.conversion_significance', fixed(contacts, 'listing_neighborhood', listings),
+                  funnel_analysis.conversion_significance))
+    cases.append(('recommendations.generate_recommendations', fixed(summary, channel, room_type, user_stage),
+                  recommendations.generate_recommendations))
+    cases.append(('recommendations.RecommendationEngine', fixed(contacts),
+                  lambda df: recommendations.RecommendationEngine(df, segment_by='contact_channel_first').recommend()))
+    return cases
+
+
+def _sample(setup, func, number):
+    """
+    Seconds taken by `number` calls, with their arguments prepared beforehand and GC off.
+    """
+    arguments = [setup() for _ in range(number)]
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for args in arguments:
+            func(*args)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def time_case(setup, func, repeat, min_sample):
+    """
+    Median seconds per call over `repeat` samples of enough calls to last `min_sample` seconds.
+    """
+    number = 1
+    while True:
+        elapsed = _sample(setup, func, number)
+        if elapsed >= min_sample or number >= 10_000:
+            break
+        number = max(number * 2, int(number * min_sample / max(elapsed, 1e-9)))
+    return float(np.median([_sample(setup, func, number) / number for _ in range(repeat)]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-sample', type=float, default=0.2, help='Minimum seconds per timing sample.')
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this text.')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown over the scaled baseline (0.5 = 50%%).')
+    parser.add_argument('--min-difference', type=float, default=0.001,
+                        help='Smallest slowdown in seconds per call that counts as a regression.')
+    parser.add_argument('--save', action='store_true', help='Store the results as the baselines for --rows.')
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore', FutureWarning)
+    calibration = calibrate()
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as handle:
+            baselines = json.load(handle)
+    baseline = baselines.get(str(args.rows))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        cases = build_cases(write_dataset(data_dir, args.rows, seed=args.seed))
+        results = {}
+        for name, setup, func in cases:
+            if args.filter in name:
+                results[name] = time_case(setup, func, args.repeat, args.min_sample)
+                calibration += calibrate(2)
+    # Sampled before, between and after the cases, as machine load drifts while it runs
+    calibration = float(np.median(calibration + calibrate()))
+    scale = calibration / baseline['calibration_s'] if baseline else 1.0
+
+    regressions = []
+    print(f"{'case':<50} {'time (ms)':>10} {'baseline':>10} {'change':>8}")
+    for name, seconds in results.items():
+        reference = baseline['cases'].get(name) if baseline else None
+        if reference is None:
+            print(f'{name:<50} {seconds * 1e3:>10.3f} {"-":>10} {"-":>8}')
+            continue
+        change = seconds / (reference * scale) - 1
+        flag = ''
+        if change > args.tolerance and seconds - reference * scale >= args.min_difference:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<50} {seconds * 1e3:>10.3f} {reference * scale * 1e3:>10.3f} {change:>+8.0%}{flag}')
+
+    if args.save:
+        if baseline and args.filter:
+            # Added to the stored cases, in the units of their calibration
+            cases = dict(baseline['cases'])
+            cases.update({name: seconds / scale for name, seconds in results.items()})
+            calibration = baseline['calibration_s']
+        else:
+            cases = dict(results)
+        baselines[str(args.rows)] = {'calibration_s': calibration, 'cases': cases}
+        with open(BASELINES_PATH, 'w') as handle:
+            json.dump(baselines, handle, indent=2, sort_keys=True)
+        print(f'Saved {len(results)} baseline(s) for {args.rows:,} rows to {BASELINES_PATH}')
+        return 0
+    if regressions:
+        print(f'{len(regressions)} regression(s) beyond {args.tolerance:.0%} and {args.min_difference * 1e3:g} ms: '
+              f'{", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
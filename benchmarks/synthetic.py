@@ -0,0 +1,251 @@
+# benchmarks/synthetic.py
+"""
+Synthetic contacts, listings and users shaped like the Rio exports, at any scale.
+
+Listing attributes (room type, neighborhood, reviews) and user attributes (country, profile
+words) are resampled from the bundled data/listings.csv and data/users.csv. contacts.csv is
+not bundled, so the funnel is calibrated to the figures the notebook reports for it: the
+stage mix per contact channel, booking rates per guest user stage, and mean response and
+acceptance times with a long lognormal tail.
+
+Usage:
+    python benchmarks/synthetic.py --rows 10000000 --output-dir data/synthetic [--seed 0]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+# Channel shares solved from the overall stage mix and the per-channel stage mix below
+CONTACT_CHANNELS = ['contact_me', 'book_it', 'instant_book']
+CHANNEL_SHARES = [0.46, 0.30, 0.24]
+
+# P(no_reply, replied, accepted, booked | channel), from funnel_by_contact_channel
+STAGE_PROBABILITIES = {
+    'contact_me': [0.0911, 0.4815, 0.3563, 0.0711],
+    'book_it': [0.1032, 0.3900, 0.0307, 0.4761],
+    'instant_book': [0.0, 0.0, 0.0, 1.0],
+}
+
+# P(user stage | booked) and P(user stage | not booked), by Bayes from the per-stage booking
+# rates (new 33%, past_booker 53%, -unknown- 40%) and a 57/43 new/past_booker guest mix
+USER_STAGES = ['new', 'past_booker', '-unknown-']
+USER_STAGE_GIVEN_BOOKED = [0.455, 0.544, 0.001]
+USER_STAGE_GIVEN_NOT_BOOKED = [0.650, 0.349, 0.001]
+
+# Non-instant replies: lognormal hours with a ~4.7 h median and a heavy tail (mean ~26 h),
+# giving the reported 19.4 h mean once instant bookings (replied at once) are included;
+# acceptances follow a mean 9 h later, for the reported 20.8 h mean time to acceptance
+REPLY_HOURS_MEDIAN = 4.7
+REPLY_HOURS_SIGMA = 1.85
+ACCEPT_AFTER_REPLY_HOURS = 9
+BOOK_AFTER_ACCEPT_HOURS = 12
+
+# Scale of the bundled exports relative to their ~27.9k inquiries
+LISTINGS_PER_INQUIRY = 13_038 / 27_887
+USERS_PER_INQUIRY = 31_525 / 27_887
+
+# Odd multiplier scrambling sequential indices into unique, random-looking 64-bit ids
+_ID_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def synthetic_ids(indices):
+    """
+    Formats integer indices as 32-character hex ids, one-to-one and stable across calls.
+    """
+    scrambled = np.asarray(indices, dtype=np.uint64) * _ID_MULTIPLIER
+    return pd.Series(scrambled).map('{:032x}'.format).to_numpy(dtype=object)
+
+
+def _timestamps(values, mask):
+    return pd.Series(values.astype('datetime64[s]').astype(str)).where(mask)
+
+
+def make_contacts(n_rows, seed=0, listing_ids=None, guest_ids=None, n_listings=None, n_guests=None):
+    """
+    Builds a synthetic contacts DataFrame shaped like the raw contacts.csv export.
+
+    Timestamps are returned as ISO strings, the same way pd.read_csv hands them to
+    clean_contacts when no parse_dates are given. The stage reached depends on the contact
+    channel and the guest user stage on whether the inquiry booked, so the funnel tables
+    and conversion rates match the notebook's figures for the real export. Inquiries are
+    spread over 2016 and concentrate on popular listings.
+
+    Parameters:
+        n_rows (int): Number of inquiries to generate.
+        seed (int, optional): Seed for the random generator. Defaults to 0.
+        listing_ids (array-like, optional): Listing ids to draw 'id_listing_anon' from, e.g. the
+            bundled listings.csv ids so merges find matches. Defaults to synthetic_ids over
+            `n_listings` listings.
+        guest_ids (array-like, optional): User ids to draw 'id_guest_anon' from. Defaults to
+            synthetic_ids over `n_guests` users.
+        n_listings (int, optional): Listing id space when `listing_ids` is None. Defaults to
+            the bundled listings-per-inquiry ratio.
+        n_guests (int, optional): Guest id space when `guest_ids` is None. Defaults to the
+            bundled users-per-inquiry ratio.
+
+    Returns:
+        pd.DataFrame: Synthetic contacts with the raw contacts.csv columns.
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2016-01-01T00:00:00', 's')
+    interaction = start + rng.integers(0, 365 * 24 * 3600, n_rows).astype('timedelta64[s]')
+
+    channel = rng.choice(CONTACT_CHANNELS, n_rows, p=CHANNEL_SHARES)
+    stage = np.zeros(n_rows, dtype=np.int8)
+    draws = rng.random(n_rows)
+    for name, probabilities in STAGE_PROBABILITIES.items():
+        rows = channel == name
+        stage[rows] = np.searchsorted(np.cumsum(probabilities)[:-1], draws[rows], side='right')
+    replied, accepted, booked = stage >= 1, stage >= 2, stage == 3
+    instant = channel == 'instant_book'
+
+    user_stage = np.where(
+        booked,
+        rng.choice(USER_STAGES, n_rows, p=USER_STAGE_GIVEN_BOOKED),
+        rng.choice(USER_STAGES, n_rows, p=USER_STAGE_GIVEN_NOT_BOOKED),
+    )
+
+    reply_hours = np.where(instant, 0, rng.lognormal(np.log(REPLY_HOURS_MEDIAN), REPLY_HOURS_SIGMA, n_rows))
+    accept_hours = reply_hours + np.where(instant, 0, rng.exponential(ACCEPT_AFTER_REPLY_HOURS, n_rows))
+    book_hours = accept_hours + rng.exponential(BOOK_AFTER_ACCEPT_HOURS, n_rows)
+
+    def after(hours):
+        return interaction + (hours * 3600).astype('timedelta64[s]')
+
+    lead_days = np.minimum(rng.lognormal(np.log(20), 1.0, n_rows), 365).astype(int)
+    checkin = (interaction.astype('datetime64[D]') + lead_days.astype('timedelta64[D]'))
+    checkout = checkin + rng.integers(1, 14, n_rows).astype('timedelta64[D]')
+
+    # Squaring a uniform draw sends most inquiries to a minority of listings
+    if listing_ids is None:
+        n_listings = n_listings or max(int(n_rows * LISTINGS_PER_INQUIRY), 1)
+    else:
+        n_listings = len(listing_ids)
+    listing_index = (rng.random(n_rows) ** 2 * n_listings).astype(np.int64)
+    if listing_ids is None:
+        listing = synthetic_ids(listing_index)
+    else:
+        listing = np.asarray(listing_ids, dtype=object)[listing_index]
+    if guest_ids is None:
+        n_guests = n_guests or max(int(n_rows * USERS_PER_INQUIRY), 1)
+        guest = synthetic_ids(rng.integers(0, n_guests, n_rows))
+    else:
+        guest = np.asarray(guest_ids, dtype=object)[rng.integers(0, len(guest_ids), n_rows)]
+
+    return pd.DataFrame({
+        'id_guest_anon': guest,
+        'id_host_anon': listing_index.astype(str),
+        'id_listing_anon': listing,
+        'ts_interaction_first': pd.Series(interaction.astype(str)),
+        'ts_reply_at_first': _timestamps(after(reply_hours), replied),
+        'ts_accepted_at_first': _timestamps(after(accept_hours), accepted),
+        'ts_booking_at': _timestamps(after(book_hours), booked),
+        'ds_checkin_first': pd.Series(checkin.astype(str)),
+        'ds_checkout_first': pd.Series(checkout.astype(str)),
+        'm_guests': rng.integers(1, 6, n_rows),
+        'm_interactions': rng.integers(1, 30, n_rows),
+        'm_first_message_length_in_characters': rng.integers(0, 1000, n_rows),
+        'contact_channel_first': channel,
+        'guest_user_stage_first': user_stage,
+    })
+
+
+def _resample(source, start, stop, seed, id_column):
+    """
+    Rows start..stop-1 of a synthetic table: bundled rows drawn with replacement, new ids.
+    """
+    rng = np.random.default_rng([seed, start])
+    sample = source.iloc[rng.integers(0, len(source), stop - start)].reset_index(drop=True)
+    sample[id_column] = synthetic_ids(np.arange(start, stop))
+    return sample[[id_column] + [c for c in source.columns if c != id_column]]
+
+
+def make_listings(n_listings, seed=0, start=0, source=None):
+    """
+    Synthetic listings whose room types, neighborhoods and review counts are resampled from
+    the bundled listings.csv, with ids matching make_contacts' default listing ids.
+
+    Parameters:
+        n_listings (int): Number of listings to generate.
+        seed (int, optional): Seed for the random generator. Defaults to 0.
+        start (int, optional): Index of the first listing, to generate a large table in parts.
+        source (pd.DataFrame, optional): Listings to resample. Defaults to data/listings.csv.
+
+    Returns:
+        pd.DataFrame: Synthetic listings with the raw listings.csv columns.
+    """
+    source = pd.read_csv(os.path.join(DATA_DIR, 'listings.csv')) if source is None else source
+    return _resample(source, start, start + n_listings, seed, 'id_listing_anon')
+
+
+def make_users(n_users, seed=0, start=0, source=None):
+    """
+    Synthetic users whose countries and profile lengths are resampled from the bundled
+    users.csv, with ids matching make_contacts' default guest ids.
+
+    Parameters:
+        n_users (int): Number of users to generate.
+        seed (int, optional): Seed for the random generator. Defaults to 0.
+        start (int, optional): Index of the first user, to generate a large table in parts.
+        source (pd.DataFrame, optional): Users to resample. Defaults to data/users.csv.
+
+    Returns:
+        pd.DataFrame: Synthetic users with the raw users.csv columns.
+    """
+    source = pd.read_csv(os.path.join(DATA_DIR, 'users.csv')) if source is None else source
+    return _resample(source, start, start + n_users, seed, 'id_user_anon')
+
+
+def write_dataset(output_dir, n_rows, seed=0, chunk_rows=1_000_000):
+    """
+    Writes contacts.csv, listings.csv and users.csv for `n_rows` inquiries, chunk by chunk,
+    so memory stays flat from 10k up to 100M inquiries.
+
+    Parameters:
+        output_dir (str): Directory for the three CSV files.
+        n_rows (int): Number of inquiries.
+        seed (int, optional): Seed; the same seed and size always produce the same files.
+        chunk_rows (int, optional): Rows generated and written at a time. Defaults to 1,000,000.
+
+    Returns:
+        dict: File name -> path of each written file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_listings = max(int(n_rows * LISTINGS_PER_INQUIRY), 1)
+    n_users = max(int(n_rows * USERS_PER_INQUIRY), 1)
+    listings_source = pd.read_csv(os.path.join(DATA_DIR, 'listings.csv'))
+    users_source = pd.read_csv(os.path.join(DATA_DIR, 'users.csv'))
+    tables = {
+        'listings': (n_listings, lambda size, start: make_listings(size, seed, start, listings_source)),
+        'users': (n_users, lambda size, start: make_users(size, seed, start, users_source)),
+        'contacts': (n_rows, lambda size, start: make_contacts(
+            size, seed=[seed, start], n_listings=n_listings, n_guests=n_users)),
+    }
+
+    paths = {}
+    for name, (size, make) in tables.items():
+        path = os.path.join(output_dir, f'{name}.csv')
+        for start in range(0, size, chunk_rows):
+            make(min(chunk_rows, size - start), start).to_csv(
+                path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+        paths[name] = path
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help='Number of inquiries (10k to 100M).')
+    parser.add_argument('--output-dir', default=os.path.join(DATA_DIR, 'synthetic'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    for name, path in write_dataset(args.output_dir, args.rows, args.seed, args.chunk_rows).items():
+        print(f'{name:>9}: {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+# src/aggregates.py
+
+import numpy as np
+import pandas as pd
+
+from src.clean_data import clean_contacts
+from src.load_data import iter_contacts
+
+FUNNEL_STAGES = ['no_reply', 'replied', 'accepted', 'booked']
+
+DEFAULT_GROUP_COLUMNS = ('contact_channel_first', 'guest_user_stage_first', 'id_listing_anon')
+
+TOTAL_KEYS = (
+    'rows', 'booked', 'replied', 'accepted',
+    'response_hours_sum', 'response_hours_count',
+    'accept_hours_sum', 'accept_hours_count',
+)
+
+
+def _ratio(numerator, denominator):
+    """
+    Divides two totals, returning NaN instead of raising when the denominator is zero.
+    """
+    return numerator / denominator if denominator else np.nan
+
+
+class Aggregates:
+    """
+    Base class for pre-aggregated contact data.
+
+    The functions in metrics.py and funnel_analysis.py accept any subclass in place of a cleaned
+    contacts DataFrame. Subclasses provide `totals` (a dict keyed by TOTAL_KEYS), `stage_counts()`
+    and `tally(column)`; everything else is derived from those three.
+    """
+
+    totals = None
+
+    def stage_counts(self):
+        """
+        Returns:
+            pd.Series: Number of inquiries per funnel stage, indexed by stage.
+        """
+        raise NotImplementedError
+
+    def tally(self, column):
+        """
+        Parameters:
+            column (str): A grouping column the aggregates were built with.
+
+        Returns:
+            pd.DataFrame: Inquiry counts indexed by the values of `column` (missing values excluded),
+                with one int64 column per funnel stage in FUNNEL_STAGES order.
+        """
+        raise NotImplementedError
+
+    def has_column(self, column):
+        """
+        Returns True if `tally(column)` can be answered.
+        """
+        raise NotImplementedError
+
+    def booking_rate(self):
+        return _ratio(self.totals['booked'], self.totals['rows'])
+
+    def response_rate(self):
+        return _ratio(self.totals['replied'], self.totals['rows'])
+
+    def acceptance_rate(self):
+        return _ratio(self.totals['accepted'], self.totals['rows'])
+
+    def avg_response_time(self):
+        return _ratio(self.totals['response_hours_sum'], self.totals['response_hours_count'])
+
+    def avg_accept_time(self):
+        return _ratio(self.totals['accept_hours_sum'], self.totals['accept_hours_count'])
+
+    def group_counts(self, column):
+        """
+        Returns:
+            pd.DataFrame: 'count' and 'booked' inquiry totals indexed by the values of `column`.
+        """
+        stages = self.tally(column)
+        return pd.DataFrame({'count': stages.sum(axis=1), 'booked': stages['booked']})
+
+    def booking_rate_by(self, column):
+        """
+        Booking conversion rate per value of `column`, the aggregate equivalent of
+        `df.groupby(column)['booking_happened'].mean()`.
+        """
+        counts = self.group_counts(column)
+        rates = counts['booked'] / counts['count']
+        rates.name = 'booking_happened'
+        return rates
+
+
+def is_aggregate(obj):
+    """
+    Returns True if `obj` is pre-aggregated data rather than a contacts DataFrame.
+    """
+    return isinstance(obj, Aggregates)
+
+
+def _stage_frame(df, column):
+    """
+    Counts inquiries per (column value, funnel stage) as a wide int64 frame.
+    """
+    counts = df.groupby([column, 'funnel_stage'], observed=True).size().unstack(fill_value=0)
+    counts = counts.reindex(columns=FUNNEL_STAGES, fill_value=0).astype('int64')
+    counts.index = pd.Index(counts.index.astype(object), name=column)
+    counts.columns.name = 'funnel_stage'
+    return counts
+
+
+class ContactAggregates(Aggregates):
+    """
+    Mergeable partial aggregates of a cleaned contacts frame.
+
+    Holds scalar counters and sums plus per-group funnel stage tallies, which is everything the
+    metrics and funnel functions need. Two instances built from disjoint chunks of the same file
+    merge into the aggregates of the whole file, so a file can be processed chunk by chunk with
+    flat memory.
+    """
+
+    def __init__(self, totals=None, stages=None, tallies=None):
+        self.totals = dict.fromkeys(TOTAL_KEYS, 0) if totals is None else dict(totals)
+        if stages is None:
+            stages = pd.Series(0, index=pd.Index(FUNNEL_STAGES, name='funnel_stage'), dtype='int64')
+        self.stages = stages
+        self.tallies = {} if tallies is None else dict(tallies)
+
+    @classmethod
+    def from_frame(cls, df, group_columns=DEFAULT_GROUP_COLUMNS):
+        """
+        Builds aggregates from a cleaned contacts DataFrame.
+
+        Parameters:
+            df (pd.DataFrame): Output of clean_contacts.
+            group_columns (iterable of str, optional): Columns to keep per-group tallies for.
+                Columns missing from `df` are skipped. Defaults to DEFAULT_GROUP_COLUMNS.
+
+        Returns:
+            ContactAggregates: The aggregates of `df`.
+        """
+        response = df['response_time_hours'].dropna()
+        accept = df['accept_time_hours'].dropna()
+        totals = {
+            'rows': len(df),
+            'booked': int(df['booking_happened'].sum()),
+            'replied': int(df['ts_reply_at_first'].notna().sum()),
+            'accepted': int(df['ts_accepted_at_first'].notna().sum()),
+            'response_hours_sum': float(response.sum()),
+            'response_hours_count': len(response),
+            'accept_hours_sum': float(accept.sum()),
+            'accept_hours_count': len(accept),
+        }
+        stages = df['funnel_stage'].value_counts().reindex(FUNNEL_STAGES, fill_value=0).astype('int64')
+        stages.index.name = 'funnel_stage'
+        stages.name = None
+        tallies = {
+            column: _stage_frame(df, column)
+            for column in group_columns
+            if column in df.columns
+        }
+        return cls(totals, stages, tallies)
+
+    def merge(self, other):
+        """
+        Combines two sets of aggregates built with the same group columns.
+
+        Parameters:
+            other (ContactAggregates): Aggregates of a disjoint set of rows.
+
+        Returns:
+            ContactAggregates: A new instance covering the rows of both inputs.
+        """
+        totals = {key: self.totals[key] + other.totals[key] for key in TOTAL_KEYS}
+        stages = self.stages.add(other.stages, fill_value=0).astype('int64')
+        tallies = dict(self.tallies)
+        for column, tally in other.tallies.items():
+            if column in tallies:
+                tally = tallies[column].add(tally, fill_value=0).astype('int64')
+            tallies[column] = tally
+        return ContactAggregates(totals, stages, tallies)
+
+    __add__ = merge
+
+    def retract(self, other):
+        """
+        Removes the contribution of rows previously merged in, e.g. an inquiry that is about to
+        be re-added with a late booking timestamp.
+
+        Parameters:
+            other (ContactAggregates): Aggregates of rows that are part of this instance.
+
+        Returns:
+            ContactAggregates: A new instance without those rows. Groups left with no
+            inquiries are dropped from the tallies.
+        """
+        totals = {key: self.totals[key] - other.totals[key] for key in TOTAL_KEYS}
+        stages = self.stages.sub(other.stages, fill_value=0).astype('int64')
+        tallies = dict(self.tallies)
+        for column, tally in other.tallies.items():
+            if column not in tallies:
+                raise KeyError(f"Cannot retract '{column}' tallies that were never merged in")
+            remaining = tallies[column].sub(tally, fill_value=0).astype('int64')
+            if (remaining.to_numpy() < 0).any():
+                raise ValueError(f"Retracting more '{column}' inquiries than were merged in")
+            tallies[column] = remaining[remaining.sum(axis=1) > 0]
+        return ContactAggregates(totals, stages, tallies)
+
+    __sub__ = retract
+
+    def stage_counts(self):
+        return self.stages.copy()
+
+    def has_column(self, column):
+        return column in self.tallies
+
+    def tally(self, column):
+        if column not in self.tallies:
+            raise KeyError(f"No tally for '{column}'; aggregates were built with {sorted(self.tallies)}")
+        return self.tallies[column]
+
+
+def aggregate_contacts(chunks, group_columns=DEFAULT_GROUP_COLUMNS, validation=None):
+    """
+    Cleans and aggregates an iterable of raw contacts chunks, merging as it goes.
+
+    Parameters:
+        chunks (iterable of pd.DataFrame): Raw contacts chunks, e.g. from load_data.iter_contacts.
+        group_columns (iterable of str, optional): Columns to keep per-group tallies for.
+        validation (validation.Validator, optional): Passed to clean_contacts for every chunk.
+
+    Returns:
+        ContactAggregates: Aggregates over all chunks.
+    """
+    result = ContactAggregates()
+    for chunk in chunks:
+        chunk = clean_contacts(chunk, validation=validation)
+        result = result.merge(ContactAggregates.from_frame(chunk, group_columns))
+    return result
+
+
+def aggregate_contacts_file(path='data/contacts.csv', chunksize=500_000, group_columns=DEFAULT_GROUP_COLUMNS,
+                            validation=None):
+    """
+    Streams contacts.csv in chunks and returns its aggregates without holding the file in memory.
+
+    Parameters:
+        path (str, optional): Path to contacts.csv. Defaults to 'data/contacts.csv'.
+        chunksize (int, optional): Rows per chunk. Peak memory scales with this, not the file size.
+        group_columns (iterable of str, optional): Columns to keep per-group tallies for.
+        validation (validation.Validator, optional): Checks every chunk as it is cleaned.
+
+    Returns:
+        ContactAggregates: Aggregates over the whole file.
+    """
+    return aggregate_contacts(iter_contacts(path, chunksize=chunksize), group_columns, validation)
@@ -0,0 +1,238 @@
+# src/backend.py
+#
+# Optional DuckDB backend for metrics.py and funnel_analysis.py. DuckDBContacts runs the
+# cleaning rules of clean_contacts and the funnel groupbys as SQL directly over contacts
+# CSV/Parquet files (or an in-memory frame), so contacts files larger than RAM are scanned
+# in parallel and out of core instead of being materialized as pandas frames. It implements
+# the Aggregates interface, so every metric and funnel function accepts it unchanged.
+#
+# The backend is chosen per call (`booking_rate(path, backend='duckdb')`) or globally
+# (`set_backend('duckdb')` or the `with use_backend('duckdb'):` block). duckdb is optional;
+# the default 'pandas' backend never imports it.
+
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import FUNNEL_STAGES, TOTAL_KEYS, Aggregates, is_aggregate
+from src.clean_data import clean_contacts, clean_listings
+from src.enrich import LISTING_COLUMNS, first_rows
+from src.load_data import CONTACT_DTYPES, load_contacts, load_listings
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+BACKENDS = ('pandas', 'duckdb')
+
+_backend = 'pandas'
+
+# Timestamps parsed with TRY_CAST, the SQL equivalent of pd.to_datetime(errors='coerce')
+_TIMESTAMP_COLUMNS = ('ts_interaction_first', 'ts_reply_at_first', 'ts_accepted_at_first', 'ts_booking_at')
+
+
+def get_backend():
+    """
+    Returns the name of the backend used when a function is called without `backend`.
+    """
+    return _backend
+
+
+def set_backend(name):
+    """
+    Selects the backend used by default: 'pandas' or 'duckdb'.
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'; expected one of {BACKENDS}")
+    if name == 'duckdb' and duckdb is None:
+        raise ImportError("The 'duckdb' backend requires the duckdb package")
+    _backend = name
+
+
+@contextmanager
+def use_backend(name):
+    """
+    Selects a backend for the duration of a `with` block.
+    """
+    previous = get_backend()
+    set_backend(name)
+    try:
+        yield
+    finally:
+        set_backend(previous)
+
+
+def _is_path(data):
+    return isinstance(data, (str, os.PathLike))
+
+
+def resolve(data, backend=None, df_listings=None):
+    """
+    Turns a function's contacts argument into what the chosen backend computes on.
+
+    Parameters:
+        data (pd.DataFrame, Aggregates or str): Cleaned contacts frame, fact table, aggregates,
+            or a path to a contacts CSV/Parquet file.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to get_backend().
+        df_listings (pd.DataFrame, optional): Cleaned listings, joined in by the duckdb backend.
+
+    Returns:
+        pd.DataFrame or Aggregates: `data` unchanged for pandas (a path is loaded and cleaned),
+        or a DuckDBContacts over it for duckdb. Aggregates are always returned unchanged.
+    """
+    if is_aggregate(data):
+        return data
+    backend = backend or get_backend()
+    if backend == 'duckdb':
+        return DuckDBContacts(data, df_listings)
+    if backend != 'pandas':
+        raise ValueError(f"Unknown backend '{backend}'; expected one of {BACKENDS}")
+    if _is_path(data):
+        return clean_contacts(load_contacts(data), copy=False)
+    return data
+
+
+def _scan(path):
+    """
+    SQL table function reading a contacts file, with the timestamps left as text.
+    """
+    path = os.fspath(path).replace("'", "''")
+    if path.endswith(('.parquet', '.pq')):
+        return f"read_parquet('{path}')"
+    types = ', '.join(f"'{column}': 'VARCHAR'" for column in _TIMESTAMP_COLUMNS)
+    return f"read_csv('{path}', header=true, types={{{types}}})"
+
+
+def _categorical_dtypes(df):
+    return {c: df[c].dtype for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)}
+
+
+class DuckDBContacts(Aggregates):
+    """
+    Contacts aggregates computed by DuckDB queries over a file or frame.
+
+    Nothing is read until a metric asks for it. Totals and stage counts come from one scan;
+    each `tally(column)` is one GROUP BY scan, cached per column.
+
+    Parameters:
+        contacts (str or pd.DataFrame): Path to a contacts CSV or Parquet file (glob patterns
+            allowed), or a raw or cleaned contacts frame.
+        df_listings (pd.DataFrame or str, optional): Cleaned listings, or a path to listings.csv
+            (loaded and cleaned with pandas, as it is small). Joined on 'id_listing_anon',
+            first row per listing as in src/enrich.py, so room type and neighborhood can be tallied.
+        threads (int, optional): DuckDB worker threads. Defaults to all cores.
+        memory_limit (str, optional): DuckDB memory limit, e.g. '4GB'; larger aggregations
+            spill to disk. Defaults to DuckDB's own limit.
+    """
+
+    def __init__(self, contacts, df_listings=None, threads=None, memory_limit=None):
+        if duckdb is None:
+            raise ImportError("The 'duckdb' backend requires the duckdb package")
+        config = {}
+        if threads:
+            config['threads'] = threads
+        if memory_limit:
+            config['memory_limit'] = memory_limit
+        self.connection = duckdb.connect(config=config)
+
+        # Label column -> dtype of the index of its tallies, matching the pandas path: the
+        # frame's categorical dtype, or 'category' for columns load_contacts reads as
+        # categoricals (categories are then the labels found, as read_csv infers them)
+        self.label_dtypes = {}
+        if _is_path(contacts):
+            source = _scan(contacts)
+            self.label_dtypes.update({c: 'category' for c, dtype in CONTACT_DTYPES.items() if dtype == 'category'})
+        else:
+            self.connection.register('contacts_source', contacts)
+            source = 'contacts_source'
+            self.label_dtypes.update(_categorical_dtypes(contacts))
+        columns = [row[0] for row in self.connection.execute(f'DESCRIBE SELECT * FROM {source}').fetchall()]
+
+        join, listing_columns = '', []
+        if df_listings is not None:
+            if _is_path(df_listings):
+                df_listings = clean_listings(load_listings(df_listings), copy=False)
+            listing_columns = [c for c in LISTING_COLUMNS if c in df_listings.columns and c not in columns]
+            listings = first_rows(df_listings, 'id_listing_anon')
+            listings = listings[['id_listing_anon'] + listing_columns]
+            self.label_dtypes.update(_categorical_dtypes(listings))
+            # Plain object columns, so labels come back as strings rather than ENUMs
+            listings = listings.astype({c: object for c in listings.columns if isinstance(listings[c].dtype, pd.CategoricalDtype)})
+            self.connection.register('listings_source', listings)
+            join = 'LEFT JOIN listings_source AS l USING (id_listing_anon)'
+        self.columns = columns + listing_columns
+
+        parsed = ', '.join(f'TRY_CAST({column} AS TIMESTAMP) AS _{column}' for column in _TIMESTAMP_COLUMNS)
+        selected = ', '.join(['c.*'] + [f'l.{column}' for column in listing_columns])
+        self.connection.execute(f"""
+            CREATE VIEW inquiries AS
+            SELECT {selected},
+                _ts_booking_at IS NOT NULL AS _booked,
+                _ts_reply_at_first IS NOT NULL AS _replied,
+                _ts_accepted_at_first IS NOT NULL AS _accepted,
+                epoch(_ts_reply_at_first - _ts_interaction_first) / 3600 AS _response_hours,
+                epoch(_ts_accepted_at_first - _ts_interaction_first) / 3600 AS _accept_hours,
+                CASE
+                    WHEN _ts_booking_at IS NOT NULL THEN 'booked'
+                    WHEN _ts_accepted_at_first IS NOT NULL THEN 'accepted'
+                    WHEN _ts_reply_at_first IS NOT NULL THEN 'replied'
+                    ELSE 'no_reply'
+                END AS _funnel_stage
+            FROM (SELECT *, {parsed} FROM {source}) AS c
+            {join}
+        """)
+        self._totals = None
+        self._stages = None
+        self._tallies = {}
+
+    def _scan_totals(self):
+        stage_counts = ', '.join(f"count_if(_funnel_stage = '{stage}')" for stage in FUNNEL_STAGES)
+        row = self.connection.execute(f"""
+            SELECT count(*), count_if(_booked), count_if(_replied), count_if(_accepted),
+                coalesce(sum(_response_hours), 0), count(_response_hours),
+                coalesce(sum(_accept_hours), 0), count(_accept_hours),
+                {stage_counts}
+            FROM inquiries
+        """).fetchone()
+        self._totals = dict(zip(TOTAL_KEYS, row[:len(TOTAL_KEYS)]))
+        self._stages = pd.Series(row[len(TOTAL_KEYS):], index=pd.Index(FUNNEL_STAGES, name='funnel_stage'),
+                                 dtype='int64')
+
+    @property
+    def totals(self):
+        if self._totals is None:
+            self._scan_totals()
+        return self._totals
+
+    def stage_counts(self):
+        if self._stages is None:
+            self._scan_totals()
+        return self._stages.copy()
+
+    def has_column(self, column):
+        return column in self.columns
+
+    def tally(self, column):
+        if column not in self.columns:
+            raise KeyError(f"No column '{column}'; available columns are {sorted(self.columns)}")
+        if column not in self._tallies:
+            counts = self.connection.execute(f"""
+                SELECT "{column}" AS label, _funnel_stage AS funnel_stage, count(*) AS n
+                FROM inquiries
+                WHERE "{column}" IS NOT NULL
+                GROUP BY ALL
+            """).df()
+            tally = counts.pivot(index='label', columns='funnel_stage', values='n')
+            tally = tally.reindex(columns=FUNNEL_STAGES, fill_value=0).fillna(0).astype('int64').sort_index()
+            labels = np.asarray(tally.index, dtype=object)
+            dtype = self.label_dtypes.get(column)
+            if isinstance(dtype, str):
+                dtype = pd.CategoricalDtype(labels)
+            tally.index = pd.Index(labels, dtype=dtype, name=column)
+            tally.columns.name = 'funnel_stage'
+            self._tallies[column] = tally
+        return self._tallies[column]
@@ -0,0 +1,135 @@
+# src/cache.py
+#
+# On-disk cache of the cleaned datasets. Each cleaned frame is stored as an uncompressed
+# Feather (Arrow IPC) file so a warm start is a columnar read instead of a CSV parse plus
+# cleaning. Entries are keyed by a hash of the source file contents and of the loading and
+# cleaning code, so editing either invalidates the cache. pyarrow is optional; without it
+# the cache falls back to pickle files.
+#
+# The file is memory-mapped, but only the Arrow-backed string columns (ids, labels) stay
+# zero-copy on the mapped pages; NumPy cannot view Arrow columns with nulls (NaT timestamps,
+# nullable integers) or booleans, so those are copied into pandas memory, one block at a
+# time and releasing the Arrow buffers as it goes.
+
+import hashlib
+import inspect
+import os
+import pickle
+
+from src import clean_data, load_data, profiling, validation
+from src.clean_data import clean_contacts, clean_listings, clean_users
+from src.load_data import load_contacts, load_listings, load_users
+from src.profiling import instrument
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+CACHE_DIR = 'data/.cache'
+
+FRAME_EXTENSION = 'feather' if feather is not None else 'pkl'
+
+
+def file_digest(path, block_size=1 << 20):
+    """
+    Computes the SHA-256 hex digest of a file's contents, reading it in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cleaning_version():
+    """
+    Returns a hash of the loading and cleaning code (and of the modules the cleaners call
+    into), so cached frames are rebuilt whenever it changes.
+    """
+    digest = hashlib.sha256()
+    for module in (load_data, clean_data, profiling, validation):
+        digest.update(inspect.getsource(module).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _cache_path(cache_dir, name, key):
+    return os.path.join(cache_dir, f'{name}-{key[:20]}.{FRAME_EXTENSION}')
+
+
+def write_frame(df, path):
+    """
+    Writes a DataFrame (index included) as uncompressed Feather, or pickle without pyarrow.
+    """
+    if feather is not None:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        feather.write_feather(table, path, compression='uncompressed')
+    else:
+        with open(path, 'wb') as handle:
+            pickle.dump(df, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_frame(path):
+    """
+    Reads a frame written by write_frame, memory-mapping Feather files (see the module notes
+    for which columns stay on the mapped pages).
+    """
+    if feather is not None:
+        return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True, self_destruct=True)
+    with open(path, 'rb') as handle:
+        return pickle.load(handle)
+
+
+def _remove_stale(cache_dir, name, keep):
+    for entry in os.listdir(cache_dir):
+        if entry.startswith(f'{name}-') and os.path.join(cache_dir, entry) != keep:
+            os.remove(os.path.join(cache_dir, entry))
+
+
+def cached_clean(name, path, loader, cleaner, cache_dir=CACHE_DIR, refresh=False):
+    """
+    Loads and cleans one dataset, going through the on-disk cache.
+
+    Parameters:
+        name (str): Dataset name used in the cache file name, e.g. 'contacts'.
+        path (str): Path of the source CSV file.
+        loader (callable): Function that reads `path` into a DataFrame.
+        cleaner (callable): Function that cleans the loaded DataFrame.
+        cache_dir (str, optional): Directory holding cache files. Defaults to CACHE_DIR.
+        refresh (bool, optional): If True, ignore any cached copy and rebuild it. Defaults to False.
+
+    Returns:
+        pd.DataFrame: The cleaned DataFrame.
+    """
+    key = hashlib.sha256(f'{file_digest(path)}:{cleaning_version()}'.encode('utf-8')).hexdigest()
+    cache_path = _cache_path(cache_dir, name, key)
+    if not refresh and os.path.exists(cache_path):
+        return read_frame(cache_path)
+
+    df = cleaner(loader(path))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{cache_path}.tmp'
+    write_frame(df, tmp_path)
+    os.replace(tmp_path, cache_path)
+    _remove_stale(cache_dir, name, keep=cache_path)
+    return df
+
+
+@instrument()
+def load_clean_data(contacts_path='data/contacts.csv',
+                    listings_path='data/listings.csv',
+                    users_path='data/users.csv',
+                    cache_dir=CACHE_DIR,
+                    refresh=False):
+    """
+    Cached equivalent of load_all_data followed by clean_contacts, clean_listings and clean_users.
+
+    Returns:
+        tuple of pd.DataFrame: Cleaned (contacts, listings, users).
+    """
+    contacts = cached_clean('contacts', contacts_path, load_contacts, clean_contacts, cache_dir, refresh)
+    listings = cached_clean('listings', listings_path, load_listings, clean_listings, cache_dir, refresh)
+    users = cached_clean('users', users_path, load_users, clean_users, cache_dir, refresh)
+    return contacts, listings, users
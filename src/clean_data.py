@@ -1,7 +1,56 @@
 # src/clean_data.py
+#
+# Copy contract: by default every cleaner leaves the frame it is given untouched and returns a
+# new frame. The copy is shallow, so unchanged columns are shared with the input rather than
+# duplicated, and only the columns a cleaner rewrites are allocated. Pass copy=False to clean
+# a frame nobody else holds (a freshly loaded chunk or partition) in place instead, so the raw
+# timestamp strings it replaces are freed as the cleaning goes.
+#
+# clean_contacts(df, lean=True) keeps only what the metrics read: hours as float32 instead of
+# a Timedelta column plus its float64 hours twin. The Timedeltas can be rebuilt from the
+# timestamps at any time with durations(df).
+#
+# Every cleaner takes an optional validation.Validator and checks its data-quality rules on the
+# columns it is already handling (see src/validation.py); without one it does no extra work.
+import numpy as np
 import pandas as pd
 
-def clean_contacts(df):
+from src.load_data import LISTING_DTYPES
+from src.profiling import instrument, span
+
+DATETIME_COLUMNS = ['ts_booking_at', 'ts_reply_at_first', 'ts_interaction_first', 'ts_accepted_at_first']
+
+# Room type label, once stripped and lowercased -> canonical label. The Airbnb exports say
+# 'Entire home/apt' where the report says 'entire home'; labels not listed here are kept as
+# they are rather than dropped.
+ROOM_TYPES = {
+    'entire home/apt': 'entire home',
+    'entire home': 'entire home',
+    'private room': 'private room',
+    'shared room': 'shared room',
+}
+
+
+def durations(df):
+    """
+    Derives the response and acceptance Timedeltas from the cleaned timestamps.
+
+    Lean-cleaned frames do not store these columns; this rebuilds them on demand.
+
+    Parameters:
+        df (pd.DataFrame): Output of clean_contacts.
+
+    Returns:
+        pd.DataFrame: 'response_time' and 'accept_time' columns, NaT where either timestamp is missing.
+    """
+    return pd.DataFrame({
+        'response_time': df['ts_reply_at_first'] - df['ts_interaction_first'],
+        'accept_time': df['ts_accepted_at_first'] - df['ts_interaction_first'],
+    }, index=df.index)
+
+
+@instrument()
+def clean_contacts(df, copy=True, lean=False, validation=None):
     """
     Cleans and enriches a DataFrame containing Airbnb contact/booking data.
     This function performs the following operations:
@@ -10,138 +59,158 @@ def clean_contacts(df):
     - Computes 'response_time' and 'accept_time' as timedeltas between relevant events.
     - Adds 'response_time_hours' and 'accept_time_hours' as the duration in hours.
     - Determines the booking funnel stage for each row and adds it as 'funnel_stage'.
+    All steps are vectorized column operations; no row-wise apply is involved.
     Parameters:
         df (pd.DataFrame): Input DataFrame with columns:
             - 'ts_booking_at'
             - 'ts_reply_at_first'
             - 'ts_interaction_first'
             - 'ts_accepted_at_first'
+        copy (bool, optional): If True, `df` is left unchanged and a shallow copy is cleaned.
+            If False, `df` is cleaned in place. Defaults to True.
+        lean (bool, optional): If True, skip the 'response_time' and 'accept_time' Timedelta
+            columns (see durations) and store the hours as float32, exact to within a few
+            seconds. Defaults to False.
+        validation (validation.Validator, optional): Checks the contacts rules while cleaning;
+            in 'quarantine' mode the flagged rows are left out of the result. Defaults to None.
     Returns:
         pd.DataFrame: The cleaned and enriched DataFrame with new columns added.
     """
+    if copy:
+        df = df.copy(deep=False)
+
     # Safe datetime parsing
-    datetime_cols = [
-        'ts_booking_at',
-        'ts_reply_at_first',
-        'ts_interaction_first',
-        'ts_accepted_at_first',
-    ]
-    for col in datetime_cols:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
+    with span('clean_contacts.parse_dates', rows_in=len(df)) as stage:
+        unparseable = None
+        for col in DATETIME_COLUMNS:
+            raw = df[col]
+            df[col] = pd.to_datetime(raw, errors='coerce')
+            # Columns read_csv already parsed have nothing to coerce
+            if validation is not None and not pd.api.types.is_datetime64_any_dtype(raw):
+                coerced = raw.notna().to_numpy() & df[col].isna().to_numpy()
+                unparseable = coerced if unparseable is None else unparseable | coerced
+        stage.output(df, DATETIME_COLUMNS)
+    if unparseable is not None:
+        validation.check('unparseable_timestamp', unparseable, df.index)
 
     # Booking flag
     df['booking_happened'] = df['ts_booking_at'].notna()
 
-    # Compute Timedelta safely: result is NaT if any input is NaT
-    def compute_timedelta(row, later_col, earlier_col):
-        """
-        Compute the time difference between two datetime columns in a DataFrame row.
-
-        Parameters:
-            row (pd.Series): A row from a pandas DataFrame.
-            later_col (str): The name of the column containing the later datetime.
-            earlier_col (str): The name of the column containing the earlier datetime.
-
-        Returns:
-            pd.Timedelta or pd.NaT: The time difference between the two columns, or pd.NaT if either value is missing.
-        """
-        if pd.isna(row[later_col]) or pd.isna(row[earlier_col]):
-            return pd.NaT
-        else :
-            return row[later_col] - row[earlier_col]
-
-    df['response_time'] = df.apply(
-        lambda row: compute_timedelta(row, 'ts_reply_at_first', 'ts_interaction_first'),
-        axis=1
-    )
-
-    df['accept_time'] = df.apply(
-        lambda row: compute_timedelta(row, 'ts_accepted_at_first', 'ts_interaction_first'),
-        axis=1
-    )
-
-    # Compute hours directly during the same process
-    def compute_hours(td):
-        """
-        Converts a pandas Timedelta object to the total number of hours.
-
-        Parameters:
-            td (pandas.Timedelta or NaT): The time difference to convert.
-
-        Returns:
-            float or pandas.NaT: The total number of hours represented by the Timedelta,
-            or pandas.NaT if the input is missing (NaT).
-        """
-        return pd.NaT if pd.isna(td) else td.total_seconds() / 3600
-
-    df['response_time_hours'] = df['response_time'].apply(compute_hours)
-    df['accept_time_hours'] = df['accept_time'].apply(compute_hours)
-
-    # Booking funnel stage
-    def determine_stage(row):
-        """
-        Determines the booking stage of a row based on timestamp columns.
-
-        Parameters:
-            row (pd.Series): A pandas Series representing a row of data with the following timestamp columns:
-                - 'ts_booking_at'
-                - 'ts_accepted_at_first'
-                - 'ts_reply_at_first'
-
-        Returns:
-            str: The booking stage, which can be one of the following:
-                - 'booked' if 'ts_booking_at' is not NaN
-                - 'accepted' if 'ts_accepted_at_first' is not NaN
-                - 'replied' if 'ts_reply_at_first' is not NaN
-                - 'no_reply' if none of the above are present
-        """
-        if pd.notna(row['ts_booking_at']):
-            return 'booked'
-        elif pd.notna(row['ts_accepted_at_first']):
-            return 'accepted'
-        elif pd.notna(row['ts_reply_at_first']):
-            return 'replied'
+    with span('clean_contacts.durations', rows_in=len(df)) as stage:
+        if lean:
+            # One Timedelta at a time, each dropped once its hours are stored
+            for name, later in (('response_time_hours', 'ts_reply_at_first'),
+                                ('accept_time_hours', 'ts_accepted_at_first')):
+                delta = df[later] - df['ts_interaction_first']
+                df[name] = (delta.dt.total_seconds() / 3600).astype(np.float32)
         else:
-            return 'no_reply'
+            # Column-wise subtraction: result is NaT if any input is NaT
+            df['response_time'] = df['ts_reply_at_first'] - df['ts_interaction_first']
+            df['accept_time'] = df['ts_accepted_at_first'] - df['ts_interaction_first']
+
+            # Hours as float, NaN where the Timedelta is NaT
+            df['response_time_hours'] = df['response_time'].dt.total_seconds() / 3600
+            df['accept_time_hours'] = df['accept_time'].dt.total_seconds() / 3600
+        stage.output(df, ['response_time_hours', 'accept_time_hours'])
+    if validation is not None:
+        validation.check('reply_before_interaction', (df['response_time_hours'] < 0).to_numpy(), df.index)
+        validation.check('accept_before_interaction', (df['accept_time_hours'] < 0).to_numpy(), df.index)
+
+    # Booking funnel stage: the furthest step reached wins
+    with span('clean_contacts.funnel_stage', rows_in=len(df)) as stage:
+        # Stage codes index one shared string per stage, instead of a new string object per row
+        codes = np.select(
+            [
+                df['booking_happened'].to_numpy(),
+                df['ts_accepted_at_first'].notna().to_numpy(),
+                df['ts_reply_at_first'].notna().to_numpy(),
+            ],
+            [3, 2, 1],
+            default=0,
+        )
+        df['funnel_stage'] = np.array(['no_reply', 'replied', 'accepted', 'booked'], dtype=object)[codes]
+        stage.output(df, 'funnel_stage')
+
+    if validation is not None:
+        validation.check_labels('unknown_contact_channel', df['contact_channel_first'], df.index)
+        validation.check_labels('unknown_user_stage', df['guest_user_stage_first'], df.index)
+        df = validation.finish('contacts', df)
+    return df
 
-    df['funnel_stage'] = df.apply(determine_stage, axis=1)
 
-    return df
+def _normalize_labels(series, aliases=None):
+    """
+    Strips whitespace and lowercases string labels, then maps them through `aliases`.
+
+    Categorical columns are normalized on their categories only and stay categorical.
+    Labels missing from `aliases` are kept as normalized.
+    """
+    def normalize(labels):
+        labels = labels.str.strip().str.lower()
+        if aliases:
+            labels = labels.map(lambda label: aliases.get(label, label))
+        return labels
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        return series.map(dict(zip(categories, normalize(categories)))).astype('category')
+    return normalize(series)
 
 
-def clean_users(df):
+@instrument()
+def clean_users(df, copy=True, validation=None):
     """
     Cleans the user DataFrame by handling missing values and adding a profile indicator.
 
     Parameters:
-        df (pandas.DataFrame): The input DataFrame containing a 'words_in_user_profile' column.
+        df (pd.DataFrame): The input DataFrame containing a 'words_in_user_profile' column.
+        copy (bool, optional): If True, `df` is left unchanged; if False, it is cleaned in place.
+            Defaults to True.
+        validation (validation.Validator, optional): Checks for repeated 'id_user_anon' values.
+            Defaults to None.
 
     Returns:
         pandas.DataFrame: The cleaned DataFrame with missing 'words_in_user_profile' values filled with 0,
                           and a new boolean column 'has_profile' indicating if the user has a profile.
     """
+    if copy:
+        df = df.copy(deep=False)
     df['words_in_user_profile'] = df['words_in_user_profile'].fillna(0)
     df['has_profile'] = df['words_in_user_profile'] > 0
+    if validation is not None:
+        validation.check('duplicate_user_id', df['id_user_anon'].duplicated().to_numpy(), df['id_user_anon'])
+        df = validation.finish('users', df)
     return df
 
 
-def clean_listings(df):
+@instrument()
+def clean_listings(df, copy=True, validation=None):
     """
-    Cleans and filters the Airbnb listings DataFrame.
+    Cleans the Airbnb listings DataFrame.
 
     This function performs the following operations:
     1. Strips whitespace and converts the 'room_type' column to lowercase.
-    2. Filters the DataFrame to include only rows where 'room_type' is one of:
-        'entire home', 'private room', or 'shared room'.
-    3. Fills missing values in the 'total_reviews' column with 0 and converts the column to integer type.
+    2. Maps room type labels to their canonical names through ROOM_TYPES, e.g.
+        'Entire home/apt' to 'entire home'. No rows are dropped; unknown labels are kept.
+    3. Fills missing values in the 'total_reviews' column with 0 and keeps it in its compact load_data dtype (LISTING_DTYPES).
 
     Parameters:
          df (pandas.DataFrame): The input DataFrame containing Airbnb listings data.
+         copy (bool, optional): If True, `df` is left unchanged; if False, it is cleaned in place.
+             Defaults to True.
+         validation (validation.Validator, optional): Checks for repeated 'id_listing_anon' values,
+             which every join resolves to the listing's first row (see src/enrich.py);
+             quarantining them drops the later rows here too.
+             Defaults to None.
 
     Returns:
-         pandas.DataFrame: The cleaned and filtered DataFrame.
+         pandas.DataFrame: The cleaned DataFrame, with the same rows as `df` (unless quarantined).
     """
-    df['room_type'] = df['room_type'].str.strip().str.lower()
-    df = df[df['room_type'].isin(['entire home', 'private room', 'shared room'])]
-    df['total_reviews'] = df['total_reviews'].fillna(0).astype(int)
+    if copy:
+        df = df.copy(deep=False)
+    df['room_type'] = _normalize_labels(df['room_type'], ROOM_TYPES)
+    df['total_reviews'] = df['total_reviews'].fillna(0).astype(LISTING_DTYPES['total_reviews'])
+    if validation is not None:
+        validation.check('duplicate_listing_id', df['id_listing_anon'].duplicated().to_numpy(), df['id_listing_anon'])
+        df = validation.finish('listings', df)
     return df
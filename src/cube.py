@@ -0,0 +1,221 @@
+# src/cube.py
+#
+# Dense funnel cube: one pass over a cleaned contacts frame (or fact table) counts inquiries
+# per (dimension values..., funnel_stage) into a compact NumPy array. Every groupby in
+# metrics.py and funnel_analysis.py, and any new combination of the cube dimensions, is then
+# a sum over some axes of that array instead of a rescan of the rows.
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import FUNNEL_STAGES, Aggregates
+
+CUBE_DIMENSIONS = ('contact_channel_first', 'guest_user_stage_first', 'room_type', 'listing_neighborhood')
+
+MEASURES = (
+    'replies', 'acceptances',
+    'response_hours_sum', 'response_hours_count',
+    'accept_hours_sum', 'accept_hours_count',
+)
+
+MAX_CELLS = 50_000_000
+
+
+def _measure_weights(df):
+    """
+    Per-row contributions of every measure, as float64 arrays.
+    """
+    response = df['response_time_hours'].to_numpy(dtype=float, na_value=np.nan)
+    accept = df['accept_time_hours'].to_numpy(dtype=float, na_value=np.nan)
+    return {
+        'replies': df['ts_reply_at_first'].notna().to_numpy(dtype=float),
+        'acceptances': df['ts_accepted_at_first'].notna().to_numpy(dtype=float),
+        'response_hours_sum': np.nan_to_num(response),
+        'response_hours_count': (~np.isnan(response)).astype(float),
+        'accept_hours_sum': np.nan_to_num(accept),
+        'accept_hours_count': (~np.isnan(accept)).astype(float),
+    }
+
+
+class FunnelCube(Aggregates):
+    """
+    Inquiry counts and measures over a fixed set of dimensions.
+
+    Each dimension axis has one slot per observed label plus a trailing slot for missing values,
+    so rollups over other dimensions still count those rows while tallies of the dimension
+    itself exclude them (matching groupby's default of dropping NaN keys).
+
+    Attributes:
+        dimensions (tuple of str): Dimension names, in axis order.
+        labels (list of pd.Index): Observed labels of each dimension.
+        counts (np.ndarray): int64 inquiry counts, shape (*dimension sizes + 1, len(FUNNEL_STAGES)).
+        measures (dict of str -> np.ndarray): float64 sums of each entry of MEASURES, shaped
+            like `counts` without the stage axis.
+    """
+
+    def __init__(self, dimensions, labels, counts, measures):
+        self.dimensions = tuple(dimensions)
+        self.labels = list(labels)
+        self.counts = counts
+        self.measures = measures
+
+    @classmethod
+    def from_frame(cls, df, dimensions=CUBE_DIMENSIONS):
+        """
+        Builds the cube in a single pass over a cleaned contacts frame or fact table.
+
+        Parameters:
+            df (pd.DataFrame): Output of clean_contacts or enrich.build_fact_table.
+            dimensions (iterable of str, optional): Columns to use as cube axes. Columns missing
+                from `df` are skipped. Defaults to CUBE_DIMENSIONS.
+
+        Returns:
+            FunnelCube: The cube of `df`.
+        """
+        dimensions = [d for d in dimensions if d in df.columns]
+        labels, codes = [], []
+        for dimension in dimensions:
+            dimension_codes, uniques = pd.factorize(df[dimension], sort=True)
+            dimension_codes[dimension_codes < 0] = len(uniques)
+            labels.append(pd.Index(np.asarray(uniques, dtype=object), name=dimension))
+            codes.append(dimension_codes)
+
+        shape = tuple(len(index) + 1 for index in labels)
+        if np.prod(shape, dtype=np.int64) * len(FUNNEL_STAGES) > MAX_CELLS:
+            raise ValueError(f'Cube over {dimensions} would have more than {MAX_CELLS:,} cells')
+
+        cells = np.ravel_multi_index(codes, shape) if codes else np.zeros(len(df), dtype=np.intp)
+        n_cells = int(np.prod(shape, dtype=np.int64))
+        stage_codes = pd.Categorical(df['funnel_stage'], categories=FUNNEL_STAGES).codes
+        counts = np.bincount(
+            cells * len(FUNNEL_STAGES) + stage_codes,
+            minlength=n_cells * len(FUNNEL_STAGES),
+        ).reshape(shape + (len(FUNNEL_STAGES),))
+        measures = {
+            name: np.bincount(cells, weights=weights, minlength=n_cells).reshape(shape)
+            for name, weights in _measure_weights(df).items()
+        }
+        return cls(dimensions, labels, counts.astype(np.int64), measures)
+
+    def merge(self, other):
+        """
+        Adds two cubes over the same dimensions, aligning their labels.
+
+        Parameters:
+            other (FunnelCube): Cube of a disjoint set of rows.
+
+        Returns:
+            FunnelCube: A new cube covering the rows of both inputs.
+        """
+        if self.dimensions != other.dimensions:
+            raise ValueError(f'Cannot merge cubes over {self.dimensions} and {other.dimensions}')
+        labels = [mine.union(theirs) for mine, theirs in zip(self.labels, other.labels)]
+        shape = tuple(len(index) + 1 for index in labels)
+        counts = np.zeros(shape + (len(FUNNEL_STAGES),), dtype=np.int64)
+        measures = {name: np.zeros(shape) for name in MEASURES}
+        for cube in (self, other):
+            # Map each source slot to its slot in the union, keeping 'missing' last
+            slots = np.ix_(*[
+                np.append(union.get_indexer(index), len(union))
+                for union, index in zip(labels, cube.labels)
+            ])
+            counts[slots] += cube.counts
+            for name in MEASURES:
+                measures[name][slots] += cube.measures[name]
+        return FunnelCube(self.dimensions, labels, counts, measures)
+
+    __add__ = merge
+
+    def slice(self, **filters):
+        """
+        Restricts the cube to some labels of one or more dimensions.
+
+        Parameters:
+            **filters: Dimension name -> label or list of labels to keep,
+                e.g. slice(contact_channel_first='instant_book').
+
+        Returns:
+            FunnelCube: A cube with the same dimensions covering only the matching inquiries.
+        """
+        counts, measures = self.counts, dict(self.measures)
+        labels = list(self.labels)
+        for dimension, values in filters.items():
+            axis = self.dimensions.index(dimension)
+            values = [values] if np.isscalar(values) else list(values)
+            positions = labels[axis].get_indexer(values)
+            positions = positions[positions >= 0]
+            labels[axis] = labels[axis][positions]
+            keep = np.append(positions, counts.shape[axis] - 1)
+            counts = np.take(counts, keep, axis=axis)
+            for name in MEASURES:
+                measures[name] = np.take(measures[name], keep, axis=axis)
+            # Rows with a missing label never match an explicit filter
+            index = [slice(None)] * counts.ndim
+            index[axis] = -1
+            counts[tuple(index)] = 0
+            for name in MEASURES:
+                measures[name][tuple(index[:-1])] = 0
+        return FunnelCube(self.dimensions, labels, counts, measures)
+
+    def rollup(self, dimensions):
+        """
+        Sums the cube down to a subset of its dimensions.
+
+        Parameters:
+            dimensions (str or list of str): Dimensions to keep.
+
+        Returns:
+            pd.DataFrame: One row per observed label combination (missing labels and empty
+            combinations excluded), with one count column per funnel stage followed by the MEASURES.
+        """
+        dimensions = [dimensions] if isinstance(dimensions, str) else list(dimensions)
+        axes = [self.dimensions.index(d) for d in dimensions]
+        other_axes = tuple(i for i in range(len(self.dimensions)) if i not in axes)
+
+        counts = self.counts.sum(axis=other_axes)[(slice(-1),) * len(axes)]
+        measures = {
+            name: self.measures[name].sum(axis=other_axes)[(slice(-1),) * len(axes)]
+            for name in MEASURES
+        }
+        # Summing keeps the remaining axes in cube order; transpose them to the requested order
+        order = [sorted(axes).index(axis) for axis in axes]
+        counts = counts.transpose(order + [len(axes)])
+        measures = {name: values.transpose(order) for name, values in measures.items()}
+
+        if len(dimensions) == 1:
+            index = self.labels[axes[0]]
+        else:
+            index = pd.MultiIndex.from_product([self.labels[a] for a in axes], names=dimensions)
+        frame = pd.DataFrame(counts.reshape(-1, len(FUNNEL_STAGES)), index=index, columns=FUNNEL_STAGES)
+        for name in MEASURES:
+            frame[name] = measures[name].reshape(-1)
+        frame.columns.name = None
+        return frame[frame[FUNNEL_STAGES].sum(axis=1) > 0]
+
+    @property
+    def totals(self):
+        sums = {name: float(values.sum()) for name, values in self.measures.items()}
+        stage_totals = self.counts.reshape(-1, len(FUNNEL_STAGES)).sum(axis=0)
+        return {
+            'rows': int(stage_totals.sum()),
+            'booked': int(stage_totals[FUNNEL_STAGES.index('booked')]),
+            'replied': int(sums['replies']),
+            'accepted': int(sums['acceptances']),
+            'response_hours_sum': sums['response_hours_sum'],
+            'response_hours_count': int(sums['response_hours_count']),
+            'accept_hours_sum': sums['accept_hours_sum'],
+            'accept_hours_count': int(sums['accept_hours_count']),
+        }
+
+    def stage_counts(self):
+        values = self.counts.reshape(-1, len(FUNNEL_STAGES)).sum(axis=0)
+        return pd.Series(values, index=pd.Index(FUNNEL_STAGES, name='funnel_stage'), dtype='int64')
+
+    def has_column(self, column):
+        columns = [column] if isinstance(column, str) else column
+        return all(c in self.dimensions for c in columns)
+
+    def tally(self, column):
+        tally = self.rollup(column)[FUNNEL_STAGES]
+        tally.columns.name = 'funnel_stage'
+        return tally
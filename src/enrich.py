@@ -0,0 +1,120 @@
+# src/enrich.py
+#
+# Builds the denormalized contacts x listings x users fact table once, so the funnel, metric
+# and plot functions can group on listing and guest attributes without re-merging.
+#
+# Duplicate keys: every join of a dimension table (listings on 'id_listing_anon', users on
+# 'id_user_anon') onto inquiries uses the FIRST row of each key, through first_rows, and
+# lookup is the hash join the other modules reuse for it (segmentation joins its labels with
+# it too). The fact table, attach_listings, the per-listing roll-up of aggregates in
+# funnel_analysis and the DuckDB backend's join all follow the rule, so one inquiry always counts once and a repeated
+# listing id cannot inflate a rate in one path but not another. clean_listings and
+# clean_users can report or quarantine such repeats (src/validation.py).
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+
+from src.profiling import instrument
+
+LISTING_COLUMNS = ['room_type', 'listing_neighborhood', 'total_reviews']
+
+USER_COLUMNS = ['country', 'words_in_user_profile', 'has_profile']
+
+
+def first_rows(table, key_column):
+    """
+    Returns `table` with only the first row of each value of `key_column`.
+    """
+    return table.drop_duplicates(subset=key_column, keep='first')
+
+
+def lookup(keys, table, key_column, columns):
+    """
+    Looks up `columns` of `table` for each value in `keys`, hashing both key columns once.
+
+    Duplicate keys in `table` keep their first row (as in first_rows), so the result has exactly
+    one row per key and never fans out the caller's frame. Keys with no match, including
+    missing keys, get missing values.
+
+    Parameters:
+        keys (pd.Series): Join keys, one per output row.
+        table (pd.DataFrame): Dimension table holding `key_column` and `columns`.
+        key_column (str): Name of the key column in `table`.
+        columns (list of str): Columns to fetch.
+
+    Returns:
+        pd.DataFrame: The fetched columns, aligned to the index of `keys`.
+    """
+    # One factorization over both sides gives every key value a code; the table row of a code
+    # is its first occurrence (assigned in reverse so earlier rows win), -1 if it has none
+    codes, uniques = pd.factorize(pd.concat([keys, table[key_column]], ignore_index=True))
+    key_codes, table_codes = codes[:len(keys)], codes[len(keys):]
+    matched = np.flatnonzero(table_codes >= 0)[::-1]
+    positions = np.full(len(uniques) + 1, -1, dtype=np.intp)
+    positions[table_codes[matched]] = matched
+    rows = positions[key_codes]
+    return pd.DataFrame(
+        {column: take(table[column].array, rows, allow_fill=True) for column in columns},
+        index=keys.index,
+    )
+
+
+@instrument(preserves_rows=True)
+def build_fact_table(df_contacts, df_listings, df_users=None):
+    """
+    Joins listing and guest attributes onto every inquiry.
+
+    Listings are joined on 'id_listing_anon' and users on 'id_guest_anon' = 'id_user_anon'.
+    The fact table has exactly one row per inquiry: if a dimension table repeats a key, its
+    first row is used rather than duplicating inquiries.
+
+    Parameters:
+        df_contacts (pd.DataFrame): Cleaned contacts DataFrame.
+        df_listings (pd.DataFrame): Cleaned listings DataFrame.
+        df_users (pd.DataFrame, optional): Cleaned users DataFrame. If None, no guest
+            attributes are added. Defaults to None.
+
+    Returns:
+        pd.DataFrame: A copy of `df_contacts` with the LISTING_COLUMNS and USER_COLUMNS added
+        (columns already present in `df_contacts` are left untouched).
+    """
+    parts = [df_contacts]
+
+    listing_columns = [c for c in LISTING_COLUMNS if c in df_listings.columns and c not in df_contacts.columns]
+    if listing_columns:
+        parts.append(lookup(df_contacts['id_listing_anon'], df_listings, 'id_listing_anon', listing_columns))
+
+    if df_users is not None:
+        user_columns = [c for c in USER_COLUMNS if c in df_users.columns and c not in df_contacts.columns]
+        if user_columns:
+            parts.append(lookup(df_contacts['id_guest_anon'], df_users, 'id_user_anon', user_columns))
+
+    return pd.concat(parts, axis=1)
+
+
+@instrument(preserves_rows=True)
+def attach_listings(df_contacts, df_listings, columns):
+    """
+    Returns a frame holding the requested listing `columns` for every inquiry.
+
+    If `df_contacts` is already a fact table carrying those columns it is returned as is;
+    otherwise the missing columns are looked up in `df_listings` by 'id_listing_anon', with
+    the same first-row rule for repeated listing ids as build_fact_table.
+
+    Parameters:
+        df_contacts (pd.DataFrame): Cleaned contacts DataFrame or fact table.
+        df_listings (pd.DataFrame or None): Cleaned listings DataFrame. May be None when
+            `df_contacts` is a fact table.
+        columns (list of str): Listing columns the caller needs.
+
+    Returns:
+        pd.DataFrame: `df_contacts`, or a copy of it with the missing columns added.
+    """
+    missing = [column for column in columns if column not in df_contacts.columns]
+    if not missing:
+        return df_contacts
+    if df_listings is None:
+        raise ValueError(f'df_listings is required: contacts frame has no {missing} columns')
+    return pd.concat([df_contacts, lookup(df_contacts['id_listing_anon'], df_listings, 'id_listing_anon', missing)],
+                     axis=1)
@@ -1,8 +1,65 @@
 # src/funnel_analysis.py
+#
+# Like src/metrics.py, every function accepts a cleaned contacts DataFrame or pre-aggregated
+# data: ContactAggregates from src/aggregates.py or a FunnelCube from src/cube.py. The listings
+# frame is still needed to roll per-listing tallies up to room type and neighborhood, unless
+# the aggregates were built from a fact table and already carry those columns. As there,
+# `backend` selects 'pandas' or 'duckdb' (see src/backend.py) for frames and file paths.
+# funnel_by_segment groups on the guest and listing segments of src/segmentation.py.
+# conversion_intervals and conversion_significance add confidence intervals and pairwise
+# tests (src/significance.py) to the booking rate per value of any grouping column.
 
 import pandas as pd
 
-def get_funnel_stage_distribution(df, normalize=True):
+from src.aggregates import FUNNEL_STAGES, is_aggregate
+from src.backend import resolve
+from src.enrich import LISTING_COLUMNS, attach_listings, lookup
+from src.metrics import conversion_by_user_stage
+from src.profiling import instrument, span
+from src.significance import pairwise_tests, rate_table, wilson_interval
+
+
+def _listing_counts(aggregates, df_listings, column):
+    """
+    Rolls per-listing inquiry counts up to a listings column.
+
+    Each listing id takes the value of its first listings row, as in the row-level join (see
+    src/enrich.py), so the resulting rates are identical.
+
+    Raises:
+        ValueError: If the aggregates have neither `column` nor an 'id_listing_anon' axis to
+            roll up, or `df_listings` is missing.
+    """
+    if aggregates.has_column(column):
+        return aggregates.group_counts(column)
+    if not aggregates.has_column('id_listing_anon'):
+        raise ValueError(f"Aggregates have neither a '{column}' nor an 'id_listing_anon' axis; "
+                         f"include one of them to group by '{column}'")
+    if df_listings is None:
+        raise ValueError(f"df_listings is required: aggregates have no '{column}' axis")
+    counts = aggregates.group_counts('id_listing_anon')
+    with span('funnel_analysis.listing_merge', rows_in=len(counts), preserves_rows=True) as stage:
+        labels = lookup(counts.index.to_series(), df_listings, 'id_listing_anon', [column])[column]
+        stage.output(labels)
+    return counts.groupby(labels, observed=True)[['count', 'booked']].sum()
+
+
+def _booking_counts(df_contacts, column, df_listings=None):
+    """
+    'count' and 'booked' inquiries per value of `column`, for a frame or aggregates.
+    """
+    if is_aggregate(df_contacts):
+        if column in LISTING_COLUMNS:
+            return _listing_counts(df_contacts, df_listings, column)
+        return df_contacts.group_counts(column)
+    if column in LISTING_COLUMNS:
+        df_contacts = attach_listings(df_contacts, df_listings, [column])
+    counts = df_contacts.groupby(column, observed=True)['booking_happened'].agg(['count', 'sum'])
+    return counts.rename(columns={'sum': 'booked'})
+
+
+@instrument()
+def get_funnel_stage_distribution(df, normalize=True, backend=None):
     """
     Calculates the distribution of values in the 'funnel_stage' column of a DataFrame.
 
@@ -10,14 +67,23 @@ def get_funnel_stage_distribution(df, normalize=True):
         df (pandas.DataFrame): The input DataFrame containing a 'funnel_stage' column.
         normalize (bool, optional): If True, returns the relative frequencies of the unique values.
                                     If False, returns the absolute counts. Default is True.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to backend.get_backend().
 
     Returns:
         pandas.Series: A Series containing the counts or relative frequencies of each unique value in 'funnel_stage'.
     """
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        counts = df.stage_counts()
+        counts = counts[counts > 0].sort_values(ascending=False)
+        if normalize:
+            return (counts / counts.sum()).rename('proportion')
+        return counts.rename('count')
     return df['funnel_stage'].value_counts(normalize=normalize)
 
 
-def funnel_by_contact_channel(df):
+@instrument()
+def funnel_by_contact_channel(df, backend=None):
     """
     Generates a funnel analysis table by contact channel and funnel stage.
 
@@ -27,67 +93,182 @@ def funnel_by_contact_channel(df):
     Parameters:
         df (pandas.DataFrame): The input DataFrame containing at least the columns
             'contact_channel_first' and 'funnel_stage'.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to backend.get_backend().
 
     Returns:
         pandas.DataFrame: A DataFrame where each row corresponds to a contact channel,
             each column to a funnel stage, and values represent the proportion of entries
             in each stage for that channel.
     """
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        counts = df.tally('contact_channel_first')
+        counts = counts.loc[counts.sum(axis=1) > 0, counts.sum() > 0].sort_index(axis=1)
+        return counts.div(counts.sum(axis=1), axis=0)
     funnel = pd.crosstab(df['contact_channel_first'], df['funnel_stage'], normalize='index')
     return funnel
 
 
-def funnel_by_guest_user_stage(df):
+@instrument()
+def funnel_by_guest_user_stage(df, backend=None):
     """
     Calculates the booking conversion rate for each guest user stage.
 
     Groups the input DataFrame by the 'guest_user_stage_first' column and computes the mean of the 'booking_happened' column for each group, representing the conversion rate (i.e., the proportion of bookings that happened) at each stage. The results are sorted in descending order of conversion rate.
+    This is the same computation as metrics.conversion_by_user_stage and delegates to it.
 
     Parameters:
         df (pandas.DataFrame): DataFrame containing at least the columns 'guest_user_stage_first' and 'booking_happened'.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to backend.get_backend().
 
     Returns:
         pandas.Series: Conversion rates indexed by guest user stage, sorted in descending order.
     """
-    return df.groupby('guest_user_stage_first')['booking_happened'].mean().sort_values(ascending=False)
+    return conversion_by_user_stage(df, backend)
 
 
-def funnel_by_room_type(df_contacts, df_listings):
+@instrument()
+def funnel_by_room_type(df_contacts, df_listings=None, backend=None):
     """
     Calculates the booking conversion rate by room type.
 
     This function merges the contacts and listings DataFrames on the 'id_listing_anon' column,
     then groups the resulting DataFrame by 'room_type' and computes the mean of the 'booking_happened'
     column for each room type. The result is a Series with room types as the index and their corresponding
-    booking conversion rates, sorted in descending order.
+    booking conversion rates, sorted in descending order. If `df_contacts` is a fact table from
+    enrich.build_fact_table, the merge is skipped and `df_listings` may be omitted.
 
     Parameters:
         df_contacts (pd.DataFrame): DataFrame containing contact/booking information, must include 'id_listing_anon' and 'booking_happened' columns.
-        df_listings (pd.DataFrame): DataFrame containing listing information, must include 'id_listing_anon' and 'room_type' columns.
+        df_listings (pd.DataFrame, optional): DataFrame containing listing information, must include 'id_listing_anon' and 'room_type' columns.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to backend.get_backend().
 
     Returns:
         pd.Series: Booking conversion rates by room type, sorted in descending order.
     """
-    df = df_contacts.merge(df_listings, on='id_listing_anon', how='left')
-    return df.groupby('room_type')['booking_happened'].mean().sort_values(ascending=False)
+    df_contacts = resolve(df_contacts, backend, df_listings)
+    if is_aggregate(df_contacts):
+        counts = _listing_counts(df_contacts, df_listings, 'room_type')
+        return (counts['booked'] / counts['count']).rename('booking_happened').sort_values(ascending=False)
+    df = attach_listings(df_contacts, df_listings, ['room_type'])
+    return df.groupby('room_type', observed=True)['booking_happened'].mean().sort_values(ascending=False)
 
 
-def funnel_by_neighborhood(df_contacts, df_listings, min_inquiries=50):
+@instrument()
+def funnel_by_neighborhood(df_contacts, df_listings=None, min_inquiries=50, backend=None, confidence=None):
     """
     Analyzes the booking funnel by neighborhood, calculating the booking conversion rate and inquiry count for each neighborhood.
+    The listings merge is skipped when `df_contacts` is already a fact table from enrich.build_fact_table.
+    With `confidence`, small neighborhoods can be kept (e.g. min_inquiries=1) and judged by their interval width instead.
 
     Parameters:
         df_contacts (pd.DataFrame): DataFrame containing contact/inquiry data, including 'id_listing_anon' and 'booking_happened' columns.
-        df_listings (pd.DataFrame): DataFrame containing listing details, including 'id_listing_anon' and 'listing_neighborhood' columns.
+        df_listings (pd.DataFrame, optional): DataFrame containing listing details, including 'id_listing_anon' and 'listing_neighborhood' columns.
         min_inquiries (int, optional): Minimum number of inquiries required for a neighborhood to be included in the results. Defaults to 50.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to backend.get_backend().
+        confidence (float, optional): If given, e.g. 0.95, adds the Wilson interval of each rate. Defaults to None.
 
     Returns:
         pd.DataFrame: DataFrame indexed by 'listing_neighborhood', with columns:
             - 'mean': The mean booking conversion rate (fraction of inquiries resulting in bookings).
             - 'count': The number of inquiries in each neighborhood.
+            - 'low', 'high': Bounds of the confidence interval of 'mean', only with `confidence`.
         The DataFrame is sorted by conversion rate in descending order.
     """
-    df = df_contacts.merge(df_listings, on='id_listing_anon', how='left')
-    grouped = df.groupby('listing_neighborhood')['booking_happened'].agg(['mean', 'count'])
+    df_contacts = resolve(df_contacts, backend, df_listings)
+    if is_aggregate(df_contacts):
+        counts = _listing_counts(df_contacts, df_listings, 'listing_neighborhood')
+        grouped = pd.DataFrame({'mean': counts['booked'] / counts['count'], 'count': counts['count']})
+    else:
+        df = attach_listings(df_contacts, df_listings, ['listing_neighborhood'])
+        grouped = df.groupby('listing_neighborhood', observed=True)['booking_happened'].agg(['mean', 'count'])
     grouped = grouped[grouped['count'] >= min_inquiries]
+    if confidence is not None:
+        booked = (grouped['mean'] * grouped['count']).round()
+        grouped['low'], grouped['high'] = wilson_interval(booked, grouped['count'], confidence)
     return grouped.sort_values(by='mean', ascending=False)
+
+
+@instrument()
+def funnel_by_segment(df, column='guest_segment', min_inquiries=0, backend=None):
+    """
+    Funnel stage mix and booking conversion rate per segment.
+
+    Parameters:
+        df (pandas.DataFrame): Contacts with a segment column, e.g. from segmentation.assign_segments,
+            or aggregates built with that column as a group column.
+        column (str, optional): 'guest_segment', 'listing_segment' or any other grouping column.
+            Defaults to 'guest_segment'.
+        min_inquiries (int, optional): Minimum number of inquiries for a segment to be included. Defaults to 0.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to backend.get_backend().
+
+    Returns:
+        pd.DataFrame: DataFrame indexed by segment, with the share of inquiries in each funnel stage,
+            'mean' (the booking conversion rate) and 'count' (the number of inquiries),
+            sorted by conversion rate in descending order.
+    """
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        counts = df.tally(column)
+    else:
+        counts = df.groupby([column, 'funnel_stage'], observed=True).size().unstack(fill_value=0)
+        counts = counts.reindex(columns=FUNNEL_STAGES, fill_value=0)
+    total = counts.sum(axis=1)
+    grouped = counts.div(total, axis=0)
+    grouped['mean'] = grouped['booked']
+    grouped['count'] = total
+    grouped = grouped[grouped['count'] >= max(min_inquiries, 1)]
+    return grouped.sort_values(by='mean', ascending=False)
+
+
+@instrument()
+def conversion_intervals(df_contacts, column, df_listings=None, confidence=0.95, method='wilson', min_inquiries=0,
+                         backend=None, **bootstrap_options):
+    """
+    Booking conversion rate per value of `column` with its confidence interval.
+
+    Parameters:
+        df_contacts (pd.DataFrame): Cleaned contacts, fact table or aggregates.
+        column (str): Grouping column, e.g. 'contact_channel_first', 'guest_user_stage_first',
+            'room_type', 'listing_neighborhood' or 'guest_segment'.
+        df_listings (pd.DataFrame, optional): Cleaned listings, needed for 'room_type' and
+            'listing_neighborhood' unless `df_contacts` already carries them.
+        confidence (float, optional): Confidence level. Defaults to 0.95.
+        method (str, optional): 'wilson' or 'bootstrap'. Defaults to 'wilson'.
+        min_inquiries (int, optional): Groups with fewer inquiries are left out. Defaults to 0.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to backend.get_backend().
+        **bootstrap_options: resamples, seed and workers, see significance.bootstrap_interval.
+
+    Returns:
+        pd.DataFrame: 'mean', 'count', 'low' and 'high' indexed by the values of `column`,
+        sorted by conversion rate in descending order.
+    """
+    df_contacts = resolve(df_contacts, backend, df_listings)
+    counts = _booking_counts(df_contacts, column, df_listings)
+    counts = counts[counts['count'] >= max(min_inquiries, 1)]
+    table = rate_table(counts['booked'], counts['count'], confidence=confidence, method=method, **bootstrap_options)
+    return table.sort_values(by='mean', ascending=False)
+
+
+@instrument()
+def conversion_significance(df_contacts, column, df_listings=None, alpha=0.05, correction='holm', min_inquiries=0,
+                            backend=None):
+    """
+    Tests every pair of values of `column` for a difference in booking conversion rate.
+
+    Parameters:
+        df_contacts (pd.DataFrame): Cleaned contacts, fact table or aggregates.
+        column (str): Grouping column, as in conversion_intervals.
+        df_listings (pd.DataFrame, optional): Cleaned listings, as in conversion_intervals.
+        alpha (float, optional): Significance level of the adjusted p-values. Defaults to 0.05.
+        correction (str, optional): 'holm' (family-wise over all pairs) or None. Defaults to 'holm'.
+        min_inquiries (int, optional): Groups with fewer inquiries are left out. Defaults to 0.
+        backend (str, optional): 'pandas' or 'duckdb'. Defaults to backend.get_backend().
+
+    Returns:
+        pd.DataFrame: One row per pair of groups, see significance.pairwise_tests.
+    """
+    df_contacts = resolve(df_contacts, backend, df_listings)
+    counts = _booking_counts(df_contacts, column, df_listings)
+    counts = counts[counts['count'] >= max(min_inquiries, 1)]
+    return pairwise_tests(counts['booked'], counts['count'], alpha=alpha, correction=correction)
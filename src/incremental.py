@@ -0,0 +1,148 @@
+# src/incremental.py
+#
+# Persisted, incrementally updated metric state for append-only daily contact drops.
+# Each batch only touches its own rows: new inquiries are merged into the running
+# ContactAggregates, and inquiries seen before (e.g. a booking timestamp filled in later)
+# first have their previous contribution retracted. The ledger of contributions is kept
+# as the frames of the batches themselves plus a dict from inquiry key to (batch, row), so
+# finding and retracting repeats costs time in the size of the batch, not of the history.
+
+import os
+import pickle
+from itertools import repeat
+
+import pandas as pd
+
+from src.aggregates import DEFAULT_GROUP_COLUMNS, ContactAggregates
+from src.clean_data import clean_contacts
+
+# An inquiry is one guest's first contact about one listing
+INQUIRY_KEY = ('id_guest_anon', 'id_listing_anon', 'ts_interaction_first')
+
+# Columns ContactAggregates.from_frame reads, besides the group columns
+_CONTRIBUTION_COLUMNS = [
+    'ts_reply_at_first', 'ts_accepted_at_first', 'booking_happened',
+    'response_time_hours', 'accept_time_hours', 'funnel_stage',
+]
+
+
+class IncrementalContactMetrics:
+    """
+    Running aggregates over every contacts batch applied so far.
+
+    `aggregates` can be passed to any function in metrics.py or funnel_analysis.py. To allow
+    late-arriving updates, the ledger keeps each inquiry's contribution (its key, group values,
+    stage flags and durations, not the full row) so it can be retracted when the inquiry shows
+    up again in a later batch: `chunks` holds one contributions frame per batch and `ledger`
+    maps each inquiry key to its current (chunk, row). Replaced rows stay in their chunk until
+    they outnumber the live ones, when the chunks are compacted into one.
+
+    Parameters:
+        group_columns (iterable of str, optional): Columns to keep per-group tallies for.
+            Defaults to DEFAULT_GROUP_COLUMNS.
+        key (iterable of str, optional): Columns identifying an inquiry. Defaults to INQUIRY_KEY.
+    """
+
+    def __init__(self, group_columns=DEFAULT_GROUP_COLUMNS, key=INQUIRY_KEY):
+        self.group_columns = tuple(group_columns)
+        self.key = list(key)
+        self.aggregates = ContactAggregates()
+        self.ledger = {}
+        self.chunks = []
+        self.replaced = 0
+        self.batches = 0
+
+    def _keys(self, frame):
+        """
+        Hashable inquiry keys of the rows of `frame` (timestamps as int64 nanoseconds).
+        """
+        columns = []
+        for column in self.key:
+            values = frame[column]
+            if pd.api.types.is_datetime64_any_dtype(values.dtype):
+                columns.append(values.to_numpy(dtype='datetime64[ns]').view('i8').tolist())
+            else:
+                columns.append(values.tolist())
+        return list(zip(*columns))
+
+    def _rows(self, locations):
+        """
+        The ledger rows at `locations`, a list of (chunk, row) pairs.
+        """
+        locations = pd.DataFrame(locations, columns=['chunk', 'row'])
+        frames = [self.chunks[chunk].take(rows.to_numpy()) for chunk, rows in locations.groupby('chunk')['row']]
+        return pd.concat(frames, ignore_index=True)
+
+    def _compact(self):
+        """
+        Rewrites the chunks as one frame of the live rows, dropping replaced ones.
+        """
+        live = self._rows(list(self.ledger.values())) if self.ledger else self.chunks[0].iloc[:0]
+        self.chunks = [live]
+        self.ledger = dict(zip(self._keys(live), zip(repeat(0), range(len(live)))))
+        self.replaced = 0
+
+    def update(self, batch):
+        """
+        Applies one batch of raw contacts rows.
+
+        Rows whose key was seen in an earlier batch replace that inquiry's previous version;
+        within a batch the last row per key wins.
+
+        Parameters:
+            batch (pd.DataFrame): Raw contacts rows, as returned by load_data.load_contacts.
+
+        Returns:
+            IncrementalContactMetrics: self, to allow chaining.
+        """
+        batch = clean_contacts(batch)
+        batch = batch.drop_duplicates(subset=self.key, keep='last')
+        columns = self.key + [c for c in self.group_columns if c not in self.key] + _CONTRIBUTION_COLUMNS
+        contributions = batch[[c for c in columns if c in batch.columns]].reset_index(drop=True)
+        keys = self._keys(contributions)
+
+        previous = [location for location in map(self.ledger.get, keys) if location is not None]
+        if previous:
+            self.aggregates = self.aggregates.retract(
+                ContactAggregates.from_frame(self._rows(previous), self.group_columns))
+            self.replaced += len(previous)
+        self.ledger.update(zip(keys, zip(repeat(len(self.chunks)), range(len(keys)))))
+        self.chunks.append(contributions)
+        if self.replaced > len(self.ledger):
+            self._compact()
+
+        self.aggregates = self.aggregates.merge(ContactAggregates.from_frame(contributions, self.group_columns))
+        self.batches += 1
+        return self
+
+    def save(self, path):
+        """
+        Persists the state to `path` (written atomically).
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as handle:
+            pickle.dump(self, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, group_columns=None, key=INQUIRY_KEY):
+        """
+        Loads state saved with `save`, or returns a fresh instance if `path` does not exist.
+
+        Parameters:
+            path (str): File written by `save`.
+            group_columns (iterable of str, optional): Group columns of a fresh instance, and
+                the ones the saved state must have been built with. Defaults to the saved
+                ones, or DEFAULT_GROUP_COLUMNS for a fresh instance.
+            key (iterable of str, optional): Inquiry key of a fresh instance. Defaults to INQUIRY_KEY.
+
+        Raises:
+            ValueError: If the saved state tallies other group columns than `group_columns`.
+        """
+        if not os.path.exists(path):
+            return cls(DEFAULT_GROUP_COLUMNS if group_columns is None else group_columns, key)
+        with open(path, 'rb') as handle:
+            state = pickle.load(handle)
+        if group_columns is not None and tuple(group_columns) != state.group_columns:
+            raise ValueError(f'{path} tallies {state.group_columns}, not {tuple(group_columns)}')
+        return state
@@ -2,32 +2,86 @@
 
 import pandas as pd
 
-def load_contacts(path='data/contacts.csv'):
+from src.profiling import instrument
+
+CONTACT_DATE_COLUMNS = [
+    'ts_interaction_first', 'ts_reply_at_first',
+    'ts_accepted_at_first', 'ts_booking_at',
+    'ds_checkin_first', 'ds_checkout_first'
+]
+
+# Declared dtypes: categoricals for low-cardinality labels, nullable small integers for
+# counts (they may contain missing values in raw exports).
+CONTACT_DTYPES = {
+    'contact_channel_first': 'category',
+    'guest_user_stage_first': 'category',
+    'm_guests': 'Int16',
+    'm_interactions': 'Int32',
+    'm_first_message_length_in_characters': 'Int32',
+}
+
+LISTING_DTYPES = {
+    'room_type': 'category',
+    'listing_neighborhood': 'category',
+    'total_reviews': 'Int32',
+}
+
+USER_DTYPES = {
+    'country': 'category',
+    'words_in_user_profile': 'Int32',
+}
+
+# UUID keys, interned as categoricals when intern_ids=True
+ID_COLUMNS = {
+    'contacts': ['id_guest_anon', 'id_host_anon', 'id_listing_anon'],
+    'listings': ['id_listing_anon'],
+    'users': ['id_user_anon'],
+}
+
+def _schema(dtypes, dataset, intern_ids):
+    """
+    Build the read_csv dtype mapping for a dataset, optionally interning its UUID keys.
+    """
+    schema = dict(dtypes)
+    if intern_ids:
+        schema.update(dict.fromkeys(ID_COLUMNS[dataset], 'category'))
+    return schema
+
+@instrument()
+def load_contacts(path='data/contacts.csv', intern_ids=False):
     """
-    Load contacts.csv with datetime parsing.
+    Load contacts.csv with datetime parsing and the declared CONTACT_DTYPES.
     """
-    date_columns = [
-        'ts_interaction_first', 'ts_reply_at_first',
-        'ts_accepted_at_first', 'ts_booking_at',
-        'ds_checkin_first', 'ds_checkout_first'
-    ]
-    contacts = pd.read_csv(path, parse_dates=date_columns)
+    contacts = pd.read_csv(path, parse_dates=CONTACT_DATE_COLUMNS,
+                           dtype=_schema(CONTACT_DTYPES, 'contacts', intern_ids))
     return contacts
 
-def load_listings(path='data/listings.csv'):
+def iter_contacts(path='data/contacts.csv', chunksize=500_000, intern_ids=False):
     """
-    Load listings.csv.
+    Stream contacts.csv in chunks of `chunksize` rows, with the same parsing as load_contacts.
     """
-    listings = pd.read_csv(path)
+    with pd.read_csv(path, parse_dates=CONTACT_DATE_COLUMNS, chunksize=chunksize,
+                     dtype=_schema(CONTACT_DTYPES, 'contacts', intern_ids)) as reader:
+        for chunk in reader:
+            yield chunk
+
+@instrument()
+def load_listings(path='data/listings.csv', intern_ids=False):
+    """
+    Load listings.csv with the declared LISTING_DTYPES.
+    """
+    listings = pd.read_csv(path, dtype=_schema(LISTING_DTYPES, 'listings', intern_ids))
     return listings
 
-def load_users(path='data/users.csv'):
+@instrument()
+def load_users(path='data/users.csv', intern_ids=False):
     """
-    Load users.csv.
+    Load users.csv with the declared USER_DTYPES.
     """
-    users = pd.read_csv(path)
+    users = pd.read_csv(path, dtype=_schema(USER_DTYPES, 'users', intern_ids))
     return users
 
+@instrument()
 def load_all_data(contacts_path='data/contacts.csv',
                   listings_path='data/listings.csv',
                   users_path='data/users.csv'):
@@ -38,3 +92,23 @@ def load_all_data(contacts_path='data/contacts.csv',
     listings = load_listings(listings_path)
     users = load_users(users_path)
     return contacts, listings, users
+
+def memory_report(path, loader, **read_csv_kwargs):
+    """
+    Compare per-column memory of a plain pd.read_csv against a schema-aware loader.
+
+    Parameters:
+        path (str): CSV file to load.
+        loader (callable): One of the load_* functions, called as loader(path).
+        **read_csv_kwargs: Extra arguments for the plain pd.read_csv baseline, e.g. parse_dates.
+
+    Returns:
+        pd.DataFrame: Deep memory usage in bytes per column ('before', 'after') and the
+        'ratio' after/before, with a final 'total' row.
+    """
+    before = pd.read_csv(path, **read_csv_kwargs).memory_usage(deep=True)
+    after = loader(path).memory_usage(deep=True)
+    report = pd.DataFrame({'before': before, 'after': after})
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['after'] / report['before']
+    return report
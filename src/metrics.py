@@ -1,51 +1,89 @@
 # src/metrics.py
+#
+# Every function accepts either a cleaned contacts DataFrame or pre-aggregated data
+# (see src/aggregates.py), e.g. the result of streaming contacts.csv in chunks or a
+# FunnelCube from src/cube.py. The optional `backend` argument picks the engine for a frame
+# or a contacts file path: 'pandas' or 'duckdb' (see src/backend.py); by default the one set
+# with backend.set_backend.
 
 import pandas as pd
 
-def booking_rate(df):
+from src.aggregates import is_aggregate
+from src.backend import resolve
+from src.profiling import instrument
+
+@instrument()
+def booking_rate(df, backend=None):
     """
     Overall percentage of inquiries that result in a booking.
     """
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        return df.booking_rate()
     return df['booking_happened'].mean()
 
 
-def response_rate(df):
+@instrument()
+def response_rate(df, backend=None):
     """
     Percentage of inquiries that received a host reply.
     """
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        return df.response_rate()
     return df['ts_reply_at_first'].notna().mean()
 
 
-def acceptance_rate(df):
+@instrument()
+def acceptance_rate(df, backend=None):
     """
     Percentage of inquiries that were accepted by the host.
     """
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        return df.acceptance_rate()
     return df['ts_accepted_at_first'].notna().mean()
 
 
-def avg_response_time(df):
+@instrument()
+def avg_response_time(df, backend=None):
     """
     Average host response time in hours (excluding missing values).
     """
-    return df['response_time_hours'].dropna().mean()
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        return df.avg_response_time()
+    return float(df['response_time_hours'].dropna().mean())
 
 
-def avg_accept_time(df):
+@instrument()
+def avg_accept_time(df, backend=None):
     """
     Average time to acceptance in hours (excluding missing values).
     """
-    return df['accept_time_hours'].dropna().mean()
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        return df.avg_accept_time()
+    return float(df['accept_time_hours'].dropna().mean())
 
 
-def conversion_by_contact_channel(df):
+@instrument()
+def conversion_by_contact_channel(df, backend=None):
     """
     Booking conversion rate by contact method: contact_me, book_it, instant_book.
     """
-    return df.groupby('contact_channel_first')['booking_happened'].mean().sort_values(ascending=False)
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        return df.booking_rate_by('contact_channel_first').sort_values(ascending=False)
+    return df.groupby('contact_channel_first', observed=True)['booking_happened'].mean().sort_values(ascending=False)
 
 
-def conversion_by_user_stage(df):
+@instrument()
+def conversion_by_user_stage(df, backend=None):
     """
     Booking conversion rate for new users vs past bookers.
     """
-    return df.groupby('guest_user_stage_first')['booking_happened'].mean().sort_values(ascending=False)
+    df = resolve(df, backend)
+    if is_aggregate(df):
+        return df.booking_rate_by('guest_user_stage_first').sort_values(ascending=False)
+    return df.groupby('guest_user_stage_first', observed=True)['booking_happened'].mean().sort_values(ascending=False)
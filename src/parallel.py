@@ -0,0 +1,138 @@
+# src/parallel.py
+#
+# Process-pool execution of clean_contacts and the partial aggregations. The contacts frame is
+# split into partitions (by hash of the listing id or by inquiry month), each partition is
+# written once as an uncompressed Arrow IPC file that workers memory-map, and only the small
+# aggregates (or the path of a cleaned partition) travel back through pickling.
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import DEFAULT_GROUP_COLUMNS, ContactAggregates
+from src.cache import FRAME_EXTENSION, read_frame, write_frame
+from src.clean_data import clean_contacts
+
+
+def partition_contacts(df, n_partitions, by='listing'):
+    """
+    Splits contacts rows into partitions.
+
+    Parameters:
+        df (pd.DataFrame): Raw or cleaned contacts DataFrame.
+        n_partitions (int): Number of partitions to produce.
+        by (str, optional): 'listing' hashes 'id_listing_anon', so all inquiries for a listing
+            land together; 'month' keeps each inquiry month ('ts_interaction_first') together.
+            Defaults to 'listing'.
+
+    Returns:
+        list of np.ndarray: Row positions of each non-empty partition, in ascending order.
+    """
+    if by == 'listing':
+        keys = pd.util.hash_pandas_object(df['id_listing_anon'], index=False).to_numpy() % n_partitions
+    elif by == 'month':
+        months = pd.to_datetime(df['ts_interaction_first'], errors='coerce').dt.to_period('M')
+        keys = pd.factorize(months, sort=True)[0] % n_partitions
+    else:
+        raise ValueError(f"Unknown partitioning '{by}', expected 'listing' or 'month'")
+    order = np.argsort(keys, kind='stable')
+    bounds = np.searchsorted(keys[order], np.arange(1, n_partitions))
+    return [part for part in np.split(order, bounds) if len(part)]
+
+
+def _clean_partition(path, output_path):
+    write_frame(clean_contacts(read_frame(path), copy=False), output_path)
+    return output_path
+
+
+def _aggregate_partition(path, aggregator, cleaned):
+    df = read_frame(path)
+    if not cleaned:
+        df = clean_contacts(df, copy=False)
+    return aggregator(df)
+
+
+class _ContactAggregator:
+    """
+    Picklable ContactAggregates.from_frame with fixed group columns.
+    """
+
+    def __init__(self, group_columns):
+        self.group_columns = tuple(group_columns)
+
+    def __call__(self, df):
+        return ContactAggregates.from_frame(df, self.group_columns)
+
+
+def _write_partitions(df, partitions, directory):
+    paths = []
+    for number, positions in enumerate(partitions):
+        path = os.path.join(directory, f'partition-{number}.{FRAME_EXTENSION}')
+        write_frame(df.iloc[positions], path)
+        paths.append(path)
+    return paths
+
+
+def parallel_clean_contacts(df, workers=None, partition_by='listing'):
+    """
+    Runs clean_contacts over partitions of `df` in a process pool.
+
+    Parameters:
+        df (pd.DataFrame): Raw contacts DataFrame.
+        workers (int, optional): Number of worker processes. Defaults to os.cpu_count().
+        partition_by (str, optional): See partition_contacts. Defaults to 'listing'.
+
+    Returns:
+        pd.DataFrame: The same frame, in the same row order, as clean_contacts(df).
+    """
+    workers = workers or os.cpu_count()
+    partitions = partition_contacts(df, workers, by=partition_by)
+    if not partitions:
+        return clean_contacts(df)
+    with tempfile.TemporaryDirectory() as directory, ProcessPoolExecutor(workers) as pool:
+        paths = _write_partitions(df, partitions, directory)
+        outputs = [f'{path}.clean' for path in paths]
+        cleaned = pd.concat([read_frame(path) for path in pool.map(_clean_partition, paths, outputs)])
+    return cleaned.iloc[np.argsort(np.concatenate(partitions), kind='stable')]
+
+
+def parallel_aggregate(df, aggregator=ContactAggregates.from_frame, workers=None,
+                       partition_by='listing', cleaned=False):
+    """
+    Cleans and aggregates partitions of `df` in a process pool, then merges the partial results.
+
+    Parameters:
+        df (pd.DataFrame): Raw contacts DataFrame, or a cleaned one when `cleaned` is True.
+        aggregator (callable, optional): Picklable function turning a cleaned frame into a
+            mergeable aggregate, e.g. cube.FunnelCube.from_frame. Defaults to
+            ContactAggregates.from_frame.
+        workers (int, optional): Number of worker processes. Defaults to os.cpu_count().
+        partition_by (str, optional): See partition_contacts. Defaults to 'listing'.
+        cleaned (bool, optional): Skip clean_contacts in the workers. Defaults to False.
+
+    Returns:
+        Aggregates: The merged aggregate, equal to aggregator(clean_contacts(df)).
+    """
+    workers = workers or os.cpu_count()
+    partitions = partition_contacts(df, workers, by=partition_by)
+    if not partitions:
+        # Nothing to merge: the aggregator's own empty result, not None
+        return aggregator(df if cleaned else clean_contacts(df))
+    with tempfile.TemporaryDirectory() as directory, ProcessPoolExecutor(workers) as pool:
+        paths = _write_partitions(df, partitions, directory)
+        results = pool.map(_aggregate_partition, paths,
+                           [aggregator] * len(paths), [cleaned] * len(paths))
+        result = None
+        for partial in results:
+            result = partial if result is None else result.merge(partial)
+    return result
+
+
+def parallel_contact_aggregates(df, workers=None, partition_by='listing', group_columns=DEFAULT_GROUP_COLUMNS):
+    """
+    Parallel equivalent of ContactAggregates.from_frame(clean_contacts(df), group_columns).
+    """
+    return parallel_aggregate(df, _ContactAggregator(group_columns), workers, partition_by)
@@ -0,0 +1,173 @@
+# src/plot_aggregates.py
+#
+# Small precomputed inputs for the functions in src/plots.py: stage counts, booking rates,
+# a pre-binned response time histogram with its KDE evaluated on a fixed grid, and a quantile
+# sketch for the CDF. Building them is one pass over the data; drawing them no longer depends
+# on the number of inquiries, and they round-trip through a JSON file so figures can be
+# regenerated without loading any CSV.
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import FUNNEL_STAGES, is_aggregate
+from src.enrich import attach_listings
+from src.funnel_analysis import funnel_by_neighborhood
+from src.metrics import conversion_by_user_stage
+from src.sketches import QuantileSketch, sketch_by
+
+
+class Histogram:
+    """
+    Pre-binned values with a Gaussian KDE evaluated on a fixed grid.
+
+    Attributes:
+        edges (np.ndarray): Bin edges, length len(counts) + 1.
+        counts (np.ndarray): Number of values per bin.
+        kde_x (np.ndarray): Grid on which the KDE is evaluated.
+        kde_y (np.ndarray): KDE scaled to counts per bin, so it overlays the bars.
+        median (float): Median of the binned values.
+    """
+
+    def __init__(self, edges, counts, kde_x, kde_y, median):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.asarray(counts, dtype=float)
+        self.kde_x = np.asarray(kde_x, dtype=float)
+        self.kde_y = np.asarray(kde_y, dtype=float)
+        self.median = float(median) if median is not None else np.nan
+
+    @classmethod
+    def from_values(cls, values, lower, upper, bins=40, grid_size=200, fine_bins=1000):
+        """
+        Bins `values` in [lower, upper] and smooths a fine histogram into a KDE.
+
+        The KDE uses Scott's bandwidth, as seaborn does, but is computed from `fine_bins`
+        bin counts instead of every value, so its cost does not depend on the data size.
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[(values >= lower) & (values <= upper)]
+        if not len(values):
+            return cls(np.linspace(lower, upper, bins + 1), np.zeros(bins), [], [], None)
+
+        counts, edges = np.histogram(values, bins=bins, range=(values.min(), values.max()))
+        fine_counts, fine_edges = np.histogram(values, bins=fine_bins, range=(values.min(), values.max()))
+        centers = (fine_edges[:-1] + fine_edges[1:]) / 2
+        bandwidth = values.std(ddof=1) * len(values) ** (-1 / 5) if len(values) > 1 else 0
+        kde_x = np.linspace(values.min(), values.max(), grid_size)
+        if bandwidth > 0:
+            kernel = np.exp(-0.5 * ((kde_x[:, None] - centers[None, :]) / bandwidth) ** 2)
+            density = kernel @ fine_counts / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+        else:
+            density = np.zeros(grid_size)
+        kde_y = density * len(values) * np.diff(edges)[0]
+        return cls(edges, counts, kde_x, kde_y, np.median(values))
+
+    def to_dict(self):
+        return {
+            'edges': self.edges.tolist(), 'counts': self.counts.tolist(),
+            'kde_x': self.kde_x.tolist(), 'kde_y': self.kde_y.tolist(),
+            'median': None if np.isnan(self.median) else self.median,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['edges'], data['counts'], data['kde_x'], data['kde_y'], data['median'])
+
+
+def booking_rates(data, column, df_listings=None):
+    """
+    Booking rate per value of `column` from a rate Series, pre-aggregated data or a contacts frame.
+
+    Parameters:
+        data (pd.Series, Aggregates or pd.DataFrame): Precomputed rates indexed by `column`,
+            aggregates, or a contacts frame / fact table.
+        column (str): Grouping column, e.g. 'contact_channel_first' or 'room_type'.
+        df_listings (pd.DataFrame, optional): Listings, when `column` is a listing attribute and
+            `data` is a plain contacts frame.
+
+    Returns:
+        pd.Series: Booking rates indexed by the values of `column`.
+    """
+    if isinstance(data, pd.Series):
+        return data
+    if is_aggregate(data):
+        return data.booking_rate_by(column)
+    if column not in data.columns:
+        data = attach_listings(data, df_listings, [column])
+    return data.groupby(column, observed=True)['booking_happened'].mean()
+
+
+def funnel_stage_counts(data):
+    """
+    Inquiries per funnel stage, in funnel order, from a count Series, aggregates or a contacts frame.
+    """
+    if isinstance(data, pd.Series):
+        counts = data
+    elif is_aggregate(data):
+        counts = data.stage_counts()
+    else:
+        counts = data['funnel_stage'].value_counts()
+    return counts.reindex(FUNNEL_STAGES, fill_value=0)
+
+
+def compute_plot_aggregates(fact, max_hours=72, min_inquiries=50):
+    """
+    Computes the input of every report figure from a fact table (see enrich.build_fact_table).
+
+    Returns:
+        dict: Figure input name -> Series, DataFrame, Histogram or QuantileSketch, plus
+            'parameters', the max_hours and min_inquiries the inputs were computed with.
+    """
+    return {
+        'parameters': {'max_hours': max_hours, 'min_inquiries': min_inquiries},
+        'funnel_stage_counts': funnel_stage_counts(fact),
+        'booking_rate_by_contact_channel': booking_rates(fact, 'contact_channel_first'),
+        'booking_rate_by_room_type': booking_rates(fact, 'room_type'),
+        'response_time_histogram': Histogram.from_values(fact['response_time_hours'], 0.1, max_hours),
+        'response_time_sketch': sketch_by(fact, 'response_time_hours'),
+        'booking_rate_by_user_stage': conversion_by_user_stage(fact),
+        'booking_rate_by_neighborhood': funnel_by_neighborhood(fact, min_inquiries=min_inquiries),
+    }
+
+
+def _encode(value):
+    if isinstance(value, dict):
+        return {'type': 'parameters', 'data': value}
+    if isinstance(value, Histogram):
+        return {'type': 'histogram', 'data': value.to_dict()}
+    if isinstance(value, QuantileSketch):
+        return {'type': 'sketch', 'data': value.to_dict()}
+    kind = 'frame' if isinstance(value, pd.DataFrame) else 'series'
+    return {'type': kind, 'name': getattr(value, 'name', None), 'index_name': value.index.name,
+            'data': json.loads(value.to_json(orient='split', double_precision=15))}
+
+
+def _decode(entry):
+    if entry['type'] == 'parameters':
+        return entry['data']
+    if entry['type'] == 'histogram':
+        return Histogram.from_dict(entry['data'])
+    if entry['type'] == 'sketch':
+        return QuantileSketch.from_dict(entry['data'])
+    data = entry['data']
+    index = pd.Index(data['index'], name=entry['index_name'])
+    if entry['type'] == 'frame':
+        return pd.DataFrame(data['data'], index=index, columns=data['columns'])
+    return pd.Series(data['data'], index=index, name=entry['name'])
+
+
+def save_plot_aggregates(aggregates, path):
+    """
+    Writes the output of compute_plot_aggregates to a JSON file.
+    """
+    with open(path, 'w') as handle:
+        json.dump({name: _encode(value) for name, value in aggregates.items()}, handle)
+
+
+def load_plot_aggregates(path):
+    """
+    Reads a file written by save_plot_aggregates.
+    """
+    with open(path) as handle:
+        return {name: _decode(entry) for name, entry in json.load(handle).items()}
@@ -1,21 +1,30 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import seaborn as sns
 import pandas as pd
 
+from src.plot_aggregates import Histogram, booking_rates, funnel_stage_counts
+from src.profiling import instrument
+from src.sketches import QuantileSketch
+
 sns.set(style="whitegrid")
 
+@instrument()
 def plot_funnel_stage_distribution(df, save_path=None):
     """
     Plots the distribution of guest inquiries across different funnel stages.
     Parameters:
-        df (pd.DataFrame): DataFrame containing at least a 'funnel_stage' column with stage labels.
+        df (pd.Series, Aggregates or pd.DataFrame): Inquiry counts indexed by funnel stage (e.g.
+            get_funnel_stage_distribution(df, normalize=False)), pre-aggregated data, or a DataFrame
+            containing a 'funnel_stage' column with stage labels.
         save_path (str, optional): If provided, the plot will be saved to this file path.
-    The function creates a count plot of the number of inquiries at each funnel stage ('no_reply', 'replied', 'accepted', 'booked'),
+    The function creates a bar plot of the number of inquiries at each funnel stage ('no_reply', 'replied', 'accepted', 'booked'),
     annotates each bar with its count, and displays the plot. Optionally saves the plot to the specified path.
     """
-    order = ['no_reply', 'replied', 'accepted', 'booked']
+    counts = funnel_stage_counts(df)
     plt.figure(figsize=(8, 5))
-    ax = sns.countplot(data=df, x='funnel_stage', order=order, palette="Blues_d")
+    ax = plt.gca()
+    ax.bar(counts.index, counts.to_numpy(), color=sns.color_palette("Blues_d", len(counts)))
     plt.title("Guest Inquiry Funnel Stages")
     plt.xlabel("Funnel Stage")
     plt.ylabel("Number of Inquiries")
@@ -29,31 +38,34 @@ def plot_funnel_stage_distribution(df, save_path=None):
     plt.show()
 
 
+@instrument()
 def plot_booking_rate_by_contact_channel(df, save_path=None):
     """
-    Plots the booking rate by the first contact channel from the given DataFrame.
-    This function groups the data by the 'contact_channel_first' column, calculates the mean booking rate
-    ('booking_happened'), and visualizes the results as a horizontal bar chart. Each bar is annotated with
+    Plots the booking rate by the first contact channel.
+    Precomputed rates (e.g. metrics.conversion_by_contact_channel) are drawn as is; otherwise the data is
+    grouped by the 'contact_channel_first' column to get the mean booking rate ('booking_happened').
+    The results are visualized as a horizontal bar chart. Each bar is annotated with
     the booking rate percentage. Optionally, the plot can be saved to a specified file path.
     Parameters:
-        df (pd.DataFrame): DataFrame containing at least 'contact_channel_first' and 'booking_happened' columns.
+        df (pd.Series, Aggregates or pd.DataFrame): Booking rates indexed by contact channel, pre-aggregated data,
+            or a DataFrame containing at least 'contact_channel_first' and 'booking_happened' columns.
         save_path (str, optional): File path to save the plot image. If None, the plot is not saved.
     Returns:
         None
     """
-    booking_rates = df.groupby('contact_channel_first')['booking_happened'].mean().sort_values()
+    rates = booking_rates(df, 'contact_channel_first').sort_values()
     plt.figure(figsize=(8, 5))
-    ax = booking_rates.plot(kind='barh', color='skyblue')
+    ax = rates.plot(kind='barh', color='skyblue')
     plt.title("Booking Rate by Contact Channel")
     plt.xlabel("Booking Rate")
     plt.ylabel("Contact Method")
 
     # Annotate bars with %
-    for i, v in enumerate(booking_rates):
+    for i, v in enumerate(rates):
         ax.text(v + 0.01, i, f'{v:.1%}', va='center', fontsize=9)
 
     # Highlight top performer
-    max_idx = booking_rates.idxmax()
+    max_idx = rates.idxmax()
     ax.bar_label(ax.containers[0], fmt='%.0f%%', label_type='edge')
 
     if save_path:
@@ -61,21 +73,24 @@ def plot_booking_rate_by_contact_channel(df, save_path=None):
     plt.show()
 
 
-def plot_booking_rate_by_room_type(df_contacts, df_listings, save_path=None):
+@instrument()
+def plot_booking_rate_by_room_type(df_contacts, df_listings=None, save_path=None):
     """
     Plots the booking rate by room type using data from contacts and listings DataFrames.
     This function merges the contacts and listings DataFrames on the 'id_listing_anon' column,
     calculates the mean booking rate for each room type, and creates a horizontal bar plot
     showing the booking rate by room type. Optionally, the plot can be saved to a specified path.
+    If `df_contacts` is a fact table from enrich.build_fact_table, the merge is skipped; if it is
+    a Series of precomputed rates (e.g. funnel_analysis.funnel_by_room_type), nothing is computed.
     Parameters:
-        df_contacts (pd.DataFrame): DataFrame containing booking/contact information, including 'id_listing_anon' and 'booking_happened' columns.
-        df_listings (pd.DataFrame): DataFrame containing listing details, including 'id_listing_anon' and 'room_type' columns.
+        df_contacts (pd.Series, Aggregates or pd.DataFrame): Booking rates indexed by room type, pre-aggregated data,
+            or a DataFrame containing booking/contact information, including 'id_listing_anon' and 'booking_happened' columns.
+        df_listings (pd.DataFrame, optional): DataFrame containing listing details, including 'id_listing_anon' and 'room_type' columns.
         save_path (str, optional): File path to save the plot image. If None, the plot is not saved.
     Returns:
         None
     """
-    merged = df_contacts.merge(df_listings, on='id_listing_anon', how='left')
-    rates = merged.groupby('room_type')['booking_happened'].mean().sort_values()
+    rates = booking_rates(df_contacts, 'room_type', df_listings).sort_values()
     plt.figure(figsize=(8, 5))
     ax = rates.plot(kind='barh', color='salmon')
     plt.title("Booking Rate by Room Type")
@@ -90,25 +105,33 @@ def plot_booking_rate_by_room_type(df_contacts, df_listings, save_path=None):
     plt.show()
 
 
+@instrument()
 def plot_trimmed_response_time_distribution(df, max_hours=72, save_path=None):
     """
     Plots the distribution of host response times, trimmed to a specified maximum number of hours.
     Parameters:
-        df (pd.DataFrame): DataFrame containing a 'response_time_hours' column with host response times in hours.
+        df (pd.DataFrame or Histogram): DataFrame containing a 'response_time_hours' column with host response times in hours,
+            or a plot_aggregates.Histogram already binned over [0.1, max_hours].
         max_hours (float, optional): Maximum response time (in hours) to include in the plot. Defaults to 72.
         save_path (str, optional): File path to save the plot image. If None, the plot is not saved. Defaults to None.
-    The function filters the response times to those between 0.1 and max_hours, plots a histogram with a KDE curve,
-    annotates the median response time, and optionally saves the plot to a file.
+    The function filters the response times to those between 0.1 and max_hours, plots a 40-bin histogram with a KDE curve
+    evaluated on a fixed grid, annotates the median response time, and optionally saves the plot to a file.
     """
-    filtered = df[df['response_time_hours'].between(0.1, max_hours)]
+    if isinstance(df, Histogram):
+        hist = df
+    else:
+        hist = Histogram.from_values(df['response_time_hours'], 0.1, max_hours)
     plt.figure(figsize=(10, 6))
-    ax = sns.histplot(filtered['response_time_hours'], bins=40, kde=True, color='teal')
+    ax = plt.gca()
+    ax.bar(hist.edges[:-1], hist.counts, width=np.diff(hist.edges), align='edge',
+           color='teal', alpha=0.75, edgecolor='white')
+    ax.plot(hist.kde_x, hist.kde_y, color='teal')
     plt.title(f"Host Response Times (Under {max_hours} Hours)")
     plt.xlabel("Response Time (Hours)")
     plt.ylabel("Number of Inquiries")
 
     # Annotate median
-    median = filtered['response_time_hours'].median()
+    median = hist.median
     plt.axvline(median, color='red', linestyle='--', linewidth=2)
     plt.text(median + 1, ax.get_ylim()[1] * 0.8, f'Median: {median:.1f} hrs', color='red')
 
@@ -117,19 +140,28 @@ def plot_trimmed_response_time_distribution(df, max_hours=72, save_path=None):
     plt.show()
 
 
+@instrument()
 def plot_response_time_cdf(df, max_hours=72, save_path=None):
     """
     Plots the cumulative distribution function (CDF) of host response times from a DataFrame.
     Parameters:
-        df (pd.DataFrame): DataFrame containing a 'response_time_hours' column with host response times in hours.
+        df (pd.DataFrame or QuantileSketch): DataFrame containing a 'response_time_hours' column with host response
+            times in hours, or a sketches.QuantileSketch of those times. With a sketch the CDF is drawn from its
+            buckets (within its relative accuracy) instead of sorting every row.
         max_hours (float, optional): Maximum response time (in hours) to include in the plot. Defaults to 72.
         save_path (str, optional): File path to save the plot image. If None, the plot is not saved. Defaults to None.
     Displays:
         A matplotlib plot showing the CDF of host response times, with the median response time annotated.
     """
-    filtered = df[df['response_time_hours'].between(0.1, max_hours)]
-    sorted_vals = filtered['response_time_hours'].sort_values()
-    cdf = sorted_vals.rank(method='average', pct=True)
+    if isinstance(df, QuantileSketch):
+        trimmed = df.between(0.1, max_hours)
+        sorted_vals, cdf = trimmed.cdf_points()
+        median = trimmed.quantile(0.5)
+    else:
+        filtered = df[df['response_time_hours'].between(0.1, max_hours)]
+        sorted_vals = filtered['response_time_hours'].sort_values()
+        cdf = sorted_vals.rank(method='average', pct=True)
+        median = sorted_vals.median()
 
     plt.figure(figsize=(10, 6))
     plt.plot(sorted_vals, cdf, color='purple')
@@ -139,10 +171,55 @@ def plot_response_time_cdf(df, max_hours=72, save_path=None):
     plt.grid(True)
 
     # Median annotation
-    median = sorted_vals.median()
     plt.axvline(median, color='red', linestyle='--', linewidth=2)
     plt.text(median + 1, 0.6, f'Median: {median:.1f} hrs', color='red')
 
     if save_path:
         plt.savefig(save_path, bbox_inches='tight')
     plt.show()
+
+
+@instrument()
+def plot_booking_rate_by_user_stage(user_stage_conversion, save_path=None):
+    """
+    Plots booking conversion by guest user stage as a vertical bar chart.
+    Parameters:
+        user_stage_conversion (pd.Series): Conversion rates indexed by guest user stage,
+            e.g. the output of metrics.conversion_by_user_stage.
+        save_path (str, optional): File path to save the plot image. If None, the plot is not saved.
+    Returns:
+        None
+    """
+    plt.figure(figsize=(6, 4))
+    user_stage_conversion.plot(kind='bar', color='orange')
+    plt.title("Booking Rate by User Type")
+    plt.ylabel("Booking Rate")
+    plt.xticks(rotation=0)
+    plt.tight_layout()
+
+    if save_path:
+        plt.savefig(save_path)
+    plt.show()
+
+
+@instrument()
+def plot_top_neighborhoods(neighborhood_df, top_n=10, min_inquiries=50, save_path=None):
+    """
+    Plots the booking rate of the best-converting neighborhoods as a horizontal bar chart.
+    Parameters:
+        neighborhood_df (pd.DataFrame): Output of funnel_analysis.funnel_by_neighborhood, sorted by 'mean'.
+        top_n (int, optional): Number of neighborhoods to show. Defaults to 10.
+        min_inquiries (int, optional): Inquiry cutoff used to build `neighborhood_df`, shown in the title. Defaults to 50.
+        save_path (str, optional): File path to save the plot image. If None, the plot is not saved.
+    Returns:
+        None
+    """
+    plt.figure(figsize=(10, 5))
+    neighborhood_df.head(top_n)['mean'].plot(kind='barh', color='green')
+    plt.xlabel("Booking Rate")
+    plt.title(f"Top {top_n} Booking Neighborhoods (min {min_inquiries} inquiries)")
+    plt.tight_layout()
+
+    if save_path:
+        plt.savefig(save_path)
+    plt.show()
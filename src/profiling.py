@@ -0,0 +1,309 @@
+# src/profiling.py
+#
+# Opt-in instrumentation of the pipeline stages. Functions decorated with @instrument (and
+# blocks wrapped in `with span(...)`) record wall time, CPU time, peak RSS, tracemalloc
+# allocation deltas, rows in and out and the memory of the frame they return, nested by call.
+# Tracing is off unless enabled with the FUNNEL_TRACE environment variable (a path the JSON
+# trace is written to when the process exits) or the `with tracing(path):` context manager;
+# while off, an instrumented call costs one global lookup.
+#
+# Stages marked `preserves_rows=True` are row-preserving joins: if one returns more rows than
+# it received (e.g. a merge fanning out on duplicate 'id_listing_anon' values), the record is
+# flagged with 'fan_out' and a warning is logged.
+
+import atexit
+import functools
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_ENV = 'FUNNEL_TRACE'
+
+logger = logging.getLogger(__name__)
+
+# The Trace being recorded, or None while tracing is off
+_active = None
+
+
+def _peak_rss_mb():
+    """
+    Peak resident set size of this process so far, in MiB (None where unavailable).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def _rows(value):
+    """
+    Rows in a frame or Series, or in a tuple/list of them; None for anything else.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, (tuple, list)) and value and all(isinstance(v, (pd.DataFrame, pd.Series)) for v in value):
+        return sum(len(v) for v in value)
+    return None
+
+
+def _frame_mb(value):
+    """
+    Deep memory usage of a frame or Series, or of a tuple/list of them, in MiB.
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.memory_usage(deep=True).sum() / (1 << 20)
+    if isinstance(value, pd.Series):
+        return value.memory_usage(deep=True) / (1 << 20)
+    if _rows(value) is not None:
+        return sum(_frame_mb(v) for v in value)
+    return None
+
+
+class _Stage:
+    """
+    One open stage: collects its measurements and turns them into a trace record on close.
+    """
+
+    def __init__(self, trace, name, rows_in, preserves_rows):
+        self.trace = trace
+        self.record = {
+            'stage': name, 'depth': len(trace._stack),
+            'parent': trace._stack[-1].record['stage'] if trace._stack else None,
+            'rows_in': rows_in, 'rows_out': None, 'frame_mb': None,
+        }
+        self.preserves_rows = preserves_rows
+        self.alloc_peak = 0
+        self.result = None
+        self.columns = None
+
+    def output(self, value, columns=None):
+        """
+        Sets the stage's result; its rows and frame memory are measured after the timers stop.
+
+        Parameters:
+            value: The result, e.g. a frame or Series.
+            columns (str or list of str, optional): Only measure these columns of `value`. The
+                selection is made when the stage closes, so callers pass the frame and names
+                rather than building `df[columns]`, which costs even when tracing is off.
+        """
+        self.result = value
+        self.columns = columns
+
+    def __enter__(self):
+        if self.trace.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.trace._carry_peak(peak)
+            tracemalloc.reset_peak()
+            self.alloc_start = current
+        self.trace._stack.append(self)
+        self.rss_start = _peak_rss_mb()
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        self.trace._stack.pop()
+        record = self.record
+        record['wall_s'] = wall
+        record['cpu_s'] = cpu
+        rss = _peak_rss_mb()
+        record['peak_rss_mb'] = rss
+        record['peak_rss_delta_mb'] = None if rss is None else rss - self.rss_start
+        if self.trace.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.alloc_peak = max(self.alloc_peak, peak)
+            record['alloc_delta_mb'] = (current - self.alloc_start) / (1 << 20)
+            record['alloc_peak_mb'] = (self.alloc_peak - self.alloc_start) / (1 << 20)
+            self.trace._carry_peak(self.alloc_peak)
+        result = self.result if self.columns is None else self.result[self.columns]
+        record['rows_out'] = _rows(result)
+        if record['rows_out'] is not None:
+            record['frame_mb'] = _frame_mb(result)
+        self.result = self.columns = None
+        record['fan_out'] = bool(
+            self.preserves_rows and record['rows_in'] is not None and record['rows_out'] is not None
+            and record['rows_out'] > record['rows_in']
+        )
+        if exc_info[0] is not None:
+            record['error'] = exc_info[0].__name__
+        self.trace.records.append(record)
+        if record['fan_out']:
+            logger.warning('%s returned %d rows from %d: a join fanned out on duplicate keys',
+                           record['stage'], record['rows_out'], record['rows_in'])
+        logger.debug('%s', json.dumps(record))
+        return False
+
+
+class _NullStage:
+    """
+    Stand-in returned by span() while tracing is off.
+    """
+
+    def output(self, value, columns=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Trace:
+    """
+    Records of every instrumented stage run while it is active.
+
+    Parameters:
+        memory (bool, optional): Track Python allocations with tracemalloc. This slows the
+            traced code down noticeably; wall and CPU times are still recorded without it.
+            Defaults to True.
+    """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.records = []
+        self._stack = []
+        self._owns_tracemalloc = False
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        return self
+
+    def stop(self):
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+    def _carry_peak(self, peak):
+        # tracemalloc has a single peak counter, reset by every stage on entry; hand the
+        # peak reached so far to the enclosing stages before it is lost
+        for stage in self._stack:
+            stage.alloc_peak = max(stage.alloc_peak, peak)
+
+    def summary(self):
+        """
+        Returns:
+            pd.DataFrame: Per stage: number of calls, total wall and CPU seconds, largest
+            allocation peak and whether any call fanned out, slowest first.
+        """
+        records = pd.DataFrame(self.records)
+        if records.empty:
+            return records
+        aggregations = {'calls': ('stage', 'size'), 'wall_s': ('wall_s', 'sum'), 'cpu_s': ('cpu_s', 'sum'),
+                        'fan_out': ('fan_out', 'any')}
+        if 'alloc_peak_mb' in records.columns:
+            aggregations['alloc_peak_mb'] = ('alloc_peak_mb', 'max')
+        return records.groupby('stage').agg(**aggregations).sort_values('wall_s', ascending=False)
+
+    def write(self, path):
+        """
+        Writes the records as a JSON list.
+        """
+        with open(path, 'w') as handle:
+            json.dump(self.records, handle, indent=2)
+
+
+def enabled():
+    """
+    Returns True while a trace is being recorded.
+    """
+    return _active is not None
+
+
+@contextmanager
+def tracing(path=None, memory=True):
+    """
+    Records every instrumented stage run inside the block.
+
+    Parameters:
+        path (str, optional): If given, the JSON trace is written there when the block exits.
+        memory (bool, optional): See Trace. Defaults to True.
+
+    Yields:
+        Trace: The trace being recorded.
+    """
+    global _active
+    previous = _active
+    trace = Trace(memory).start()
+    _active = trace
+    try:
+        yield trace
+    finally:
+        _active = previous
+        trace.stop()
+        if path:
+            trace.write(path)
+
+
+def span(name, rows_in=None, preserves_rows=False):
+    """
+    Instruments a block: `with span('enrich.merge', rows_in=len(df)) as stage: ...`, then
+    `stage.output(result)` (or `stage.output(df, columns)`) to record its rows and memory.
+
+    Returns a no-op stage while tracing is off.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name, rows_in, preserves_rows)
+
+
+def instrument(stage=None, preserves_rows=False):
+    """
+    Decorator recording each call of a function as a trace stage.
+
+    Parameters:
+        stage (str, optional): Stage name. Defaults to '<module>.<function>'.
+        preserves_rows (bool, optional): The function joins columns onto its first frame
+            argument and must return exactly as many rows; more rows are flagged as a fan-out.
+    """
+    def decorate(func):
+        module = func.__module__
+        if module == '__main__' and func.__globals__.get('__spec__') is not None:
+            # Run with `python -m src.report`: use the importable module name
+            module = func.__globals__['__spec__'].name
+        name = stage or f"{module.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            rows_in = next((_rows(arg) for arg in args if _rows(arg) is not None), None)
+            with _Stage(_active, name, rows_in, preserves_rows) as record:
+                result = func(*args, **kwargs)
+                record.output(result)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def _trace_from_environment():
+    global _active
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return
+    _active = Trace().start()
+    atexit.register(_active.write, path)
+
+
+_trace_from_environment()
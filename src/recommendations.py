@@ -1,14 +1,502 @@
 # src/recommendations.py
+#
+# Rule-based recommendations. Each rule declares the aggregates it reads (RULES, registered
+# with @rule) and checks them for every segment at once: aggregates are Series or DataFrames
+# indexed by segment, so a rule is a handful of vectorized comparisons however many segments
+# there are. RecommendationEngine computes the aggregates the rules need through a memoized
+# dependency graph (AGGREGATES, registered with @aggregate) rooted in a FunnelCube over the
+# segment column, builds each of them once, and drops its cache when the data version changes.
+#
+# Rules comparing two rates take an `alpha` parameter: left at None they use the fixed lifts
+# of the original checks, set (e.g. with_params(alpha=0.05)) they fire only where a
+# two-proportion test of the underlying counts finds the difference significant.
+#
+# generate_recommendations is the original scalar version of these checks over precomputed
+# overall metrics, kept for callers of that interface.
+
+import copy
+import logging
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import FUNNEL_STAGES
+from src.cube import FunnelCube
+from src.profiling import instrument, span
+from src.significance import two_proportion_test
+
+logger = logging.getLogger(__name__)
+
+# Segment label of the whole dataset when the engine has no segment column
+ALL_SEGMENTS = 'all'
+
+# Aggregate name -> (names it is computed from, function of those values). The graph is rooted
+# in 'counts', the funnel stage counts and MEASURES of cube.py per segment, and 'counts:<column>',
+# the same per (segment, label of column); the engine rolls both up from one FunnelCube.
+AGGREGATES = {}
+
+RULES = {}
+
+
+def aggregate(name, *requires):
+    """
+    Decorator registering a function as the aggregate `name`, computed from the aggregates
+    in `requires`, which are passed to it in that order.
+    """
+    def register(func):
+        AGGREGATES[name] = (requires, func)
+        return func
+
+    return register
+
+
+def _booking_rates_by(counts):
+    """
+    Booking rate per segment (rows) and label of the breakdown column (columns).
+    """
+    rates = counts['booked'] / counts[FUNNEL_STAGES].sum(axis=1)
+    return rates.unstack(-1).astype(float)
+
+
+def _inquiries_by(counts):
+    """
+    Inquiries per segment (rows) and label of the breakdown column (columns).
+    """
+    return counts[FUNNEL_STAGES].sum(axis=1).unstack(-1, fill_value=0)
+
+
+def _bookings_by(counts):
+    """
+    Bookings per segment (rows) and label of the breakdown column (columns).
+    """
+    return counts['booked'].unstack(-1, fill_value=0)
+
+
+def _at(frame, labels):
+    """
+    frame[labels[i]] of each row i, labels being column labels aligned with the rows.
+    """
+    return frame.to_numpy()[np.arange(len(frame)), frame.columns.get_indexer(labels)]
+
+
+@aggregate('inquiries', 'counts')
+def _inquiries(counts):
+    return counts[FUNNEL_STAGES].sum(axis=1)
+
+
+@aggregate('booking_rate', 'counts', 'inquiries')
+def _booking_rate(counts, inquiries):
+    return counts['booked'] / inquiries
+
+
+@aggregate('response_rate', 'counts', 'inquiries')
+def _response_rate(counts, inquiries):
+    return counts['replies'] / inquiries
+
+
+@aggregate('acceptance_rate', 'counts', 'inquiries')
+def _acceptance_rate(counts, inquiries):
+    return counts['acceptances'] / inquiries
+
+
+@aggregate('avg_response_time', 'counts')
+def _avg_response_time(counts):
+    return counts['response_hours_sum'] / counts['response_hours_count'].where(counts['response_hours_count'] > 0)
+
+
+@aggregate('avg_accept_time', 'counts')
+def _avg_accept_time(counts):
+    return counts['accept_hours_sum'] / counts['accept_hours_count'].where(counts['accept_hours_count'] > 0)
+
+
+aggregate('booking_rate_by_channel', 'counts:contact_channel_first')(_booking_rates_by)
+aggregate('booking_rate_by_user_stage', 'counts:guest_user_stage_first')(_booking_rates_by)
+aggregate('booking_rate_by_room_type', 'counts:room_type')(_booking_rates_by)
+aggregate('inquiries_by_channel', 'counts:contact_channel_first')(_inquiries_by)
+aggregate('inquiries_by_user_stage', 'counts:guest_user_stage_first')(_inquiries_by)
+aggregate('inquiries_by_room_type', 'counts:room_type')(_inquiries_by)
+aggregate('bookings_by_channel', 'counts:contact_channel_first')(_bookings_by)
+aggregate('bookings_by_user_stage', 'counts:guest_user_stage_first')(_bookings_by)
+aggregate('bookings_by_room_type', 'counts:room_type')(_bookings_by)
+
+
+class Rule:
+    """
+    A recommendation triggered per segment.
+
+    Parameters:
+        name (str): Rule name.
+        requires (tuple of str): Names of the AGGREGATES the rule reads.
+        check (callable): check(values, **params) receives a dict of those aggregates (indexed
+            by segment) and returns a DataFrame indexed by the segments that trigger the rule,
+            with the fields used in the message templates.
+        insight (str): str.format template of the insight.
+        recommendation (str): str.format template of the recommendation.
+        params (dict, optional): Thresholds passed to `check`.
+    """
+
+    def __init__(self, name, requires, check, insight, recommendation, params=None):
+        self.name = name
+        self.requires = tuple(requires)
+        self.check = check
+        self.insight = insight
+        self.recommendation = recommendation
+        self.params = dict(params or {})
+
+    def with_params(self, **params):
+        """
+        Returns a copy of the rule with some thresholds changed, e.g. with_params(hours=6).
+        """
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ValueError(f"Rule '{self.name}' has no parameter(s) {sorted(unknown)}; expected {sorted(self.params)}")
+        rule = copy.copy(self)
+        rule.params = {**self.params, **params}
+        return rule
+
+    def evaluate(self, values):
+        """
+        Returns:
+            list of dict: One {'rule', 'segment', 'insight', 'recommendation'} per triggering segment.
+        """
+        fields = self.check({name: values[name] for name in self.requires}, **self.params)
+        return [
+            {
+                'rule': self.name,
+                'segment': segment,
+                'insight': self.insight.format(**row),
+                'recommendation': self.recommendation.format(**row),
+            }
+            for segment, row in zip(fields.index, fields.to_dict('records'))
+        ]
+
+    def __repr__(self):
+        return f'Rule({self.name!r}, requires={self.requires}, params={self.params})'
+
+
+def rule(name, requires, insight, recommendation, **params):
+    """
+    Decorator registering a check function as a Rule in RULES. Keyword arguments are the
+    rule's default thresholds.
+    """
+    def register(check):
+        RULES[name] = Rule(name, requires, check, insight, recommendation, params)
+        return check
+
+    return register
+
+
+@rule(
+    'instant_book', ('booking_rate', 'booking_rate_by_channel', 'inquiries_by_channel', 'bookings_by_channel'),
+    insight='Instant Book has a conversion rate of {ib_rate:.2%}, significantly higher than the average {booking_rate:.2%}.',
+    recommendation='Encourage more hosts to opt in to Instant Book. Consider incentives or feature promotions.',
+    lift=1.5,
+    alpha=None,
+)
+def _instant_book(values, lift, alpha):
+    by_channel = values['booking_rate_by_channel']
+    if 'instant_book' not in by_channel.columns:
+        return pd.DataFrame(columns=['ib_rate', 'booking_rate'])
+    fields = pd.DataFrame({'ib_rate': by_channel['instant_book'], 'booking_rate': values['booking_rate']})
+    if alpha is None:
+        return fields[fields['ib_rate'] > fields['booking_rate'] * lift]
+    # Instant Book against the segment's other channels, one-sided
+    inquiries = values['inquiries_by_channel'].reindex(fields.index)
+    bookings = values['bookings_by_channel'].reindex(fields.index)
+    _, _, p_value = two_proportion_test(
+        bookings['instant_book'], inquiries['instant_book'],
+        bookings.sum(axis=1) - bookings['instant_book'], inquiries.sum(axis=1) - inquiries['instant_book'],
+        alternative='greater',
+    )
+    fields['p_value'] = p_value
+    return fields[fields['p_value'] < alpha]
+
+
+@rule(
+    'room_type', ('booking_rate_by_room_type', 'inquiries_by_room_type', 'bookings_by_room_type'),
+    insight='{top_title}s have the highest booking rate at {top_rate:.2%}. {low_title}s convert at only {low_rate:.2%}.',
+    recommendation='Surface more {top_room}s in search results, or improve the visibility of better-converting room types.',
+    alpha=None,
+)
+def _room_type(values, alpha):
+    rates = values['booking_rate_by_room_type'].dropna(how='all')
+    fields = pd.DataFrame({
+        'top_room': rates.idxmax(axis=1), 'top_rate': rates.max(axis=1),
+        'low_room': rates.idxmin(axis=1), 'low_rate': rates.min(axis=1),
+    }, index=rates.index)
+    fields['top_title'] = fields['top_room'].astype(str).str.title()
+    fields['low_title'] = fields['low_room'].astype(str).str.title()
+    if alpha is None:
+        return fields
+    inquiries = values['inquiries_by_room_type'].reindex(index=rates.index, columns=rates.columns)
+    bookings = values['bookings_by_room_type'].reindex(index=rates.index, columns=rates.columns)
+    _, _, p_value = two_proportion_test(
+        _at(bookings, fields['top_room']), _at(inquiries, fields['top_room']),
+        _at(bookings, fields['low_room']), _at(inquiries, fields['low_room']),
+    )
+    fields['p_value'] = p_value
+    return fields[fields['p_value'] < alpha]
+
+
+@rule(
+    'new_vs_past_bookers', ('booking_rate_by_user_stage', 'inquiries_by_user_stage', 'bookings_by_user_stage'),
+    insight='Past bookers convert at {past_rate:.2%}, while new users only convert at {new_rate:.2%}.',
+    recommendation='Improve onboarding and trust-building for new users (e.g., better messaging, UI nudges, social proof).',
+    lift=1.3,
+    alpha=None,
+)
+def _new_vs_past_bookers(values, lift, alpha):
+    by_stage = values['booking_rate_by_user_stage']
+    if not {'new', 'past_booker'} <= set(by_stage.columns):
+        return pd.DataFrame(columns=['past_rate', 'new_rate'])
+    fields = pd.DataFrame({'past_rate': by_stage['past_booker'], 'new_rate': by_stage['new']})
+    if alpha is None:
+        return fields[(fields['new_rate'] > 0) & (fields['past_rate'] > fields['new_rate'] * lift)]
+    inquiries = values['inquiries_by_user_stage'].reindex(fields.index)
+    bookings = values['bookings_by_user_stage'].reindex(fields.index)
+    _, _, p_value = two_proportion_test(
+        bookings['past_booker'], inquiries['past_booker'], bookings['new'], inquiries['new'], alternative='greater',
+    )
+    fields['p_value'] = p_value
+    return fields[fields['p_value'] < alpha]
+
+
+@rule(
+    'slow_response', ('avg_response_time',),
+    insight='Average host response time is {avg_response_time:.1f} hours, which may be too slow for real-time booking expectations.',
+    recommendation='Improve host responsiveness — consider SMS nudges, response SLAs, or reward fast responders.',
+    hours=12,
+)
+def _slow_response(values, hours):
+    fields = values['avg_response_time'].rename('avg_response_time').to_frame()
+    return fields[fields['avg_response_time'] > hours]
+
+
+def evaluate_rules(values, rules=None):
+    """
+    Evaluates rules on aggregates that are already computed.
+
+    Parameters:
+        values (dict): Aggregate name -> Series or DataFrame indexed by segment.
+        rules (iterable of Rule, optional): Defaults to every rule in RULES.
+
+    Returns:
+        list of dict: Recommendations in rule order, each with 'rule', 'segment', 'insight'
+        and 'recommendation' keys.
+    """
+    recommendations = []
+    for each in RULES.values() if rules is None else rules:
+        recommendations.extend(each.evaluate(values))
+    return recommendations
+
+
+def data_version(df, columns):
+    """
+    Content hash of `columns` of a frame, used to tell whether cached aggregates are stale.
+    """
+    columns = [c for c in columns if c in df.columns]
+    return int(pd.util.hash_pandas_object(df[columns], index=False).sum())
+
+
+def _requirements(names):
+    """
+    Every aggregate `names` are computed from, directly or not, including themselves.
+    """
+    needed, pending = set(), list(names)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(AGGREGATES.get(name, ((), None))[0])
+    return needed
+
+
+class RecommendationEngine:
+    """
+    Evaluates rules for every segment of a contacts frame, computing each aggregate once.
+
+    Only the aggregates the rules depend on are computed, on first use, and cached. Their
+    counts all come from one FunnelCube over the segment column and every breakdown column
+    the rules need, so evaluating hundreds of segments costs a single pass over the rows
+    rather than one per segment. update() drops the cache when the data version changes.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned contacts or fact table (enrich.build_fact_table), which the
+            room type rule needs.
+        segment_by (str, optional): Column to evaluate the rules per value of, e.g.
+            'listing_neighborhood', 'contact_channel_first' or 'guest_segment'. Defaults to None
+            (one ALL_SEGMENTS segment).
+        rules (iterable of Rule, optional): Defaults to every rule in RULES.
+        min_inquiries (int, optional): Segments with fewer inquiries are not evaluated. Defaults to 0.
+        version (hashable, optional): Version of `df`, see update(). Defaults to unknown, so the
+            first update() without a version always invalidates the cache.
+    """
+
+    def __init__(self, df, segment_by=None, rules=None, min_inquiries=0, version=None):
+        self.df = df
+        self.segment_by = segment_by
+        self.rules = list(RULES.values() if rules is None else rules)
+        self.min_inquiries = min_inquiries
+        self.version = version
+        self.cache = {}
+
+    @property
+    def _segment(self):
+        return self.segment_by or '_segment'
+
+    def _breakdowns(self):
+        """
+        Columns the rules break each segment down by, in first-use order.
+        """
+        names = [name for each in self.rules for name in each.requires] + ['counts']
+        columns = {name.split(':', 1)[1] for name in _requirements(names) if name.startswith('counts:')}
+        return sorted(columns)
+
+    def _columns(self):
+        """
+        Columns the aggregates read, hashed into the data version.
+        """
+        columns = ['funnel_stage', 'ts_reply_at_first', 'ts_accepted_at_first', 'response_time_hours',
+                   'accept_time_hours']
+        return ([self.segment_by] if self.segment_by else []) + self._breakdowns() + columns
+
+    def update(self, df, version=None):
+        """
+        Replaces the data, dropping the cached aggregates if its version changed.
+
+        Parameters:
+            df (pd.DataFrame): The new contacts frame.
+            version (hashable, optional): Caller-tracked version (e.g. a file digest or a batch
+                number), which skips hashing the frame. Defaults to data_version(df) over the
+                columns the aggregates read.
+
+        Returns:
+            bool: True if the cache was invalidated.
+        """
+        version = data_version(df, self._columns()) if version is None else version
+        self.df = df
+        if self.version is not None and version == self.version:
+            return False
+        self.version = version
+        self.cache.clear()
+        return True
+
+    def invalidate(self, name=None):
+        """
+        Drops one cached aggregate and everything computed from it, or the whole cache.
+        """
+        if name is None:
+            self.cache.clear()
+            return
+        stale = {name}
+        if name == 'cube' or name.startswith('counts'):
+            stale |= {key for key in self.cache if key.startswith('counts')}
+        while True:
+            dependents = {other for other, (requires, _) in AGGREGATES.items() if stale & set(requires)}
+            if dependents <= stale:
+                break
+            stale |= dependents
+        for key in stale:
+            self.cache.pop(key, None)
+
+    def _frame(self, columns):
+        """
+        The contacts frame with the segment column and `columns`, each as its own cube axis.
+        """
+        df = self.df if self.segment_by else self.df.assign(_segment=ALL_SEGMENTS)
+        missing = [c for c in [self._segment] + list(columns) if c not in df.columns]
+        if missing:
+            raise KeyError(f'Contacts frame has no {missing} column(s)')
+        axes = {c: c for c in columns}
+        if self._segment in axes:
+            # Broken down by the segment column itself: a second, identical axis
+            df = df.assign(_breakdown=df[self._segment])
+            axes[self._segment] = '_breakdown'
+        return df, axes
+
+    def _cube(self):
+        """
+        One cube over the segment and every breakdown column present, or the segment alone
+        if that cube would be too large (each breakdown then gets its own cube).
+        """
+        columns = [c for c in self._breakdowns() if c in self.df.columns]
+        df, axes = self._frame(columns)
+        try:
+            return FunnelCube.from_frame(df, [self._segment] + list(axes.values())), axes
+        except ValueError:
+            df, _ = self._frame([])
+            return FunnelCube.from_frame(df, [self._segment]), {}
+
+    def _counts(self, column=None):
+        cube, axes = self.compute('cube')
+        if column is None:
+            return cube.rollup(self._segment)
+        if column not in axes:
+            df, axes = self._frame([column])
+            cube = FunnelCube.from_frame(df, [self._segment, axes[column]])
+        return cube.rollup([self._segment, axes[column]])
+
+    def compute(self, name):
+        """
+        Returns the aggregate `name`, computing it and its dependencies on first use.
+        """
+        if name not in self.cache:
+            with span(f'recommendations.{name}'):
+                if name == 'cube':
+                    value = self._cube()
+                elif name == 'counts' or name.startswith('counts:'):
+                    value = self._counts(name.split(':', 1)[1] if ':' in name else None)
+                elif name in AGGREGATES:
+                    requires, func = AGGREGATES[name]
+                    value = func(*(self.compute(dependency) for dependency in requires))
+                else:
+                    raise ValueError(f"Unknown aggregate '{name}'; expected one of {sorted(AGGREGATES)}")
+            self.cache[name] = value
+        return self.cache[name]
+
+    @instrument()
+    def recommend(self):
+        """
+        Evaluates every rule for every segment.
+
+        Rules whose aggregates need a column the frame lacks (e.g. 'room_type' on contacts
+        without listings) are skipped.
+
+        Returns:
+            list of dict: Recommendations in rule order, each with 'rule', 'segment' (None
+            without segment_by), 'insight' and 'recommendation' keys.
+        """
+        keep = None
+        if self.min_inquiries:
+            inquiries = self.compute('inquiries')
+            keep = inquiries.index[inquiries >= self.min_inquiries]
+        recommendations = []
+        for each in self.rules:
+            try:
+                values = {name: self.compute(name) for name in each.requires}
+            except KeyError as error:
+                logger.debug("Skipping rule '%s': %s", each.name, error)
+                continue
+            if keep is not None:
+                values = {name: value.loc[value.index.intersection(keep)] for name, value in values.items()}
+            recommendations.extend(each.evaluate(values))
+        if not self.segment_by:
+            for recommendation in recommendations:
+                recommendation['segment'] = None
+        return recommendations
+
 
 def generate_recommendations(metrics, funnel_by_channel, room_type_conversion, user_stage_conversion):
     """
     Generates actionable recommendations and insights based on booking funnel metrics, room type conversion rates,
     user stage conversion rates, and average response time.
+    Overall metrics only, precomputed by the caller; RecommendationEngine evaluates RULES from the data, per segment.
     Args:
         metrics (dict): Dictionary containing overall booking metrics, including 'booking_rate' (float) and 'avg_response_time' (float, in hours).
         funnel_by_channel (pandas.Series): Series indexed by booking channel (e.g., 'instant_book') with corresponding conversion rates (float).
         room_type_conversion (pandas.Series): Series indexed by room type (e.g., 'entire home', 'private room') with corresponding booking rates (float).
-        user_stage_conversion (dict): Dictionary with user stages as keys (e.g., 'new', 'past booker') and their conversion rates (float).
+        user_stage_conversion (dict): Dictionary with user stages as keys (e.g., 'new', 'past_booker', as returned
+            by metrics.conversion_by_user_stage) and their conversion rates (float). The older 'past booker' key is also accepted.
     Returns:
         list of dict: A list of recommendations, each as a dictionary with 'insight' and 'recommendation' keys.
     """
@@ -36,7 +524,7 @@ def generate_recommendations(metrics, funnel_by_channel, room_type_conversion, u
 
     # 3. New vs past user conversion
     new_user_rate = user_stage_conversion.get('new', None)
-    past_user_rate = user_stage_conversion.get('past booker', None)
+    past_user_rate = user_stage_conversion.get('past_booker', user_stage_conversion.get('past booker', None))
 
     if new_user_rate and past_user_rate:
         if past_user_rate > new_user_rate * 1.3:
@@ -0,0 +1,270 @@
+# src/report.py
+#
+# Headless batch report: computes every metric, funnel table and recommendation once, writes
+# them to a metrics JSON along with the small aggregates the figures are drawn from, and renders
+# all figures concurrently in worker processes on the Agg backend. Figures whose inputs have not
+# changed since the last run are skipped.
+#
+# Usage:
+#     python -m src.report [--data-dir data] [--output-dir outputs] [--workers N] [--force]
+#     python -m src.report --from-aggregates outputs/plot_aggregates.json
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from src import plots  # noqa: E402
+from src.cache import CACHE_DIR, load_clean_data  # noqa: E402
+from src.clean_data import clean_contacts, clean_listings, clean_users  # noqa: E402
+from src.enrich import build_fact_table  # noqa: E402
+from src.funnel_analysis import (  # noqa: E402
+    funnel_by_contact_channel, funnel_by_neighborhood, funnel_by_room_type, get_funnel_stage_distribution,
+)
+from src.load_data import load_all_data  # noqa: E402
+from src.metrics import (  # noqa: E402
+    acceptance_rate, avg_accept_time, avg_response_time, booking_rate,
+    conversion_by_contact_channel, conversion_by_user_stage, response_rate,
+)
+from src.plot_aggregates import compute_plot_aggregates, load_plot_aggregates, save_plot_aggregates  # noqa: E402
+from src.profiling import instrument  # noqa: E402
+from src.recommendations import RecommendationEngine  # noqa: E402
+
+MANIFEST_NAME = '.manifest.json'
+
+PLOT_AGGREGATES_NAME = 'plot_aggregates.json'
+
+
+@instrument()
+def compute_report(contacts, listings, users, min_inquiries=50):
+    """
+    Computes every metric, funnel table and recommendation once.
+
+    Parameters:
+        contacts (pd.DataFrame): Cleaned contacts.
+        listings (pd.DataFrame): Cleaned listings.
+        users (pd.DataFrame): Cleaned users.
+        min_inquiries (int, optional): Neighborhood cutoff for funnel_by_neighborhood. Defaults to 50.
+
+    Returns:
+        tuple: (report dict of metrics, tables and recommendations, fact table).
+    """
+    fact = build_fact_table(contacts, listings, users)
+    metrics = {
+        'booking_rate': booking_rate(fact),
+        'response_rate': response_rate(fact),
+        'acceptance_rate': acceptance_rate(fact),
+        'avg_response_time': avg_response_time(fact),
+        'avg_accept_time': avg_accept_time(fact),
+    }
+    conversion_channel = conversion_by_contact_channel(fact)
+    conversion_user_stage = conversion_by_user_stage(fact)
+    room_type_conversion = funnel_by_room_type(fact)
+    report = {
+        'metrics': metrics,
+        'funnel_stage_distribution': get_funnel_stage_distribution(fact),
+        'conversion_by_contact_channel': conversion_channel,
+        'conversion_by_user_stage': conversion_user_stage,
+        'funnel_by_contact_channel': funnel_by_contact_channel(fact),
+        'funnel_by_room_type': room_type_conversion,
+        'funnel_by_neighborhood': funnel_by_neighborhood(fact, min_inquiries=min_inquiries),
+        'recommendations': RecommendationEngine(fact).recommend(),
+    }
+    return report, fact
+
+
+def figure_jobs(aggregates, min_inquiries=50, max_hours=72):
+    """
+    Lists the figures to render as (file name, plot function name, positional args, keyword args).
+
+    Each job only carries the precomputed aggregate its plot draws (see
+    plot_aggregates.compute_plot_aggregates), so little data is sent to the worker processes
+    and rendering time does not grow with the number of inquiries. `min_inquiries` and
+    `max_hours` are only used for aggregates saved without the parameters they were computed
+    with; otherwise the figures are labelled with the saved values.
+    """
+    parameters = aggregates.get('parameters', {})
+    min_inquiries = parameters.get('min_inquiries', min_inquiries)
+    max_hours = parameters.get('max_hours', max_hours)
+    return [
+        ('funnel_stage.png', 'plot_funnel_stage_distribution', (aggregates['funnel_stage_counts'],), {}),
+        ('booking_by_contact_method.png', 'plot_booking_rate_by_contact_channel',
+         (aggregates['booking_rate_by_contact_channel'],), {}),
+        ('booking_by_room_type.png', 'plot_booking_rate_by_room_type',
+         (aggregates['booking_rate_by_room_type'],), {}),
+        ('response_time_trimmed.png', 'plot_trimmed_response_time_distribution',
+         (aggregates['response_time_histogram'],), {'max_hours': max_hours}),
+        ('response_time_cdf.png', 'plot_response_time_cdf',
+         (aggregates['response_time_sketch'],), {'max_hours': max_hours}),
+        ('booking_by_user_stage.png', 'plot_booking_rate_by_user_stage',
+         (aggregates['booking_rate_by_user_stage'],), {}),
+        ('booking_by_neighborhood.png', 'plot_top_neighborhoods',
+         (aggregates['booking_rate_by_neighborhood'],), {'top_n': 10, 'min_inquiries': min_inquiries}),
+    ]
+
+
+def fingerprint(function_name, args, kwargs):
+    """
+    Hashes a plot function name and its inputs; frames, histograms and sketches are hashed by content.
+    """
+    digest = hashlib.sha256(function_name.encode('utf-8'))
+    for value in list(args) + sorted(kwargs.items()):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            # Hash the JSON form, so inputs read back from plot_aggregates.json match the originals
+            digest.update(value.to_json(orient='split', double_precision=15).encode('utf-8'))
+            labels = value.columns if isinstance(value, pd.DataFrame) else value.name
+            digest.update(repr(labels).encode('utf-8'))
+        elif hasattr(value, 'to_dict'):
+            digest.update(json.dumps(value.to_dict(), sort_keys=True).encode('utf-8'))
+        else:
+            digest.update(pickle.dumps(value, protocol=4))
+    return digest.hexdigest()
+
+
+def _render(function_name, args, kwargs, save_path):
+    import matplotlib.pyplot as plt
+
+    with warnings.catch_warnings():
+        # plt.show() is a no-op on Agg; silence its warning and seaborn's palette notice
+        warnings.simplefilter('ignore', UserWarning)
+        warnings.simplefilter('ignore', FutureWarning)
+        getattr(plots, function_name)(*args, save_path=save_path, **kwargs)
+    plt.close('all')
+    return save_path
+
+
+@instrument()
+def render_figures(jobs, plot_dir, workers=None, force=False):
+    """
+    Renders figures concurrently, skipping those whose inputs match the previous run.
+
+    Parameters:
+        jobs (list): Output of figure_jobs.
+        plot_dir (str): Directory for the PNG files and the manifest of input fingerprints.
+        workers (int, optional): Number of worker processes. Defaults to os.cpu_count().
+        force (bool, optional): Re-render every figure. Defaults to False.
+
+    Returns:
+        tuple of list: (rendered file names, skipped file names).
+    """
+    os.makedirs(plot_dir, exist_ok=True)
+    manifest_path = os.path.join(plot_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as handle:
+            manifest = json.load(handle)
+
+    pending, skipped = [], []
+    for file_name, function_name, args, kwargs in jobs:
+        key = fingerprint(function_name, args, kwargs)
+        path = os.path.join(plot_dir, file_name)
+        if not force and manifest.get(file_name) == key and os.path.exists(path):
+            skipped.append(file_name)
+        else:
+            pending.append((file_name, function_name, args, kwargs, key))
+
+    if pending:
+        with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+            futures = {
+                file_name: pool.submit(_render, function_name, args, kwargs, os.path.join(plot_dir, file_name))
+                for file_name, function_name, args, kwargs, _ in pending
+            }
+            for file_name, _, _, _, key in pending:
+                futures[file_name].result()
+                manifest[file_name] = key
+
+    with open(manifest_path, 'w') as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    return [job[0] for job in pending], skipped
+
+
+def to_jsonable(value):
+    """
+    Converts metrics, Series, DataFrames and NumPy scalars into JSON-serializable values (NaN -> None).
+    """
+    if isinstance(value, pd.DataFrame):
+        # to_dict('index') keeps each column's type; iterrows() would upcast integer counts to float
+        return to_jsonable(value.to_dict('index'))
+    if isinstance(value, pd.Series):
+        return to_jsonable(value.to_dict())
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    return value
+
+
+@instrument()
+def write_metrics(report, path):
+    """
+    Writes the report as JSON.
+    """
+    with open(path, 'w') as handle:
+        json.dump(to_jsonable(report), handle, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Regenerate the booking funnel metrics and figures.')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--output-dir', default='outputs')
+    parser.add_argument('--workers', type=int, default=None, help='Figure rendering processes (default: all cores).')
+    parser.add_argument('--min-inquiries', type=int, default=50,
+                        help='Neighborhood cutoff; --from-aggregates uses the one saved with the aggregates.')
+    parser.add_argument('--no-cache', action='store_true', help='Parse and clean the CSVs without the on-disk cache.')
+    parser.add_argument('--force', action='store_true', help='Re-render figures even if their inputs are unchanged.')
+    parser.add_argument('--from-aggregates', metavar='PATH',
+                        help=f'Render figures from a saved {PLOT_AGGREGATES_NAME} without loading any CSV.')
+    args = parser.parse_args(argv)
+    plot_dir = os.path.join(args.output_dir, 'plots')
+
+    if args.from_aggregates:
+        rendered, skipped = render_figures(
+            figure_jobs(load_plot_aggregates(args.from_aggregates), args.min_inquiries),
+            plot_dir,
+            workers=args.workers,
+            force=args.force,
+        )
+        print(f'Rendered {len(rendered)} figure(s) from {args.from_aggregates}, {len(skipped)} unchanged.')
+        return 0
+
+    paths = [os.path.join(args.data_dir, f'{name}.csv') for name in ('contacts', 'listings', 'users')]
+    if args.no_cache:
+        contacts, listings, users = load_all_data(*paths)
+        contacts, listings, users = clean_contacts(contacts), clean_listings(listings), clean_users(users)
+    else:
+        contacts, listings, users = load_clean_data(*paths, cache_dir=os.path.join(args.data_dir, os.path.basename(CACHE_DIR)))
+
+    report, fact = compute_report(contacts, listings, users, args.min_inquiries)
+    os.makedirs(args.output_dir, exist_ok=True)
+    metrics_path = os.path.join(args.output_dir, 'metrics.json')
+    write_metrics(report, metrics_path)
+    aggregates = compute_plot_aggregates(fact, min_inquiries=args.min_inquiries)
+    save_plot_aggregates(aggregates, os.path.join(args.output_dir, PLOT_AGGREGATES_NAME))
+
+    rendered, skipped = render_figures(
+        figure_jobs(aggregates, args.min_inquiries),
+        plot_dir,
+        workers=args.workers,
+        force=args.force,
+    )
+    print(f'Wrote {metrics_path}; rendered {len(rendered)} figure(s), {len(skipped)} unchanged.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
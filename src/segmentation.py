@@ -0,0 +1,321 @@
+# src/segmentation.py
+#
+# Guest and listing segments. guest_features and listing_features build one numeric row per
+# guest or listing with a few factorize + bincount passes over the contacts, never a groupby
+# per entity. Segmentation standardizes that matrix and clusters it with scikit-learn's
+# MiniBatchKMeans through partial_fit, one batch at a time, so only a single batch of scaled
+# rows exists at once however many guests there are. assign_segments joins the labels onto
+# contacts as 'guest_segment' and 'listing_segment', which funnel_analysis.funnel_by_segment
+# and the aggregates (ContactAggregates, FunnelCube, DuckDBContacts) group on like any other
+# column. scikit-learn is optional and only needed to fit and predict segments.
+
+import numpy as np
+import pandas as pd
+
+from src.enrich import first_rows, lookup
+from src.profiling import instrument
+
+try:
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.preprocessing import StandardScaler
+except ImportError:
+    MiniBatchKMeans = None
+    StandardScaler = None
+
+SEGMENT_COLUMNS = {'guest': 'guest_segment', 'listing': 'listing_segment'}
+
+
+def _entity_codes(table_ids, contact_ids, name):
+    """
+    Numbers every id found in a dimension table or in the contacts.
+
+    Returns:
+        tuple: (pd.Index of ids named `name`, codes of `table_ids`, codes of `contact_ids`).
+    """
+    ids = pd.concat([pd.Series(np.asarray(table_ids, dtype=object)),
+                     pd.Series(np.asarray(contact_ids, dtype=object))], ignore_index=True)
+    codes, uniques = pd.factorize(ids)
+    return pd.Index(uniques, name=name), codes[:len(table_ids)], codes[len(table_ids):]
+
+
+def _per_entity_mean(codes, values, n):
+    """
+    Mean of `values` per entity code, ignoring NaN, with the number of non-missing values.
+    """
+    valid = ~np.isnan(values) & (codes >= 0)
+    counts = np.bincount(codes[valid], minlength=n)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan), counts
+
+
+def _one_hot(labels, codes, n, prefix, top=None):
+    """
+    Indicator columns for the most frequent labels (all of them if `top` is None), with an
+    '<prefix>_other' column for the rest. Entities with a missing label get all zeros.
+    """
+    labels = pd.Series(np.asarray(labels, dtype=object))
+    present = labels.notna().to_numpy() & (codes >= 0)
+    counts = labels[present].value_counts()
+    kept = list(counts.index if top is None else counts.index[:top])
+    position = pd.Index(kept).get_indexer(labels[present])
+    position[position < 0] = len(kept)
+    matrix = np.zeros((n, len(kept) + 1), dtype=np.float32)
+    matrix[codes[present], position] = 1
+    columns = {f'{prefix}_{label}': matrix[:, i] for i, label in enumerate(kept)}
+    if top is not None and len(counts) > len(kept):
+        columns[f'{prefix}_other'] = matrix[:, -1]
+    return columns
+
+
+def _channel_mix(codes, channels, n):
+    """
+    Share of each entity's inquiries made through each contact channel.
+    """
+    channel_codes, names = pd.factorize(channels, sort=True)
+    valid = (channel_codes >= 0) & (codes >= 0)
+    counts = np.bincount(codes[valid] * len(names) + channel_codes[valid], minlength=n * len(names))
+    counts = counts.reshape(n, len(names))
+    totals = np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    return {f'channel_{name}': (counts[:, i] / totals[:, 0]).astype(np.float32) for i, name in enumerate(names)}
+
+
+@instrument()
+def guest_features(df_contacts, df_users=None, top_countries=20):
+    """
+    Builds one row of numeric features per guest.
+
+    Counts and hours are log1p-scaled, as they are heavy-tailed.
+
+    Parameters:
+        df_contacts (pd.DataFrame): Output of clean_contacts (or a fact table).
+        df_users (pd.DataFrame, optional): Output of clean_users. Users who never made an
+            inquiry get a row too. Defaults to None (guests from the contacts only).
+        top_countries (int, optional): Countries given their own indicator column; the rest
+            share 'country_other'. Defaults to 20.
+
+    Returns:
+        pd.DataFrame: float32 features indexed by 'id_user_anon':
+            - 'profile_words', 'has_profile': from the users table (0 without a users row).
+            - 'inquiries': number of inquiries the guest made.
+            - 'reply_share', 'response_hours': share of their inquiries replied to, and mean
+              hours to the first reply they received (0 if never replied to).
+            - 'channel_<name>': share of their inquiries made through each contact channel.
+            - 'country_<code>': one-hot country of the guest.
+    """
+    users = None if df_users is None else first_rows(df_users, 'id_user_anon')
+    index, user_codes, codes = _entity_codes(
+        [] if users is None else users['id_user_anon'], df_contacts['id_guest_anon'], 'id_user_anon')
+    n = len(index)
+
+    features = {}
+    words = np.zeros(n)
+    if users is not None:
+        known = user_codes >= 0
+        words[user_codes[known]] = users['words_in_user_profile'].to_numpy(dtype=float, na_value=0)[known]
+    features['profile_words'] = np.log1p(np.maximum(words, 0))
+    features['has_profile'] = (words > 0).astype(float)
+
+    # Inquiries without a guest id count towards no guest
+    valid = codes >= 0
+    inquiries = np.bincount(codes[valid], minlength=n)
+    replied = np.bincount(codes[valid], weights=df_contacts['ts_reply_at_first'].notna().to_numpy(dtype=float)[valid],
+                          minlength=n)
+    hours, _ = _per_entity_mean(codes, df_contacts['response_time_hours'].to_numpy(dtype=float, na_value=np.nan), n)
+    features['inquiries'] = np.log1p(inquiries)
+    features['reply_share'] = replied / np.maximum(inquiries, 1)
+    features['response_hours'] = np.log1p(np.nan_to_num(np.maximum(hours, 0)))
+    features.update(_channel_mix(codes, df_contacts['contact_channel_first'], n))
+
+    if users is not None and 'country' in users.columns:
+        features.update(_one_hot(users['country'], user_codes, n, 'country', top_countries))
+    return pd.DataFrame(features, index=index).astype(np.float32)
+
+
+@instrument()
+def listing_features(df_contacts, df_listings, top_neighborhoods=20):
+    """
+    Builds one row of numeric features per listing.
+
+    Host responsiveness is measured over all inquiries to the host ('id_host_anon'), across
+    their listings, and given to each listing through the host of its first inquiry.
+
+    Parameters:
+        df_contacts (pd.DataFrame): Output of clean_contacts (or a fact table).
+        df_listings (pd.DataFrame): Output of clean_listings.
+        top_neighborhoods (int, optional): Neighborhoods given their own indicator column; the
+            rest share 'neighborhood_other'. Defaults to 20.
+
+    Returns:
+        pd.DataFrame: float32 features indexed by 'id_listing_anon':
+            - 'reviews': total reviews of the listing.
+            - 'inquiries': number of inquiries the listing received.
+            - 'host_reply_share', 'host_response_hours', 'host_accept_share': share of the
+              host's inquiries replied to, mean hours to reply and share accepted.
+            - 'room_<type>', 'neighborhood_<name>': one-hot room type and neighborhood.
+    """
+    listings = first_rows(df_listings, 'id_listing_anon')
+    index, listing_codes, codes = _entity_codes(listings['id_listing_anon'], df_contacts['id_listing_anon'],
+                                                'id_listing_anon')
+    n = len(index)
+
+    features = {}
+    reviews = np.zeros(n)
+    known = listing_codes >= 0
+    reviews[listing_codes[known]] = listings['total_reviews'].to_numpy(dtype=float, na_value=0)[known]
+    # The export holds a few negative review counts; they are treated as no reviews
+    features['reviews'] = np.log1p(np.maximum(reviews, 0))
+    features['inquiries'] = np.log1p(np.bincount(codes[codes >= 0], minlength=n))
+
+    host_codes, hosts = pd.factorize(df_contacts['id_host_anon'])
+    n_hosts = len(hosts)
+    host_inquiries = np.maximum(np.bincount(host_codes[host_codes >= 0], minlength=n_hosts), 1)
+
+    def host_share(flags):
+        return np.bincount(host_codes[host_codes >= 0], weights=flags[host_codes >= 0], minlength=n_hosts) / host_inquiries
+
+    host_hours, _ = _per_entity_mean(host_codes, df_contacts['response_time_hours'].to_numpy(dtype=float, na_value=np.nan),
+                                     n_hosts)
+    host = {
+        'host_reply_share': host_share(df_contacts['ts_reply_at_first'].notna().to_numpy(dtype=float)),
+        'host_response_hours': np.log1p(np.nan_to_num(np.maximum(host_hours, 0))),
+        'host_accept_share': host_share(df_contacts['ts_accepted_at_first'].notna().to_numpy(dtype=float)),
+    }
+    # Host of each listing's first inquiry; listings never inquired about, or whose first
+    # inquiry has no host id, keep zeros
+    listing_host = np.full(n, -1)
+    first = pd.Series(codes).drop_duplicates(keep='first')
+    first = first[first >= 0]
+    listing_host[first.to_numpy()] = host_codes[first.index.to_numpy()]
+    hosted = listing_host >= 0
+    for name, values in host.items():
+        features[name] = np.zeros(n)
+        features[name][hosted] = values[listing_host[hosted]]
+
+    features.update(_one_hot(listings['room_type'], listing_codes, n, 'room'))
+    features.update(_one_hot(listings['listing_neighborhood'], listing_codes, n, 'neighborhood', top_neighborhoods))
+    return pd.DataFrame(features, index=index).astype(np.float32)
+
+
+def _batches(n_rows, batch_size):
+    return [slice(start, min(start + batch_size, n_rows)) for start in range(0, n_rows, batch_size)]
+
+
+class Segmentation:
+    """
+    Mini-batch k-means clustering of a feature matrix, fitted and applied batch by batch.
+
+    Features are standardized with a StandardScaler fitted in one streaming pass, then the
+    clusters are fitted with MiniBatchKMeans.partial_fit over `epochs` passes of shuffled
+    batches. Memory beyond the feature matrix itself is one scaled batch.
+
+    Parameters:
+        n_segments (int, optional): Number of segments. Defaults to 8.
+        batch_size (int, optional): Rows per batch. Defaults to 10,000.
+        epochs (int, optional): Passes over the rows when fitting. Defaults to 3.
+        seed (int, optional): Seed for the batch order and the cluster initialization. Defaults to 0.
+    """
+
+    def __init__(self, n_segments=8, batch_size=10_000, epochs=3, seed=0):
+        if MiniBatchKMeans is None:
+            raise ImportError('Segmentation requires the scikit-learn package')
+        if batch_size < n_segments:
+            raise ValueError(f'batch_size ({batch_size}) must be at least n_segments ({n_segments})')
+        self.n_segments = n_segments
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.seed = seed
+        self.columns = None
+        self.scaler = None
+        self.kmeans = None
+
+    def fit(self, features):
+        """
+        Fits the scaler and the clusters.
+
+        Parameters:
+            features (pd.DataFrame): Output of guest_features or listing_features.
+
+        Returns:
+            Segmentation: self, to allow chaining.
+        """
+        if len(features) < self.n_segments:
+            raise ValueError(f'Cannot fit {self.n_segments} segments to {len(features)} rows')
+        values = features.to_numpy(dtype=np.float32)
+        batches = _batches(len(values), self.batch_size)
+        self.columns = list(features.columns)
+        self.scaler = StandardScaler()
+        for batch in batches:
+            self.scaler.partial_fit(values[batch])
+
+        rng = np.random.default_rng(self.seed)
+        self.kmeans = MiniBatchKMeans(n_clusters=self.n_segments, batch_size=self.batch_size, n_init=3,
+                                      random_state=self.seed)
+        initialized = False
+        for _ in range(self.epochs):
+            order = rng.permutation(len(values))
+            for batch in batches:
+                rows = order[batch]
+                # partial_fit initializes the centers on its first batch, which needs n_segments rows
+                if not initialized and len(rows) < self.n_segments:
+                    continue
+                self.kmeans.partial_fit(self.scaler.transform(values[rows]))
+                initialized = True
+        return self
+
+    def predict(self, features):
+        """
+        Assigns every row to its nearest segment.
+
+        Parameters:
+            features (pd.DataFrame): Features with the columns the model was fitted on.
+
+        Returns:
+            pd.Series: Int16 segment labels (0 to n_segments - 1), indexed like `features`.
+        """
+        if self.kmeans is None:
+            raise ValueError('Segmentation is not fitted; call fit() first')
+        values = features[self.columns].to_numpy(dtype=np.float32)
+        labels = np.empty(len(values), dtype=np.int16)
+        for batch in _batches(len(values), self.batch_size):
+            labels[batch] = self.kmeans.predict(self.scaler.transform(values[batch]))
+        return pd.Series(pd.array(labels, dtype='Int16'), index=features.index, name='segment')
+
+    def fit_predict(self, features):
+        return self.fit(features).predict(features)
+
+    def centers(self):
+        """
+        Returns:
+            pd.DataFrame: Segment centers in the original (unscaled) feature units, one row per segment.
+        """
+        if self.kmeans is None:
+            raise ValueError('Segmentation is not fitted; call fit() first')
+        centers = self.scaler.inverse_transform(self.kmeans.cluster_centers_)
+        return pd.DataFrame(centers, index=pd.RangeIndex(self.n_segments, name='segment'), columns=self.columns)
+
+
+@instrument(preserves_rows=True)
+def assign_segments(df_contacts, guest_segments=None, listing_segments=None):
+    """
+    Adds the segment of each inquiry's guest and listing as 'guest_segment' and 'listing_segment'.
+
+    Parameters:
+        df_contacts (pd.DataFrame): Cleaned contacts DataFrame or fact table.
+        guest_segments (pd.Series, optional): Segment per 'id_user_anon', e.g. from
+            Segmentation.predict(guest_features(...)).
+        listing_segments (pd.Series, optional): Segment per 'id_listing_anon'.
+
+    Returns:
+        pd.DataFrame: A shallow copy of `df_contacts` with the segment columns added
+        (<NA> for guests or listings without a segment).
+    """
+    df = df_contacts.copy(deep=False)
+    for kind, key, segments in (('guest', 'id_guest_anon', guest_segments),
+                                ('listing', 'id_listing_anon', listing_segments)):
+        if segments is None:
+            continue
+        column = SEGMENT_COLUMNS[kind]
+        table = pd.DataFrame({'id': np.asarray(segments.index, dtype=object), column: segments.array})
+        df[column] = lookup(df[key], table, 'id', [column])[column]
+    return df
@@ -0,0 +1,392 @@
+# src/service.py
+#
+# Local HTTP/JSON query service for dashboards. The cleaned data is loaded once at startup and
+# joined into a fact table; every metric and funnel breakdown in QUERIES is then served from it
+# with optional filters on the interaction date, contact channel, room type and neighborhood.
+#
+# Responses are kept, already serialized, in an LRU ResultCache keyed by the query name, its
+# normalized filters and parameters and the generation of the data, so a repeated dashboard
+# query costs a dictionary lookup. Loading new data (reload() or POST /reload) starts a new
+# generation and empties the cache; reload() only does so if the source files changed.
+#
+# Only the standard library's ThreadingHTTPServer is used, one thread per connection.
+#
+# Usage:
+#     python -m src.service [--data-dir data] [--host 127.0.0.1] [--port 8050] [--cache-size 1024]
+#
+#     GET  /                                   query names, their parameters and the filters
+#     GET  /<query>?channel=book_it,contact_me&room_type=entire%20home&neighborhood=Centro
+#                  &start=2016-01-01&end=2016-07-01&<parameter>=<value>
+#     GET  /stats                              cache size, hits and misses
+#     POST /reload                             reload the data if the CSVs changed
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from src import funnel_analysis, metrics
+from src.cache import CACHE_DIR, file_digest, load_clean_data
+from src.enrich import build_fact_table
+from src.profiling import instrument, span
+from src.report import to_jsonable
+
+logger = logging.getLogger(__name__)
+
+# Query parameter -> fact table column it filters on, matching any of a comma-separated list
+FILTERS = {
+    'channel': 'contact_channel_first',
+    'room_type': 'room_type',
+    'neighborhood': 'listing_neighborhood',
+}
+
+# Column of the date range filter: start <= date < end
+DATE_COLUMN = 'ts_interaction_first'
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('1', 'true', 'yes'):
+        return True
+    if str(value).lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Expected a boolean, got '{value}'")
+
+
+# Query name -> (function of the filtered fact table, {parameter: type converting its value})
+QUERIES = {
+    'booking_rate': (metrics.booking_rate, {}),
+    'response_rate': (metrics.response_rate, {}),
+    'acceptance_rate': (metrics.acceptance_rate, {}),
+    'avg_response_time': (metrics.avg_response_time, {}),
+    'avg_accept_time': (metrics.avg_accept_time, {}),
+    'conversion_by_contact_channel': (metrics.conversion_by_contact_channel, {}),
+    'conversion_by_user_stage': (metrics.conversion_by_user_stage, {}),
+    'get_funnel_stage_distribution': (funnel_analysis.get_funnel_stage_distribution, {'normalize': _boolean}),
+    'funnel_by_contact_channel': (funnel_analysis.funnel_by_contact_channel, {}),
+    'funnel_by_guest_user_stage': (funnel_analysis.funnel_by_guest_user_stage, {}),
+    'funnel_by_room_type': (funnel_analysis.funnel_by_room_type, {}),
+    'funnel_by_neighborhood': (funnel_analysis.funnel_by_neighborhood, {'min_inquiries': int, 'confidence': float}),
+}
+
+
+class UnknownQueryError(KeyError):
+    """
+    Raised for a query name that is not in QUERIES (answered with 404).
+    """
+
+
+def _timestamp(key, value):
+    """
+    Parses a 'start' or 'end' filter; the fact table's timestamps are naive, so offsets are rejected.
+    """
+    timestamp = pd.Timestamp(value)
+    if timestamp.tz is not None:
+        raise ValueError(f"'{key}' must be a date or time without a timezone, got '{value}'")
+    return timestamp.isoformat()
+
+
+class ResultCache:
+    """
+    Thread-safe least-recently-used cache of query results.
+
+    Parameters:
+        maxsize (int, optional): Results kept; the least recently used is evicted beyond it.
+            0 disables caching. Defaults to 1024.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached result for `key`, or None.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: 'size', 'maxsize', 'hits', 'misses' and 'hit_rate'.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+
+def _values(value):
+    """
+    Filter values as a sorted tuple, from a comma-separated string or a list.
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    return tuple(sorted({str(v).strip() for v in value if str(v).strip()}))
+
+
+class QueryService:
+    """
+    Serves QUERIES over one fact table through a ResultCache.
+
+    Parameters:
+        contacts (pd.DataFrame): Cleaned contacts.
+        listings (pd.DataFrame): Cleaned listings, joined on for the room type and neighborhood.
+        users (pd.DataFrame, optional): Cleaned users. Defaults to None.
+        cache_size (int, optional): ResultCache size. Defaults to 1024.
+    """
+
+    def __init__(self, contacts, listings, users=None, cache_size=1024):
+        self.cache = ResultCache(cache_size)
+        self.generation = 0
+        self.paths = None
+        self.sources = None
+        self.cache_dir = CACHE_DIR
+        self._lock = threading.Lock()
+        self.load(contacts, listings, users)
+
+    @classmethod
+    def from_files(cls, data_dir='data', cache_dir=None, cache_size=1024):
+        """
+        Builds the service from contacts.csv, listings.csv and users.csv in `data_dir`, going
+        through the cleaned-data cache (by default `data_dir`/.cache), and remembers the paths
+        for reload().
+        """
+        paths = [os.path.join(data_dir, f'{name}.csv') for name in ('contacts', 'listings', 'users')]
+        cache_dir = cache_dir or os.path.join(data_dir, os.path.basename(CACHE_DIR))
+        sources = tuple(file_digest(path) for path in paths)
+        service = cls(*load_clean_data(*paths, cache_dir=cache_dir), cache_size=cache_size)
+        service.paths, service.sources, service.cache_dir = paths, sources, cache_dir
+        return service
+
+    @instrument()
+    def load(self, contacts, listings, users=None):
+        """
+        Replaces the data with a new fact table and empties the result cache.
+        """
+        fact = build_fact_table(contacts, listings, users)
+        with self._lock:
+            self.fact = fact
+            self.generation += 1
+            self.cache.clear()
+
+    def reload(self):
+        """
+        Reloads the files given to from_files if any of them changed.
+
+        Returns:
+            bool: True if the data was reloaded and the cache emptied.
+        """
+        if self.paths is None:
+            raise ValueError('Only a service built with from_files can reload its data')
+        sources = tuple(file_digest(path) for path in self.paths)
+        if sources == self.sources:
+            return False
+        self.load(*load_clean_data(*self.paths, cache_dir=self.cache_dir))
+        self.sources = sources
+        return True
+
+    def _parse(self, name, params):
+        """
+        Splits request parameters into normalized filters and query arguments.
+
+        Raises:
+            UnknownQueryError: If `name` is not in QUERIES.
+            ValueError: If a parameter is unknown or its value invalid.
+        """
+        if name not in QUERIES:
+            raise UnknownQueryError(f"Unknown query '{name}'; expected one of {sorted(QUERIES)}")
+        _, types = QUERIES[name]
+        filters, arguments = {}, {}
+        for key, value in params.items():
+            if key in FILTERS:
+                filters[key] = _values(value)
+            elif key in ('start', 'end'):
+                filters[key] = _timestamp(key, value)
+            elif key in types:
+                arguments[key] = types[key](value)
+            else:
+                raise ValueError(f"Unknown parameter '{key}' for '{name}'; expected one of "
+                                 f"{sorted(FILTERS) + ['end', 'start'] + sorted(types)}")
+        return filters, arguments
+
+    def _filter(self, fact, filters):
+        mask = np.ones(len(fact), dtype=bool)
+        for key, values in filters.items():
+            if key == 'start':
+                mask &= (fact[DATE_COLUMN] >= pd.Timestamp(values)).to_numpy()
+            elif key == 'end':
+                mask &= (fact[DATE_COLUMN] < pd.Timestamp(values)).to_numpy()
+            else:
+                mask &= fact[FILTERS[key]].isin(values).to_numpy()
+        return fact if mask.all() else fact[mask]
+
+    def query_json(self, name, params=None):
+        """
+        Runs a query and returns its JSON response body.
+
+        Parameters:
+            name (str): Query name, a key of QUERIES.
+            params (dict, optional): Filters (FILTERS keys, 'start', 'end') and query
+                parameters, as strings or already typed values.
+
+        Returns:
+            tuple: (UTF-8 JSON bytes, True if served from the cache).
+        """
+        filters, arguments = self._parse(name, params or {})
+        with self._lock:
+            fact, generation = self.fact, self.generation
+        key = (generation, name, tuple(sorted(filters.items())), tuple(sorted(arguments.items())))
+        body = self.cache.get(key)
+        if body is not None:
+            return body, True
+        func, _ = QUERIES[name]
+        with span(f'service.{name}'):
+            result = func(self._filter(fact, filters), **arguments)
+        body = json.dumps({'query': name, 'filters': filters, 'params': arguments,
+                           'result': to_jsonable(result)}).encode('utf-8')
+        self.cache.put(key, body)
+        return body, False
+
+    def query(self, name, **params):
+        """
+        Runs a query and returns its result as JSON-compatible Python values.
+        """
+        body, _ = self.query_json(name, params)
+        return json.loads(body)['result']
+
+    def describe(self):
+        """
+        Query names with their parameters, and the available filters.
+        """
+        return {
+            'queries': {name: sorted(types) for name, (_, types) in QUERIES.items()},
+            'filters': {**FILTERS, 'start': DATE_COLUMN, 'end': DATE_COLUMN},
+            'generation': self.generation,
+        }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of make_server; `service` is set on the subclass it creates.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; with Nagle's algorithm on, keep-alive clients
+    # would wait for a delayed ACK (~40 ms) on every response
+    disable_nagle_algorithm = True
+    service = None
+
+    def _send(self, status, body, cache=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if cache is not None:
+            self.send_header('X-Cache', 'hit' if cache else 'miss')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.strip('/')
+        if not name:
+            return self._send(200, self.service.describe())
+        if name == 'stats':
+            return self._send(200, {**self.service.cache.stats(), 'generation': self.service.generation})
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            body, hit = self.service.query_json(name, params)
+        except UnknownQueryError as error:
+            return self._send(404, {'error': error.args[0]})
+        except ValueError as error:
+            return self._send(400, {'error': str(error)})
+        except Exception:
+            logger.exception('Query %s failed', self.path)
+            return self._send(500, {'error': f"Query '{name}' failed"})
+        self._send(200, body, cache=hit)
+
+    def do_POST(self):
+        # Requests may carry a body, which is not used
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if urlsplit(self.path).path.strip('/') != 'reload':
+            return self._send(404, {'error': f'Unknown path {self.path}'})
+        try:
+            reloaded = self.service.reload()
+        except ValueError as error:
+            return self._send(400, {'error': str(error)})
+        self._send(200, {'reloaded': reloaded, 'generation': self.service.generation})
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+def make_server(service, host='127.0.0.1', port=8050):
+    """
+    Returns a ThreadingHTTPServer serving `service`; port 0 picks a free port
+    (server.server_address has the one bound).
+    """
+    handler = type('BoundQueryHandler', (QueryHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the booking funnel metrics over HTTP/JSON.')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--cache-size', type=int, default=1024, help='Query results kept in the LRU cache.')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    service = QueryService.from_files(args.data_dir, cache_size=args.cache_size)
+    server = make_server(service, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f'Serving {len(service.fact):,} inquiries on http://{host}:{port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
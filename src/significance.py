@@ -0,0 +1,246 @@
+# src/significance.py
+#
+# Uncertainty of conversion rates, computed from pre-aggregated counts: a group is just its
+# number of successes (e.g. bookings) and trials (inquiries), whatever produced them - a
+# groupby, ContactAggregates, a FunnelCube or DuckDB. Every function takes arrays of counts
+# and works on all groups at once.
+#
+# Bootstrap resampling of a 0/1 outcome only ever changes the number of successes drawn, and
+# that number is Binomial(trials, rate), so each resample of a group is one binomial draw
+# instead of a resample of its rows. Resamples are drawn as (groups x resamples) matrices, in
+# one chunk of groups per worker of a thread pool (NumPy's generators release the GIL). Seeds
+# belong to fixed blocks of SEED_BLOCK groups, not to chunks, so results do not depend on the
+# number of workers.
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from src.profiling import instrument
+
+# Largest (groups x resamples) chunk drawn at once
+MAX_BLOCK = 4_000_000
+
+# Groups drawn from one seed; chunks are whole numbers of these blocks
+SEED_BLOCK = 16
+
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def _counts(successes, trials):
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    if (successes < 0).any() or (successes > trials).any():
+        raise ValueError('successes must be between 0 and trials')
+    return successes, trials
+
+
+def _z(confidence):
+    if not 0 < confidence < 1:
+        raise ValueError(f'confidence must be between 0 and 1, got {confidence}')
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def normal_sf(z):
+    """
+    Upper tail probability P(Z > z) of the standard normal, element-wise.
+    """
+    z = np.asarray(z, dtype=float)
+    return (0.5 * _erfc(z / math.sqrt(2))).astype(float)
+
+
+def wilson_interval(successes, trials, confidence=0.95):
+    """
+    Wilson score interval of each rate successes / trials.
+
+    Unlike the normal approximation it stays within [0, 1] and behaves at rates of 0 or 1
+    and for small groups.
+
+    Parameters:
+        successes (array-like): Successes per group, e.g. bookings.
+        trials (array-like): Trials per group, e.g. inquiries.
+        confidence (float, optional): Confidence level. Defaults to 0.95.
+
+    Returns:
+        tuple of np.ndarray: (low, high) bounds, NaN for groups with no trials.
+    """
+    successes, trials = _counts(successes, trials)
+    z = _z(confidence)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = successes / trials
+        denominator = 1 + z ** 2 / trials
+        center = (rate + z ** 2 / (2 * trials)) / denominator
+        half = z * np.sqrt(rate * (1 - rate) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+    empty = trials == 0
+    low, high = np.clip(center - half, 0, 1), np.clip(center + half, 0, 1)
+    return np.where(empty, np.nan, low), np.where(empty, np.nan, high)
+
+
+def _bootstrap_chunk(successes, trials, resamples, quantiles, seeds):
+    rate = np.divide(successes, trials, out=np.zeros_like(successes), where=trials > 0)
+    counts = trials.astype(np.int64)
+    draws = np.empty((len(trials), resamples))
+    for block, seed in enumerate(seeds):
+        rows = slice(block * SEED_BLOCK, (block + 1) * SEED_BLOCK)
+        rng = np.random.default_rng(seed)
+        draws[rows] = rng.binomial(counts[rows, None], rate[rows, None], size=(len(counts[rows]), resamples))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = draws / trials[:, None]
+    return np.quantile(rates, quantiles, axis=1)
+
+
+@instrument()
+def bootstrap_interval(successes, trials, confidence=0.95, resamples=2000, seed=0, workers=None):
+    """
+    Percentile bootstrap interval of each rate successes / trials.
+
+    Parameters:
+        successes (array-like): Successes per group.
+        trials (array-like): Trials per group.
+        confidence (float, optional): Confidence level. Defaults to 0.95.
+        resamples (int, optional): Bootstrap resamples per group. Defaults to 2000.
+        seed (int, optional): Seed; the same seed gives the same intervals for any `workers`.
+            Defaults to 0.
+        workers (int, optional): Threads drawing chunks of groups; each gets about
+            len(trials) / workers groups, fewer if that would exceed MAX_BLOCK draws.
+            Defaults to the CPU count.
+
+    Returns:
+        tuple of np.ndarray: (low, high) bounds, NaN for groups with no trials.
+    """
+    successes, trials = _counts(successes, trials)
+    _z(confidence)
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+    workers = workers or os.cpu_count() or 1
+    seeds = np.random.SeedSequence(seed).spawn(math.ceil(len(trials) / SEED_BLOCK))
+    # Seed blocks per chunk: an even share for each worker, capped at MAX_BLOCK draws
+    per_chunk = max(1, min(math.ceil(len(seeds) / workers), MAX_BLOCK // (max(resamples, 1) * SEED_BLOCK)))
+    chunk = per_chunk * SEED_BLOCK
+    jobs = [(start, seeds[start // SEED_BLOCK:start // SEED_BLOCK + per_chunk]) for start in range(0, len(trials), chunk)]
+
+    def run(job):
+        start, chunk_seeds = job
+        return _bootstrap_chunk(successes[start:start + chunk], trials[start:start + chunk], resamples, quantiles, chunk_seeds)
+
+    if len(jobs) > 1 and workers != 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(run, jobs))
+    else:
+        parts = [run(job) for job in jobs]
+    bounds = np.concatenate(parts, axis=1) if parts else np.empty((2, 0))
+    empty = trials == 0
+    return np.where(empty, np.nan, bounds[0]), np.where(empty, np.nan, bounds[1])
+
+
+def two_proportion_test(successes_a, trials_a, successes_b, trials_b, alternative='two-sided'):
+    """
+    Pooled two-proportion z-test of rate a against rate b, element-wise.
+
+    Parameters:
+        successes_a, trials_a, successes_b, trials_b (array-like): Counts of the two groups.
+        alternative (str, optional): 'two-sided', 'greater' (rate a > rate b) or 'less'.
+            Defaults to 'two-sided'.
+
+    Returns:
+        tuple of np.ndarray: (difference of rates a - b, z statistic, p-value); NaN where
+        either group is empty or both rates are 0 or 1.
+    """
+    successes_a, trials_a = _counts(successes_a, trials_a)
+    successes_b, trials_b = _counts(successes_b, trials_b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_a, rate_b = successes_a / trials_a, successes_b / trials_b
+        pooled = (successes_a + successes_b) / (trials_a + trials_b)
+        error = np.sqrt(pooled * (1 - pooled) * (1 / trials_a + 1 / trials_b))
+        z = (rate_a - rate_b) / error
+    z = np.where(error > 0, z, np.nan)
+    if alternative == 'two-sided':
+        p_value = np.minimum(2 * normal_sf(np.abs(z)), 1)
+    elif alternative == 'greater':
+        p_value = normal_sf(z)
+    elif alternative == 'less':
+        p_value = normal_sf(-z)
+    else:
+        raise ValueError(f"Unknown alternative '{alternative}'; expected 'two-sided', 'greater' or 'less'")
+    return rate_a - rate_b, z, p_value
+
+
+def holm(p_values):
+    """
+    Holm-Bonferroni adjusted p-values, controlling the family-wise error rate. NaN p-values
+    are left out of the family and stay NaN.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full_like(p_values, np.nan)
+    tested = np.flatnonzero(~np.isnan(p_values))
+    order = tested[np.argsort(p_values[tested], kind='stable')]
+    scaled = p_values[order] * (len(order) - np.arange(len(order)))
+    adjusted[order] = np.minimum(np.maximum.accumulate(scaled), 1)
+    return adjusted
+
+
+def rate_table(successes, trials, index=None, confidence=0.95, method='wilson', **bootstrap_options):
+    """
+    Rates with their confidence intervals.
+
+    Parameters:
+        successes, trials (array-like or pd.Series): Counts per group.
+        index (pd.Index, optional): Group labels. Defaults to the index of `trials` if it is a Series.
+        confidence (float, optional): Confidence level. Defaults to 0.95.
+        method (str, optional): 'wilson' or 'bootstrap'. Defaults to 'wilson'.
+        **bootstrap_options: resamples, seed and workers for bootstrap_interval.
+
+    Returns:
+        pd.DataFrame: 'mean' (the rate), 'count' (trials), 'low' and 'high' per group.
+    """
+    if index is None and isinstance(trials, pd.Series):
+        index = trials.index
+    successes, trials = _counts(successes, trials)
+    if method == 'wilson':
+        low, high = wilson_interval(successes, trials, confidence)
+    elif method == 'bootstrap':
+        low, high = bootstrap_interval(successes, trials, confidence, **bootstrap_options)
+    else:
+        raise ValueError(f"Unknown interval method '{method}'; expected 'wilson' or 'bootstrap'")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = successes / trials
+    return pd.DataFrame({'mean': rate, 'count': trials.astype(np.int64), 'low': low, 'high': high}, index=index)
+
+
+def pairwise_tests(successes, trials, index=None, alpha=0.05, correction='holm'):
+    """
+    Two-sided two-proportion z-tests between every pair of groups.
+
+    Parameters:
+        successes, trials (array-like or pd.Series): Counts per group.
+        index (pd.Index, optional): Group labels. Defaults to the index of `trials` if it is a Series.
+        alpha (float, optional): Significance level applied to the adjusted p-values. Defaults to 0.05.
+        correction (str, optional): 'holm' or None for unadjusted p-values. Defaults to 'holm'.
+
+    Returns:
+        pd.DataFrame: One row per pair (a, b) with 'rate_a', 'rate_b', 'difference', 'z',
+        'p_value', 'p_adjusted' and 'significant', sorted by adjusted p-value.
+    """
+    if index is None:
+        index = trials.index if isinstance(trials, pd.Series) else pd.RangeIndex(len(trials))
+    successes, trials = _counts(successes, trials)
+    a, b = np.triu_indices(len(trials), k=1)
+    difference, z, p_value = two_proportion_test(successes[a], trials[a], successes[b], trials[b])
+    if correction == 'holm':
+        adjusted = holm(p_value)
+    elif correction is None:
+        adjusted = p_value
+    else:
+        raise ValueError(f"Unknown correction '{correction}'; expected 'holm' or None")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = successes / trials
+    labels = np.asarray(index, dtype=object)
+    pairs = pd.DataFrame({
+        'a': labels[a], 'b': labels[b], 'rate_a': rate[a], 'rate_b': rate[b],
+        'difference': difference, 'z': z, 'p_value': p_value, 'p_adjusted': adjusted,
+        'significant': adjusted < alpha,
+    })
+    return pairs.sort_values('p_adjusted', kind='stable').reset_index(drop=True)
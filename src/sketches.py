@@ -0,0 +1,405 @@
+# src/sketches.py
+#
+# Mergeable quantile sketches for response and acceptance times. A QuantileSketch counts
+# values in logarithmically sized buckets (the DDSketch scheme), so any quantile it returns
+# is within `relative_accuracy` of the true value, memory grows only with the log of the
+# value range, and sketches built on different chunks or groups add up exactly.
+
+import math
+
+import numpy as np
+import pandas as pd
+
+LATENCY_COLUMNS = ('response_time_hours', 'accept_time_hours')
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+# Magnitudes below this (about 4 ms when measuring hours) are counted as zero
+MIN_INDEXABLE = 1e-6
+
+# Counts of an empty store, shared: stores replace their counts array rather than write to it
+_NO_COUNTS = np.zeros(0, dtype=np.int64)
+_NO_COUNTS.flags.writeable = False
+
+
+class _Store:
+    """
+    Dense bucket counts for keys offset, offset + 1, ..., offset + len(counts) - 1.
+    """
+
+    def __init__(self, offset=0, counts=None):
+        self.offset = offset
+        self.counts = _NO_COUNTS if counts is None else counts
+
+    def add(self, keys, counts):
+        if not len(keys):
+            return
+        low = min(int(keys.min()), self.offset if len(self.counts) else int(keys.min()))
+        high = max(int(keys.max()), self.offset + len(self.counts) - 1)
+        grown = np.zeros(high - low + 1, dtype=np.int64)
+        grown[self.offset - low:self.offset - low + len(self.counts)] = self.counts
+        np.add.at(grown, keys - low, counts)
+        self.offset, self.counts = low, grown
+
+    def copy(self):
+        return _Store(self.offset, self.counts.copy())
+
+    @property
+    def keys(self):
+        return np.arange(self.offset, self.offset + len(self.counts))
+
+
+class QuantileSketch:
+    """
+    Relative-error quantile sketch over a stream of floats.
+
+    Parameters:
+        relative_accuracy (float, optional): Every quantile estimate x' of a true value x
+            satisfies |x' - x| <= relative_accuracy * |x|. Defaults to 0.01 (1%).
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative_accuracy must be between 0 and 1')
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = _Store()
+        self.negative = _Store()
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def key(self, magnitudes):
+        """
+        Bucket keys of positive magnitudes.
+        """
+        return np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+
+    def _value(self, keys):
+        """
+        Representative value of each bucket, within relative_accuracy of anything in it.
+        """
+        return 2 * np.power(self.gamma, keys.astype(float)) / (self.gamma + 1)
+
+    def add(self, values):
+        """
+        Adds an array of values; NaN values are ignored.
+
+        Returns:
+            QuantileSketch: self, to allow chaining.
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        for store, magnitudes in ((self.positive, values[values > MIN_INDEXABLE]),
+                                  (self.negative, -values[values < -MIN_INDEXABLE])):
+            if len(magnitudes):
+                keys, counts = np.unique(self.key(magnitudes), return_counts=True)
+                store.add(keys, counts)
+        self.zero_count += int((np.abs(values) <= MIN_INDEXABLE).sum())
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    @classmethod
+    def from_values(cls, values, relative_accuracy=0.01):
+        return cls(relative_accuracy).add(values)
+
+    def to_dict(self):
+        """
+        Returns the sketch state as plain JSON-serializable values.
+        """
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'positive': [self.positive.offset, self.positive.counts.tolist()],
+            'negative': [self.negative.offset, self.negative.counts.tolist()],
+            'zero_count': self.zero_count, 'count': self.count, 'sum': self.sum,
+            'min': self.min if self.count else None, 'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds a sketch from the output of to_dict.
+        """
+        sketch = cls(data['relative_accuracy'])
+        for name in ('positive', 'negative'):
+            offset, counts = data[name]
+            setattr(sketch, name, _Store(offset, np.asarray(counts, dtype=np.int64)))
+        sketch.zero_count, sketch.count, sketch.sum = data['zero_count'], data['count'], data['sum']
+        if data['count']:
+            sketch.min, sketch.max = data['min'], data['max']
+        return sketch
+
+    def copy(self):
+        sketch = QuantileSketch(self.relative_accuracy)
+        sketch.positive, sketch.negative = self.positive.copy(), self.negative.copy()
+        sketch.zero_count, sketch.count, sketch.sum = self.zero_count, self.count, self.sum
+        sketch.min, sketch.max = self.min, self.max
+        return sketch
+
+    def merge(self, other):
+        """
+        Combines two sketches with the same relative accuracy.
+
+        Returns:
+            QuantileSketch: A new sketch of both inputs' values.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracy')
+        merged = self.copy()
+        merged.positive.add(other.positive.keys, other.positive.counts)
+        merged.negative.add(other.negative.keys, other.negative.counts)
+        merged.zero_count += other.zero_count
+        merged.count += other.count
+        merged.sum += other.sum
+        merged.min = min(merged.min, other.min)
+        merged.max = max(merged.max, other.max)
+        return merged
+
+    __add__ = merge
+
+    def _buckets(self):
+        """
+        Bucket values in ascending order with their counts.
+        """
+        values = np.concatenate([
+            -self._value(self.negative.keys)[::-1],
+            [0.0],
+            self._value(self.positive.keys),
+        ])
+        counts = np.concatenate([self.negative.counts[::-1], [self.zero_count], self.positive.counts])
+        keep = counts > 0
+        return values[keep], counts[keep]
+
+    def quantile(self, q):
+        """
+        Estimates one or more quantiles.
+
+        Parameters:
+            q (float or array-like): Quantile(s) in [0, 1].
+
+        Returns:
+            float or np.ndarray: The estimates, NaN for an empty sketch. Estimates are clipped to
+            the exact minimum and maximum seen.
+        """
+        q = np.asarray(q, dtype=float)
+        if not self.count:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        values, counts = self._buckets()
+        ranks = q * (self.count - 1)
+        positions = np.searchsorted(np.cumsum(counts), ranks, side='right')
+        estimates = np.clip(values[np.minimum(positions, len(values) - 1)], self.min, self.max)
+        return estimates if q.ndim else float(estimates)
+
+    def cdf(self, x):
+        """
+        Estimated fraction of values <= x, at bucket resolution.
+        """
+        x = np.asarray(x, dtype=float)
+        if not self.count:
+            return np.full(x.shape, np.nan) if x.ndim else np.nan
+        values, counts = self._buckets()
+        cumulative = np.concatenate([[0], np.cumsum(counts)]) / self.count
+        fractions = cumulative[np.searchsorted(values, x, side='right')]
+        return fractions if x.ndim else float(fractions)
+
+    def cdf_points(self):
+        """
+        Returns:
+            tuple of np.ndarray: Ascending bucket values and the cumulative fraction of values
+            up to each, ready to draw as a CDF.
+        """
+        values, counts = self._buckets()
+        return values, np.cumsum(counts) / max(self.count, 1)
+
+    def between(self, lower, upper):
+        """
+        Sub-sketch of the buckets whose representative value lies in [lower, upper].
+
+        Used to trim outliers before plotting. Sum, min and max are approximated from the
+        kept buckets.
+        """
+        trimmed = QuantileSketch(self.relative_accuracy)
+        for store, sign in ((self.positive, 1), (self.negative, -1)):
+            keys = store.keys
+            values = sign * self._value(keys)
+            keep = (values >= lower) & (values <= upper) & (store.counts > 0)
+            getattr(trimmed, 'positive' if sign > 0 else 'negative').add(keys[keep], store.counts[keep])
+        if lower <= 0 <= upper:
+            trimmed.zero_count = self.zero_count
+        values, counts = trimmed._buckets()
+        trimmed.count = int(counts.sum())
+        if trimmed.count:
+            trimmed.sum = float((values * counts).sum())
+            trimmed.min, trimmed.max = float(values[0]), float(values[-1])
+        return trimmed
+
+
+def _group_stores(groups, keys, n_groups):
+    """
+    Fills one bucket store per group from the bucket `keys` of its values.
+
+    Returns:
+        dict: Group code -> _Store, for the groups with any keys.
+    """
+    stores = {}
+    if not len(keys):
+        return stores
+    low = int(keys.min())
+    width = int(keys.max()) - low + 1
+    cells = groups * width + (keys - low)
+    if n_groups * width <= len(keys):
+        # Few groups: a dense (group, key) table, counted without sorting
+        table = np.bincount(cells, minlength=n_groups * width).reshape(n_groups, width)
+        for group in np.flatnonzero(table.any(axis=1)):
+            used = np.flatnonzero(table[group])
+            stores[group] = _Store(low + int(used[0]), table[group, used[0]:used[-1] + 1].copy())
+        return stores
+    # Many groups: count the (group, key) pairs that occur, sorted by group then key
+    pairs, counts = np.unique(cells, return_counts=True)
+    pair_groups, pair_keys = np.divmod(pairs, width)
+    bounds = np.flatnonzero(np.diff(pair_groups)) + 1
+    for start, stop in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(pairs)]])):
+        group_keys = pair_keys[start:stop]
+        dense = np.zeros(int(group_keys[-1] - group_keys[0]) + 1, dtype=np.int64)
+        dense[group_keys - group_keys[0]] = counts[start:stop]
+        stores[pair_groups[start]] = _Store(int(group_keys[0]) + low, dense)
+    return stores
+
+
+def sketch_by(df, column, by=None, relative_accuracy=0.01):
+    """
+    Builds one sketch per group in a single vectorized pass.
+
+    The groups are factorized into integer codes as in cube.FunnelCube, every value is given
+    its bucket key at once, and the (group, key) pairs are counted together, so the Python
+    work is one loop over the groups to wrap their counts, never a pass over their rows.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned contacts frame or fact table.
+        column (str): Value column, e.g. 'response_time_hours'.
+        by (str or list of str, optional): Grouping column(s). If None, returns a single sketch.
+        relative_accuracy (float, optional): See QuantileSketch. Defaults to 0.01.
+
+    Returns:
+        QuantileSketch or dict: A sketch, or a dict of group label -> sketch (groups with
+        missing labels excluded, as in groupby; labels are tuples when `by` is a list).
+    """
+    if by is None:
+        return QuantileSketch.from_values(df[column], relative_accuracy)
+    columns = [by] if isinstance(by, str) else list(by)
+    codes, uniques = [], []
+    for name in columns:
+        column_codes, column_uniques = pd.factorize(df[name], sort=True)
+        codes.append(column_codes)
+        uniques.append(column_uniques)
+    shape = [len(column_uniques) for column_uniques in uniques]
+    labelled = np.logical_and.reduce([column_codes >= 0 for column_codes in codes])
+    if not labelled.all():
+        codes = [column_codes[labelled] for column_codes in codes]
+    cells = np.ravel_multi_index(codes, shape)
+    if np.prod(shape) <= len(cells):
+        # Few possible groups: number the observed ones without sorting the rows
+        observed = np.bincount(cells, minlength=int(np.prod(shape))) > 0
+        groups = cells if observed.all() else (np.cumsum(observed) - 1)[cells]
+        cells = np.flatnonzero(observed)
+    else:
+        cells, groups = np.unique(cells, return_inverse=True)
+    label_codes = np.unravel_index(cells, shape)
+    if isinstance(by, str):
+        labels = list(uniques[0].take(label_codes[0]))
+    else:
+        labels = list(zip(*(u.take(c) for u, c in zip(uniques, label_codes))))
+
+    n = len(labels)
+    sketches = [QuantileSketch(relative_accuracy) for _ in range(n)]
+    values = df[column].to_numpy(dtype=float, na_value=np.nan)
+    if not labelled.all():
+        values = values[labelled]
+    present = ~np.isnan(values)
+    values, groups = values[present], groups[present]
+
+    positive, negative = values > MIN_INDEXABLE, values < -MIN_INDEXABLE
+    counts = np.bincount(groups, minlength=n)
+    sums = np.bincount(groups, weights=values, minlength=n)
+    zeros = counts.copy()
+    lows, highs = np.full(n, np.inf), np.full(n, -np.inf)
+    np.minimum.at(lows, groups, values)
+    np.maximum.at(highs, groups, values)
+    keyer = QuantileSketch(relative_accuracy)
+    for name, mask, magnitudes in (('positive', positive, values), ('negative', negative, -values)):
+        signed_groups = groups[mask]
+        zeros -= np.bincount(signed_groups, minlength=n)
+        for i, store in _group_stores(signed_groups, keyer.key(magnitudes[mask]), n).items():
+            setattr(sketches[i], name, store)
+
+    for i, sketch in enumerate(sketches):
+        sketch.zero_count, sketch.count, sketch.sum = int(zeros[i]), int(counts[i]), float(sums[i])
+        if counts[i]:
+            sketch.min, sketch.max = float(lows[i]), float(highs[i])
+    return dict(zip(labels, sketches))
+
+
+def merge_sketches(left, right):
+    """
+    Merges two sketches, or two dicts of group label -> sketch, e.g. from consecutive chunks.
+    """
+    if isinstance(left, QuantileSketch):
+        return left.merge(right)
+    merged = dict(left)
+    for label, sketch in right.items():
+        merged[label] = merged[label].merge(sketch) if label in merged else sketch
+    return merged
+
+
+def quantile_table(sketches, quantiles=DEFAULT_QUANTILES, name=None):
+    """
+    Tabulates quantiles of a dict of per-group sketches.
+
+    Parameters:
+        sketches (dict): Group label -> QuantileSketch, as returned by sketch_by.
+        quantiles (iterable of float, optional): Quantiles to report. Defaults to p50/p90/p99.
+        name (str or list of str, optional): Index name(s) for the group labels.
+
+    Returns:
+        pd.DataFrame: One row per group with a 'count' column and one 'pNN' column per quantile.
+    """
+    labels = list(sketches)
+    columns = [f'p{round(q * 100):g}' for q in quantiles]
+    rows = [sketches[label].quantile(list(quantiles)) for label in labels]
+    if labels and isinstance(labels[0], tuple):
+        index = pd.MultiIndex.from_tuples(labels, names=name)
+    else:
+        index = pd.Index(labels, name=name)
+    table = pd.DataFrame(rows, index=index, columns=columns)
+    table.insert(0, 'count', [sketches[label].count for label in labels])
+    return table
+
+
+def latency_quantiles(df, by, columns=LATENCY_COLUMNS, quantiles=DEFAULT_QUANTILES, relative_accuracy=0.01):
+    """
+    p50/p90/p99 response and acceptance times per group.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned contacts frame, or a fact table for room type and neighborhood.
+        by (str or list of str): Grouping column(s), e.g. 'contact_channel_first'.
+        columns (iterable of str, optional): Duration columns. Defaults to LATENCY_COLUMNS.
+        quantiles (iterable of float, optional): Defaults to DEFAULT_QUANTILES.
+        relative_accuracy (float, optional): See QuantileSketch. Defaults to 0.01.
+
+    Returns:
+        pd.DataFrame: Quantile tables of each column side by side, under a column level
+        holding the column name.
+    """
+    tables = {
+        column: quantile_table(sketch_by(df, column, by, relative_accuracy), quantiles, name=by)
+        for column in columns
+    }
+    return pd.concat(tables, axis=1)
@@ -0,0 +1,258 @@
+# src/timeline.py
+#
+# Time-indexed funnel: contacts are bucketed by interaction date and every funnel count and
+# duration sum is accumulated into prefix-sum arrays over the sorted days, overall and per
+# dimension. The counts of any date range are then the difference of two rows found by
+# binary search, so a window costs O(log days) instead of a filter over every row, and a
+# rolling series over all days is one vectorized subtraction.
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import FUNNEL_STAGES, ContactAggregates
+
+# Lead time from the inquiry to the requested check-in date, in days: [0, 1), [1, 7), ...
+LEAD_TIME_BINS = [0, 1, 7, 14, 30, 90, np.inf]
+LEAD_TIME_LABELS = ['same_day', '1-6d', '7-13d', '14-29d', '30-89d', '90d+']
+
+TIMELINE_DIMENSIONS = (
+    'contact_channel_first', 'guest_user_stage_first', 'room_type', 'listing_neighborhood', 'lead_time',
+)
+
+# Per-day counters: one per funnel stage, then inquiries replied to and accepted (as in cube.MEASURES)
+COUNT_FIELDS = FUNNEL_STAGES + ['replies', 'acceptances']
+
+SUM_FIELDS = ('response_hours_sum', 'response_hours_count', 'accept_hours_sum', 'accept_hours_count')
+
+# Rate name -> counter divided by the number of inquiries
+RATES = {'booking_rate': 'booked', 'response_rate': 'replies', 'acceptance_rate': 'acceptances'}
+
+
+def lead_time_bucket(df):
+    """
+    Buckets the days between the inquiry and 'ds_checkin_first' into LEAD_TIME_LABELS.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned contacts frame or fact table with 'ts_interaction_first'
+            and 'ds_checkin_first' columns.
+
+    Returns:
+        pd.Series: Ordered categorical lead time buckets, NaN where either date is missing
+        or the check-in precedes the inquiry.
+    """
+    checkin = pd.to_datetime(df['ds_checkin_first'], errors='coerce')
+    days = (checkin - df['ts_interaction_first'].dt.normalize()).dt.days
+    return pd.cut(days, LEAD_TIME_BINS, right=False, labels=LEAD_TIME_LABELS).rename('lead_time')
+
+
+def _cumulative(per_day):
+    """
+    Prefix sums along the first axis, with a leading row of zeros.
+    """
+    cumulative = np.zeros((per_day.shape[0] + 1,) + per_day.shape[1:], dtype=per_day.dtype)
+    np.cumsum(per_day, axis=0, out=cumulative[1:])
+    return cumulative
+
+
+def _ratio(numerator, denominator):
+    """
+    Element-wise division, NaN where the denominator is zero.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+
+class FunnelTimeline:
+    """
+    Prefix sums of funnel counts over the days on which inquiries were made.
+
+    Windows are resolved to whole days and are half-open: window('2016-03-07', '2016-03-14')
+    covers inquiries made from March 7 up to and including March 13.
+
+    Attributes:
+        days (pd.DatetimeIndex): Sorted days with at least one inquiry.
+        counts (np.ndarray): int64 prefix sums of COUNT_FIELDS, shape (len(days) + 1, len(COUNT_FIELDS)).
+        sums (np.ndarray): float64 prefix sums of SUM_FIELDS, shape (len(days) + 1, len(SUM_FIELDS)).
+        dimensions (dict of str -> (pd.Index, np.ndarray)): Labels of each dimension and int64
+            prefix sums of COUNT_FIELDS per label, shape (len(days) + 1, len(labels), len(COUNT_FIELDS)).
+    """
+
+    def __init__(self, days, counts, sums, dimensions):
+        self.days = days
+        self.counts = counts
+        self.sums = sums
+        self.dimensions = dimensions
+
+    @classmethod
+    def from_frame(cls, df, dimensions=TIMELINE_DIMENSIONS):
+        """
+        Builds the timeline in one pass over a cleaned contacts frame or fact table.
+
+        Parameters:
+            df (pd.DataFrame): Output of clean_contacts or enrich.build_fact_table. Rows without
+                an interaction timestamp cannot be placed in time and are left out.
+            dimensions (iterable of str, optional): Columns to keep per-label prefix sums for.
+                'lead_time' is derived from 'ds_checkin_first' (see lead_time_bucket); other
+                columns missing from `df` are skipped. Defaults to TIMELINE_DIMENSIONS.
+
+        Returns:
+            FunnelTimeline: The timeline of `df`.
+        """
+        df = df[df['ts_interaction_first'].notna()]
+        day_codes, days = pd.factorize(df['ts_interaction_first'].dt.normalize(), sort=True)
+        days = pd.DatetimeIndex(days, name='day')
+        n_days = len(days)
+
+        stage_codes = pd.Categorical(df['funnel_stage'], categories=FUNNEL_STAGES).codes
+        flags = [df['ts_reply_at_first'].notna().to_numpy(), df['ts_accepted_at_first'].notna().to_numpy()]
+
+        def per_day(cells, n_cells):
+            # Counts of every COUNT_FIELDS entry per cell, shape (n_cells, len(COUNT_FIELDS))
+            stages = np.bincount(cells * len(FUNNEL_STAGES) + stage_codes, minlength=n_cells * len(FUNNEL_STAGES))
+            columns = [stages.reshape(n_cells, len(FUNNEL_STAGES))]
+            columns += [np.bincount(cells[flag], minlength=n_cells)[:, None] for flag in flags]
+            return np.hstack(columns).astype(np.int64)
+
+        response = df['response_time_hours'].to_numpy(dtype=float, na_value=np.nan)
+        accept = df['accept_time_hours'].to_numpy(dtype=float, na_value=np.nan)
+        sums = np.column_stack([
+            np.bincount(day_codes, weights=weights, minlength=n_days)
+            for weights in (np.nan_to_num(response), ~np.isnan(response), np.nan_to_num(accept), ~np.isnan(accept))
+        ])
+
+        columns = {d: df[d] for d in dimensions if d in df.columns}
+        if 'lead_time' in dimensions and 'lead_time' not in columns and 'ds_checkin_first' in df.columns:
+            columns['lead_time'] = lead_time_bucket(df)
+
+        tables = {}
+        for dimension, values in columns.items():
+            codes, uniques = pd.factorize(values, sort=True)
+            labels = pd.Index(np.asarray(uniques, dtype=object), name=dimension)
+            # Rows with a missing label go to a trailing slot that is dropped afterwards
+            codes[codes < 0] = len(labels)
+            counts = per_day(day_codes * (len(labels) + 1) + codes, n_days * (len(labels) + 1))
+            counts = counts.reshape(n_days, len(labels) + 1, len(COUNT_FIELDS))[:, :-1]
+            tables[dimension] = (labels, _cumulative(counts))
+
+        return cls(days, _cumulative(per_day(day_codes, n_days)), _cumulative(sums), tables)
+
+    def _bounds(self, start=None, end=None):
+        """
+        Prefix-sum rows delimiting the days in [start, end).
+        """
+        low = 0 if start is None else self.days.searchsorted(pd.Timestamp(start).normalize(), side='left')
+        high = len(self.days) if end is None else self.days.searchsorted(pd.Timestamp(end).normalize(), side='left')
+        return low, max(low, high)
+
+    def window(self, start=None, end=None):
+        """
+        Aggregates of the inquiries made in [start, end), for any function in metrics.py or
+        funnel_analysis.py.
+
+        Parameters:
+            start (str or datetime-like, optional): First day included. Defaults to the first day.
+            end (str or datetime-like, optional): First day excluded. Defaults to after the last day.
+
+        Returns:
+            ContactAggregates: Totals, stage counts and one tally per dimension of the window.
+        """
+        low, high = self._bounds(start, end)
+        counts = dict(zip(COUNT_FIELDS, (self.counts[high] - self.counts[low]).tolist()))
+        sums = dict(zip(SUM_FIELDS, (self.sums[high] - self.sums[low]).tolist()))
+        totals = {
+            'rows': sum(counts[stage] for stage in FUNNEL_STAGES),
+            'booked': counts['booked'],
+            'replied': counts['replies'],
+            'accepted': counts['acceptances'],
+            'response_hours_sum': sums['response_hours_sum'],
+            'response_hours_count': int(round(sums['response_hours_count'])),
+            'accept_hours_sum': sums['accept_hours_sum'],
+            'accept_hours_count': int(round(sums['accept_hours_count'])),
+        }
+        stages = pd.Series([counts[stage] for stage in FUNNEL_STAGES],
+                           index=pd.Index(FUNNEL_STAGES, name='funnel_stage'), dtype='int64')
+        tallies = {}
+        for dimension, (labels, cumulative) in self.dimensions.items():
+            tally = pd.DataFrame(cumulative[high, :, :len(FUNNEL_STAGES)] - cumulative[low, :, :len(FUNNEL_STAGES)],
+                                 index=labels, columns=pd.Index(FUNNEL_STAGES, name='funnel_stage'))
+            tallies[dimension] = tally[tally.sum(axis=1) > 0]
+        return ContactAggregates(totals, stages, tallies)
+
+    def _rates(self, low, high, by, rate):
+        """
+        Rates of the windows [low[k], high[k]) of prefix-sum rows, overall or per label of `by`.
+        """
+        if rate not in RATES:
+            raise ValueError(f"Unknown rate '{rate}'; expected one of {sorted(RATES)}")
+        if by is None:
+            cumulative, labels = self.counts, None
+        elif by in self.dimensions:
+            labels, cumulative = self.dimensions[by]
+        else:
+            raise KeyError(f"No prefix sums for '{by}'; timeline was built with {sorted(self.dimensions)}")
+        window = cumulative[high] - cumulative[low]
+        rows = window[..., :len(FUNNEL_STAGES)].sum(axis=-1)
+        return _ratio(window[..., COUNT_FIELDS.index(RATES[rate])], rows), labels
+
+    def rate(self, rate='booking_rate', start=None, end=None, by=None):
+        """
+        One rate over [start, end), in O(log days).
+
+        Parameters:
+            rate (str, optional): 'booking_rate', 'response_rate' or 'acceptance_rate'.
+                Defaults to 'booking_rate'.
+            start, end (str or datetime-like, optional): Window bounds, as in window().
+            by (str, optional): A timeline dimension to break the rate down by.
+
+        Returns:
+            float or pd.Series: The rate (NaN for an empty window), or one rate per label of `by`.
+        """
+        low, high = self._bounds(start, end)
+        values, labels = self._rates(low, high, by, rate)
+        if by is None:
+            return float(values)
+        return pd.Series(values, index=labels, name=rate)
+
+    def rolling(self, days=28, rate='booking_rate', by=None):
+        """
+        Rate over the trailing `days` calendar days ending on each day with inquiries.
+
+        Parameters:
+            days (int, optional): Window length in days, including the end day. Defaults to 28.
+            rate (str, optional): See rate(). Defaults to 'booking_rate'.
+            by (str, optional): A timeline dimension to break the rate down by.
+
+        Returns:
+            pd.Series or pd.DataFrame: Rates indexed by window end day, with one column per
+            label of `by` if given.
+        """
+        high = np.arange(1, len(self.days) + 1)
+        low = self.days.searchsorted(self.days - pd.Timedelta(days=days - 1), side='left')
+        values, labels = self._rates(low, high, by, rate)
+        if by is None:
+            return pd.Series(values, index=self.days, name=rate)
+        return pd.DataFrame(values, index=self.days, columns=labels)
+
+    def periodic(self, freq='W', rate='booking_rate', by=None):
+        """
+        Rate per calendar period, e.g. per week.
+
+        Parameters:
+            freq (str, optional): A pandas period frequency such as 'W', 'W-SUN' or 'M'. Defaults to 'W'.
+            rate (str, optional): See rate(). Defaults to 'booking_rate'.
+            by (str, optional): A timeline dimension to break the rate down by.
+
+        Returns:
+            pd.Series or pd.DataFrame: Rates indexed by period, with one column per label of
+            `by` if given.
+        """
+        if not len(self.days):
+            periods = pd.PeriodIndex([], freq=freq)
+        else:
+            periods = pd.period_range(self.days[0], self.days[-1], freq=freq)
+        low = self.days.searchsorted(periods.start_time, side='left')
+        high = self.days.searchsorted((periods + 1).start_time, side='left')
+        values, labels = self._rates(low, high, by, rate)
+        if by is None:
+            return pd.Series(values, index=periods, name=rate)
+        return pd.DataFrame(values, index=periods, columns=labels)
@@ -0,0 +1,189 @@
+# src/validation.py
+#
+# Data-quality rules for malformed exports, checked by the cleaners while they run rather than
+# in extra passes: clean_contacts, clean_listings and clean_users take a Validator and test
+# each rule on the columns they are already parsing or deriving (the raw and parsed
+# timestamps, the response hours, the labels, the id column). A rule reduces to one boolean
+# row mask, from which the Validator keeps a running count and the first few row ids, so it
+# accumulates over the chunks of a streamed file just as over one frame.
+#
+# Modes: 'report' only records; 'quarantine' also removes the flagged rows from the cleaned
+# frame and keeps them aside (quarantine()); 'fail' raises ValidationError at the end of the
+# first frame with a violation. Without a Validator the cleaners do none of this work.
+#
+# Usage:
+#     python -m src.validation [--data-dir data] [--mode report] [--chunksize 500000]
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from src.clean_data import clean_contacts, clean_listings, clean_users
+from src.load_data import iter_contacts, load_listings, load_users
+
+# Known labels; anything else is reported, not remapped
+CONTACT_CHANNELS = ('contact_me', 'book_it', 'instant_book')
+USER_STAGES = ('new', 'past_booker', '-unknown-')
+
+# Rule name -> (dataset, description). Violations count rows, not cells.
+RULES = {
+    'unparseable_timestamp': ('contacts', 'Timestamp present but unparseable, coerced to NaT'),
+    'reply_before_interaction': ('contacts', 'Reply timestamped before the first interaction'),
+    'accept_before_interaction': ('contacts', 'Acceptance timestamped before the first interaction'),
+    'unknown_contact_channel': ('contacts', 'contact_channel_first not in CONTACT_CHANNELS'),
+    'unknown_user_stage': ('contacts', 'guest_user_stage_first not in USER_STAGES'),
+    'duplicate_listing_id': ('listings', 'Repeated id_listing_anon (every occurrence after the first)'),
+    'duplicate_user_id': ('users', 'Repeated id_user_anon (every occurrence after the first)'),
+}
+
+# Label rule -> the labels it accepts
+LABELS = {
+    'unknown_contact_channel': CONTACT_CHANNELS,
+    'unknown_user_stage': USER_STAGES,
+}
+
+MODES = ('report', 'quarantine', 'fail')
+
+
+class ValidationError(ValueError):
+    """
+    Raised by a Validator in 'fail' mode; `validator` holds the counts and sample ids.
+    """
+
+    def __init__(self, validator, dataset):
+        self.validator = validator
+        self.dataset = dataset
+        found = ', '.join(f'{rule}: {count:,}' for rule, count in validator.violations.items())
+        super().__init__(f'Invalid {dataset} rows ({found})')
+
+
+class Validator:
+    """
+    Collects rule violations from the cleaners it is passed to.
+
+    Parameters:
+        mode (str, optional): 'report', 'quarantine' or 'fail'. Defaults to 'report'.
+        samples (int, optional): Row ids kept per rule. Defaults to 5.
+    """
+
+    def __init__(self, mode='report', samples=5):
+        if mode not in MODES:
+            raise ValueError(f"Unknown validation mode '{mode}'; expected one of {MODES}")
+        self.mode = mode
+        self.samples = samples
+        self.rows = {}
+        self.violations = {}
+        self.sample_ids = {}
+        self.quarantined = {}
+        self._flagged = {}
+
+    @property
+    def ok(self):
+        return not self.violations
+
+    def check(self, rule, mask, ids):
+        """
+        Records the rows of one frame that break `rule`.
+
+        Parameters:
+            rule (str): A key of RULES.
+            mask (np.ndarray): Boolean mask of the violating rows.
+            ids (pd.Index or pd.Series): Row ids aligned with `mask`, e.g. the frame index
+                (the line number in the file for load_data frames) or an id column.
+        """
+        positions = np.flatnonzero(mask)
+        if not len(positions):
+            return
+        dataset = RULES[rule][0]
+        self.violations[rule] = self.violations.get(rule, 0) + len(positions)
+        kept = self.sample_ids.setdefault(rule, [])
+        if len(kept) < self.samples:
+            kept.extend(ids.take(positions[:self.samples - len(kept)]).tolist())
+        if self.mode != 'report':
+            flagged = self._flagged.get(dataset)
+            self._flagged[dataset] = mask if flagged is None else flagged | mask
+
+    def check_labels(self, rule, series, ids):
+        """
+        Records the non-missing values of `series` outside the LABELS of `rule`.
+        """
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            self.check(rule, (series.notna() & ~series.isin(LABELS[rule])).to_numpy(), ids)
+            return
+        # Categoricals (as load_data reads the labels): only the categories need checking,
+        # and the row codes are read only if one of them is unknown
+        unknown = ~series.cat.categories.isin(LABELS[rule])
+        if unknown.any():
+            # Missing values have code -1, which picks the trailing False
+            self.check(rule, np.append(unknown, False)[series.cat.codes.to_numpy()], ids)
+
+    def finish(self, dataset, df):
+        """
+        Ends the checks of one frame of `dataset`, applying the mode to the rows flagged in it.
+
+        Returns:
+            pd.DataFrame: `df`, without the flagged rows in 'quarantine' mode.
+
+        Raises:
+            ValidationError: In 'fail' mode, if any row was flagged.
+        """
+        self.rows[dataset] = self.rows.get(dataset, 0) + len(df)
+        flagged = self._flagged.pop(dataset, None)
+        if flagged is None:
+            return df
+        if self.mode == 'fail':
+            raise ValidationError(self, dataset)
+        self.quarantined.setdefault(dataset, []).append(df[flagged])
+        return df[~flagged]
+
+    def quarantine(self, dataset):
+        """
+        The cleaned rows of `dataset` removed in 'quarantine' mode, in the order they were seen.
+        """
+        frames = self.quarantined.get(dataset, [])
+        return pd.concat(frames) if frames else pd.DataFrame()
+
+    def report(self):
+        """
+        Returns:
+            pd.DataFrame: One row per rule of the datasets checked so far, indexed by rule,
+            with 'dataset', 'rows' checked, 'violations', their 'share' of the rows and up to
+            `samples` 'sample_ids'.
+        """
+        records = [
+            {
+                'rule': rule, 'dataset': dataset, 'rows': self.rows[dataset],
+                'violations': self.violations.get(rule, 0), 'sample_ids': self.sample_ids.get(rule, []),
+            }
+            for rule, (dataset, _) in RULES.items() if dataset in self.rows
+        ]
+        report = pd.DataFrame(records, columns=['rule', 'dataset', 'rows', 'violations', 'sample_ids'])
+        report.insert(4, 'share', report['violations'] / report['rows'].where(report['rows'] > 0))
+        return report.set_index('rule')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the contacts, listings and users exports for malformed rows.')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--mode', choices=MODES, default='report')
+    parser.add_argument('--chunksize', type=int, default=500_000, help='Contacts rows cleaned at a time.')
+    args = parser.parse_args(argv)
+
+    validator = Validator(args.mode)
+    try:
+        for chunk in iter_contacts(os.path.join(args.data_dir, 'contacts.csv'), chunksize=args.chunksize):
+            clean_contacts(chunk, copy=False, lean=True, validation=validator)
+        clean_listings(load_listings(os.path.join(args.data_dir, 'listings.csv')), copy=False, validation=validator)
+        clean_users(load_users(os.path.join(args.data_dir, 'users.csv')), copy=False, validation=validator)
+    except ValidationError as error:
+        print(error)
+        return 1
+    print(validator.report().to_string())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# tests/test_backend.py
+"""
+Parity of the DuckDB backend with the pandas path, on the bundled listings and users and a
+contacts file generated with their ids (contacts.csv is not bundled), and of every join path
+on listings with repeated ids.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import DATA_DIR, make_contacts
+from src import funnel_analysis, metrics
+from src.aggregates import ContactAggregates
+from src.clean_data import clean_contacts, clean_listings, clean_users
+from src.cube import FunnelCube
+from src.enrich import build_fact_table
+from src.load_data import load_contacts, load_listings, load_users
+
+pytest.importorskip('duckdb')
+
+N_CONTACTS = 20_000
+
+
+@pytest.fixture(scope='module')
+def data(tmp_path_factory):
+    listings = clean_listings(load_listings(os.path.join(DATA_DIR, 'listings.csv')))
+    users = clean_users(load_users(os.path.join(DATA_DIR, 'users.csv')))
+    path = tmp_path_factory.mktemp('data') / 'contacts.csv'
+    make_contacts(N_CONTACTS, seed=0, listing_ids=listings['id_listing_anon'],
+                  guest_ids=users['id_user_anon']).to_csv(path, index=False)
+    contacts = clean_contacts(load_contacts(path))
+    return {'path': str(path), 'contacts': contacts, 'listings': listings, 'users': users}
+
+
+def assert_same(expected, result, exact=True):
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(expected, result, check_exact=exact)
+    elif isinstance(expected, pd.Series):
+        pd.testing.assert_series_equal(expected, result, check_exact=exact)
+    else:
+        assert result == (expected if exact else pytest.approx(expected))
+
+
+# (function, needs listings, exact): rates are ratios of the same integer counts on both
+# paths; mean hours are float sums taken in a different order
+CASES = [
+    (metrics.booking_rate, False, True),
+    (metrics.response_rate, False, True),
+    (metrics.acceptance_rate, False, True),
+    (metrics.avg_response_time, False, False),
+    (metrics.avg_accept_time, False, False),
+    (metrics.conversion_by_contact_channel, False, True),
+    (metrics.conversion_by_user_stage, False, True),
+    (funnel_analysis.get_funnel_stage_distribution, False, True),
+    (funnel_analysis.funnel_by_contact_channel, False, True),
+    (funnel_analysis.funnel_by_guest_user_stage, False, True),
+    (funnel_analysis.funnel_by_room_type, True, True),
+    (funnel_analysis.funnel_by_neighborhood, True, True),
+]
+
+
+@pytest.mark.parametrize('func, needs_listings, exact', CASES, ids=[case[0].__name__ for case in CASES])
+@pytest.mark.parametrize('source', ['file', 'frame'])
+def test_duckdb_matches_pandas(data, func, needs_listings, exact, source):
+    args = (data['listings'],) if needs_listings else ()
+    expected = func(data['contacts'], *args, backend='pandas')
+    contacts = data['path'] if source == 'file' else data['contacts']
+    assert_same(expected, func(contacts, *args, backend='duckdb'), exact)
+
+
+def test_duckdb_fact_table_matches_pandas(data):
+    fact = build_fact_table(data['contacts'], data['listings'], data['users'])
+    for func in (funnel_analysis.funnel_by_room_type, funnel_analysis.funnel_by_neighborhood):
+        assert_same(func(fact, backend='pandas'), func(fact, backend='duckdb'))
+
+
+def test_repeated_listing_ids_join_first_row(data):
+    listings = data['listings']
+    # Every listing repeated with another room type and neighborhood after its first row
+    repeated = listings.assign(room_type=listings['room_type'].array[::-1],
+                               listing_neighborhood=listings['listing_neighborhood'].array[::-1])
+    doubled = pd.concat([listings, repeated], ignore_index=True)
+    for func in (funnel_analysis.funnel_by_room_type, funnel_analysis.funnel_by_neighborhood):
+        expected = func(data['contacts'], listings, backend='pandas')
+        assert_same(expected, func(data['contacts'], doubled, backend='pandas'))
+        assert_same(expected, func(build_fact_table(data['contacts'], doubled), backend='pandas'))
+        assert_same(expected, func(ContactAggregates.from_frame(data['contacts']), doubled))
+        assert_same(expected, func(data['path'], doubled, backend='duckdb'))
+
+
+def test_cube_without_listing_axis_names_it(data):
+    cube = FunnelCube.from_frame(data['contacts'], dimensions=['contact_channel_first'])
+    for func in (funnel_analysis.funnel_by_room_type, funnel_analysis.funnel_by_neighborhood):
+        with pytest.raises(ValueError, match='id_listing_anon'):
+            func(cube, data['listings'])
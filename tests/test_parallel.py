@@ -0,0 +1,18 @@
+# tests/test_parallel.py
+"""
+The process-pool paths of src/parallel.py on empty input, which has no partitions to merge.
+"""
+import pandas as pd
+
+from benchmarks.synthetic import make_contacts
+from src.clean_data import clean_contacts
+from src.cube import FunnelCube
+from src.parallel import parallel_aggregate, parallel_clean_contacts, parallel_contact_aggregates
+
+
+def test_empty_input():
+    raw = make_contacts(100, seed=0).iloc[:0]
+    pd.testing.assert_frame_equal(parallel_clean_contacts(raw, workers=2), clean_contacts(raw))
+    assert parallel_contact_aggregates(raw, workers=2).totals['rows'] == 0
+    cube = parallel_aggregate(clean_contacts(raw), FunnelCube.from_frame, workers=2, cleaned=True)
+    assert isinstance(cube, FunnelCube) and cube.counts.sum() == 0
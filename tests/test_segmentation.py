@@ -0,0 +1,54 @@
+# tests/test_segmentation.py
+"""
+Feature builders of src/segmentation.py on contacts with missing guest, listing and host ids.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import DATA_DIR, make_contacts
+from src.clean_data import clean_contacts, clean_listings, clean_users
+from src.load_data import load_listings, load_users
+from src.segmentation import guest_features, listing_features
+
+
+@pytest.fixture(scope='module')
+def data():
+    listings = clean_listings(load_listings(os.path.join(DATA_DIR, 'listings.csv')))
+    users = clean_users(load_users(os.path.join(DATA_DIR, 'users.csv')))
+    contacts = clean_contacts(make_contacts(2_000, seed=0, listing_ids=listings['id_listing_anon'],
+                                            guest_ids=users['id_user_anon']))
+    return {'contacts': contacts, 'listings': listings, 'users': users}
+
+
+def with_missing(contacts, columns, rows=6):
+    extra = contacts.head(rows).copy()
+    extra[columns] = None
+    return pd.concat([contacts, extra], ignore_index=True)
+
+
+def test_guest_features_ignore_missing_guest_ids(data):
+    expected = guest_features(data['contacts'], data['users'])
+    users = data['users']
+    # Users rows without an id, with profiles that must not land on another guest
+    users = pd.concat([users, users.head(2).assign(id_user_anon=None, words_in_user_profile=999)], ignore_index=True)
+    result = guest_features(with_missing(data['contacts'], ['id_guest_anon']), users)
+    pd.testing.assert_frame_equal(expected, result)
+
+
+def test_listing_features_ignore_missing_listing_and_host_ids(data):
+    expected = listing_features(data['contacts'], data['listings'])
+    missing = with_missing(data['contacts'], ['id_listing_anon', 'id_host_anon'])
+    pd.testing.assert_frame_equal(expected, listing_features(missing, data['listings']))
+
+
+def test_listing_without_host_gets_no_host_features(data):
+    contacts = data['contacts']
+    # A listing whose only inquiry has no host id
+    orphan = contacts.head(1).assign(id_listing_anon='listing-without-host', id_host_anon=None)
+    features = listing_features(pd.concat([contacts, orphan], ignore_index=True), data['listings'])
+    row = features.loc['listing-without-host']
+    assert row['inquiries'] == np.float32(np.log1p(1))
+    assert (row[['host_reply_share', 'host_response_hours', 'host_accept_share']] == 0).all()
@@ -0,0 +1,68 @@
+# tests/test_service.py
+"""
+Error responses of the HTTP query service (src/service.py).
+"""
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+from benchmarks.synthetic import DATA_DIR, make_contacts
+from src import service as service_module
+from src.clean_data import clean_contacts, clean_listings
+from src.load_data import load_listings
+from src.service import QueryService, make_server
+
+
+@pytest.fixture(scope='module')
+def port():
+    listings = clean_listings(load_listings(os.path.join(DATA_DIR, 'listings.csv')))
+    contacts = clean_contacts(make_contacts(2_000, seed=0, listing_ids=listings['id_listing_anon']))
+    server = make_server(QueryService(contacts, listings), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def get(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    connection.close()
+    return response.status, body
+
+
+def test_date_filters(port):
+    status, body = get(port, '/booking_rate?start=2016-01-01&end=2016-07-01')
+    assert status == 200
+    assert body['filters'] == {'start': '2016-01-01T00:00:00', 'end': '2016-07-01T00:00:00'}
+
+
+def test_timezone_aware_date_is_rejected(port):
+    status, body = get(port, '/booking_rate?start=2016-01-01T00:00%2B02:00')
+    assert status == 400
+    assert 'timezone' in body['error']
+
+
+def test_unknown_query_is_not_found(port):
+    assert get(port, '/no_such_query')[0] == 404
+
+
+def test_key_error_inside_a_query_is_a_server_error(port, monkeypatch):
+    def broken(fact):
+        raise KeyError('missing column')
+    monkeypatch.setitem(service_module.QUERIES, 'broken', (broken, {}))
+    status, body = get(port, '/broken')
+    assert status == 500
+    assert 'broken' in body['error']
+
+
+def test_integer_columns_stay_integers(port):
+    status, body = get(port, '/funnel_by_neighborhood?min_inquiries=1')
+    assert status == 200
+    counts = [row['count'] for row in body['result'].values()]
+    assert counts and all(isinstance(count, int) for count in counts)